@@ -25,7 +25,7 @@ class DashboardView(View):
             # Recruiting Cogの募集ウィザードを呼び出す
             recruiting_cog = self.bot.get_cog("Recruiting")
             if recruiting_cog:
-                config = await recruiting_cog.get_guild_rank_config(interaction.guild.id)
+                config = recruiting_cog.get_guild_rank_config(interaction.guild.id)
                 from cogs.recruiting import RecruitmentWizard
                 view = RecruitmentWizard(interaction.user.id, config)
                 await interaction.response.send_message(embed=view.get_embed(), view=view, ephemeral=True)
@@ -138,9 +138,15 @@ class StatsMenuView(View):
         val = select.values[0]
         stats_cog = self.bot.get_cog("Statistics")
         if not stats_cog: return
+
+        # 全体サマリーは /stats overview と同じ集計結果をそのまま表示する
+        if val == "overview":
+            await interaction.response.defer(ephemeral=True)
+            embed = await stats_cog.build_overview_embed(interaction.guild)
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
         
-        # 本来はContextを作成してコマンドを呼び出すのが筋だが、
-        # ここでは簡易メッセージで案内する（複雑さを避けるため）
+        # それ以外は簡易メッセージで案内する（複雑さを避けるため）
         cmd_map = {
             "overview": "/stats overview",
             "messages": "/stats messages",
@@ -1,9 +1,17 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import option
-import os
-from datetime import datetime, timezone
-from typing import Optional
+from discord.ui import View
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from utils.audit_log import audit_log
+from utils.event_bus import VOICE_STATE, VoiceStateEvent, event_bus
+from utils.log_dispatcher import log_dispatcher
+from utils.log_routes import DEFAULT_CATEGORY, log_routes
+from utils.message_cache import CachedMessage, MessageCache
+from utils.raid_detector import RaidDetector, RaidSummary
+from utils.rollups import parse_date
+from utils.stats_buffer import stats_buffer
 
 class LogColor:
     """ログ用のカラーパレット"""
@@ -26,25 +34,120 @@ class LogCategory:
     RECRUIT = "recruit"         # 募集関連
     MODERATION = "moderation"   # モデレーション
 
+# 監査ログのイベント名（/log search の表示用）
+AUDIT_EVENT_LABELS = {
+    "member_join": "📥 参加",
+    "member_leave": "📤 退出",
+    "vc_join": "🔊 VC参加",
+    "vc_leave": "🔇 VC退出",
+    "vc_move": "🔀 VC移動",
+    "message_deleted": "🗑️ 削除",
+    "message_bulk_deleted": "🧹 一括削除",
+    "message_edited": "✏️ 編集",
+    "role_changed": "🏷️ ロール変更",
+    "recruit_created": "📣 募集作成",
+    "recruit_joined": "✅ 募集参加",
+    "recruit_closed": "🔒 募集終了",
+}
+
+# 設定コマンドで選べるカテゴリ
+LOG_CATEGORY_CHOICES = [
+    discord.OptionChoice("👥 メンバー", LogCategory.MEMBER),
+    discord.OptionChoice("🔊 VC", LogCategory.VOICE),
+    discord.OptionChoice("💬 メッセージ", LogCategory.MESSAGE),
+    discord.OptionChoice("🏷️ ロール", LogCategory.ROLE),
+    discord.OptionChoice("📣 募集", LogCategory.RECRUIT),
+]
+
+class AuditSearchView(View):
+    """/log search の結果のページ送り（id をカーソルにして前後へ移動）"""
+
+    def __init__(self, guild_id: int, filters: dict, description: str):
+        super().__init__(timeout=300)
+        self.guild_id = guild_id
+        self.filters = filters
+        self.description = description
+        # 各ページ先頭のカーソル（1ページ目は None）
+        self.cursors: List[Optional[int]] = [None]
+        self.next_cursor: Optional[int] = None
+
+    async def render(self) -> discord.Embed:
+        rows, self.next_cursor = await audit_log.search(
+            self.guild_id, before_id=self.cursors[-1], **self.filters
+        )
+
+        lines = []
+        for _, created_at, _, event_type, user_id, channel_id, content in rows:
+            head = f"<t:{created_at}:f> **{AUDIT_EVENT_LABELS.get(event_type, event_type)}**"
+            if user_id:
+                head += f" <@{user_id}>"
+            if channel_id:
+                head += f" <#{channel_id}>"
+            snippet = content.replace("\n", " ").replace("`", "'")[:150]
+            lines.append(f"{head}\n> {snippet}" if snippet else head)
+
+        embed = discord.Embed(
+            title="🔎 監査ログ検索",
+            description="\n".join(lines) if lines else "該当するログはありません",
+            color=LogColor.INFO
+        )
+        embed.add_field(name="条件", value=self.description, inline=False)
+        embed.set_footer(text=f"ページ {len(self.cursors)} / 検索 {audit_log.last_search_ms:.1f}ms")
+
+        self.previous_page.disabled = len(self.cursors) <= 1
+        self.next_page.disabled = self.next_cursor is None
+        return embed
+
+    @discord.ui.button(label="前へ", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous_page(self, button: discord.ui.Button, interaction: discord.Interaction):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+    @discord.ui.button(label="次へ", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page(self, button: discord.ui.Button, interaction: discord.Interaction):
+        if self.next_cursor is not None:
+            self.cursors.append(self.next_cursor)
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
 class Logger(commands.Cog):
     """📋 高度なログ機能"""
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.log_channel_id = int(os.getenv("LOG_CHANNEL_ID", 0))
-        # メッセージキャッシュ（削除ログ用）
-        self.message_cache = {}
-        self.max_cache_size = 1000
-        
-    def get_log_channel(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
-        """ログチャンネルを取得（テキストチャンネルのみ）"""
-        if self.log_channel_id:
-            channel = guild.get_channel(self.log_channel_id)
-            # テキストチャンネルかどうかをチェック
-            if isinstance(channel, discord.TextChannel):
-                return channel
-            elif channel is not None:
-                print(f"⚠️ LOG_CHANNEL_ID ({self.log_channel_id}) はテキストチャンネルではありません。タイプ: {type(channel).__name__}")
+        # メッセージキャッシュ（削除・編集ログ用、サーバーごと・全体のメモリ予算つきLRU）
+        self.message_cache = MessageCache()
+        # 参加・退出の急増検知（急増中は1件ずつではなく要約を出す）
+        self.raid_detector = RaidDetector()
+        self.raid_summary_task.start()
+        # VCの出入りはイベントバス経由で受け取る（ゲートウェイの処理を止めない）
+        event_bus.subscribe(VOICE_STATE, "logger", self._on_voice_state)
+
+    def cog_unload(self):
+        self.raid_summary_task.cancel()
+        event_bus.unsubscribe_nowait("logger")
+        
+    def get_log_channel(
+        self,
+        guild: discord.Guild,
+        category: str,
+        source_channel_id: Optional[int] = None
+    ) -> Optional[discord.TextChannel]:
+        """
+        カテゴリのログチャンネルを取得（テキストチャンネルのみ）。
+        カテゴリが無効・イベントのチャンネルが除外されている場合は None
+        """
+        if source_channel_id is not None and log_routes.is_ignored(guild.id, source_channel_id):
+            return None
+        channel_id = log_routes.resolve(guild.id, category)
+        if not channel_id:
+            return None
+        channel = guild.get_channel(channel_id)
+        # テキストチャンネルかどうかをチェック
+        if isinstance(channel, discord.TextChannel):
+            return channel
+        elif channel is not None:
+            print(f"⚠️ ログチャンネル ({channel_id}) はテキストチャンネルではありません。タイプ: {type(channel).__name__}")
         return None
     
     def create_base_embed(
@@ -81,32 +184,28 @@ class Logger(commands.Cog):
         """メッセージをキャッシュに追加"""
         if message.author.bot:
             return
-            
-        # キャッシュサイズ制限
-        if len(self.message_cache) >= self.max_cache_size:
-            # 最も古いメッセージを削除
-            oldest_id = min(self.message_cache.keys())
-            del self.message_cache[oldest_id]
-        
-        self.message_cache[message.id] = {
-            "content": message.content,
-            "author": message.author,
-            "channel": message.channel,
-            "created_at": message.created_at,
-            "attachments": [a.filename for a in message.attachments]
-        }
+        self.message_cache.add(message)
     
     # ==================== メンバーイベント ====================
     
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
         """メンバー参加時のログ"""
-        log_channel = self.get_log_channel(member.guild)
-        if not log_channel:
-            return
-        
         # アカウント年齢の計算
         account_age = (datetime.now(timezone.utc) - member.created_at.replace(tzinfo=timezone.utc)).days
+
+        # 急増中は要約にまとめ、統計もサーバー全体の件数だけ記録
+        # （統計と監査ログはログの設定に関係なく記録し、ログの送信先はEmbedを送るかどうかだけを決める）
+        raiding = self.raid_detector.observe(member.guild.id, "join", member.id, str(member), account_age)
+        self._record_stat(member.guild.id, "member_join", user_id=None if raiding else member.id)
+        audit_log.record(member.guild.id, LogCategory.MEMBER, "member_join", user_id=member.id, content=f"{member} (アカウント作成から{account_age}日)")
+
+        if raiding:
+            return
+        log_channel = self.get_log_channel(member.guild, LogCategory.MEMBER)
+        if not log_channel:
+            return
+
         age_warning = "⚠️ **新規アカウント!**" if account_age < 7 else ""
         
         embed = self.create_base_embed(
@@ -144,15 +243,20 @@ class Logger(commands.Cog):
         if member.avatar:
             embed.set_thumbnail(url=member.avatar.url)
         
-        await log_channel.send(embed=embed)
-        
-        # 統計データを記録
-        await self._record_stat(member.guild.id, "member_join", user_id=member.id)
+        log_dispatcher.enqueue(log_channel, embed)
     
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
         """メンバー退出時のログ"""
-        log_channel = self.get_log_channel(member.guild)
+        # 急増中は要約にまとめ、統計もサーバー全体の件数だけ記録
+        account_age = (datetime.now(timezone.utc) - member.created_at.replace(tzinfo=timezone.utc)).days
+        raiding = self.raid_detector.observe(member.guild.id, "leave", member.id, str(member), account_age)
+        self._record_stat(member.guild.id, "member_leave", user_id=None if raiding else member.id)
+        audit_log.record(member.guild.id, LogCategory.MEMBER, "member_leave", user_id=member.id, content=str(member))
+
+        if raiding:
+            return
+        log_channel = self.get_log_channel(member.guild, LogCategory.MEMBER)
         if not log_channel:
             return
         
@@ -207,50 +311,124 @@ class Logger(commands.Cog):
         if member.avatar:
             embed.set_thumbnail(url=member.avatar.url)
         
-        await log_channel.send(embed=embed)
-        
-        # 統計データを記録
-        await self._record_stat(member.guild.id, "member_leave", user_id=member.id)
+        log_dispatcher.enqueue(log_channel, embed)
+
+    @tasks.loop(seconds=5)
+    async def raid_summary_task(self):
+        """急増中の参加・退出の要約を送る"""
+        for summary in self.raid_detector.drain():
+            guild = self.bot.get_guild(summary.guild_id)
+            if guild is None:
+                continue
+            log_channel = self.get_log_channel(guild, LogCategory.MEMBER)
+            if log_channel:
+                log_dispatcher.enqueue(log_channel, self._build_raid_summary_embed(summary))
+
+    @raid_summary_task.before_loop
+    async def before_raid_summary(self):
+        await self.bot.wait_until_ready()
+
+    def _build_raid_summary_embed(self, summary: RaidSummary) -> discord.Embed:
+        label = "参加" if summary.kind == "join" else "退出"
+        if summary.first:
+            title = f"🚨 メンバーの{label}が急増しています"
+            color = LogColor.ERROR
+        elif summary.ended:
+            title = f"✅ メンバーの{label}の急増が収まりました"
+            color = LogColor.SUCCESS
+        else:
+            title = f"🚨 メンバーの{label}が続いています"
+            color = LogColor.ERROR
+
+        lines = []
+        length = 0
+        shown = 0
+        for entry in summary.entries:
+            line = f"{'🆕 ' if entry.is_new_account else ''}<@{entry.user_id}> `{entry.name}` ({entry.account_age}日)"
+            if length + len(line) + 1 > 3500:
+                break
+            lines.append(line)
+            length += len(line) + 1
+            shown += 1
+        hidden = len(summary.entries) - shown + summary.omitted
+        if hidden:
+            lines.append(f"…ほか {hidden}人")
+
+        embed = self.create_base_embed(
+            title=title,
+            description="\n".join(lines) or f"この間の{label}はありません",
+            color=color,
+            category=LogCategory.MEMBER
+        )
+        embed.add_field(
+            name="📊 状況",
+            value=f"```\n"
+                  f"今回の{label}: {len(summary.entries) + summary.omitted}人 (新規アカウント {summary.new_accounts}人)\n"
+                  f"直近{self.raid_detector.window:.0f}秒: {summary.rate}件\n"
+                  f"開始から合計: {summary.total}人\n"
+                  f"```",
+            inline=False
+        )
+        embed.add_field(
+            name="⏱️ 開始",
+            value=f"<t:{int(summary.started_at)}:T>",
+            inline=True
+        )
+        return embed
     
     # ==================== VCイベント ====================
     
-    @commands.Cog.listener()
-    async def on_voice_state_update(
-        self,
-        member: discord.Member,
-        before: discord.VoiceState,
-        after: discord.VoiceState
-    ):
-        """VC状態変更時のログ"""
-        log_channel = self.get_log_channel(member.guild)
+    async def _on_voice_state(self, event: VoiceStateEvent):
+        """VC状態変更時のログ（イベントバスの購読者。チャンネルが変わった更新だけが届く）"""
+        member, before_channel, after_channel = event.member, event.before, event.after
+        # 統計と監査ログはログの設定（カテゴリの無効化・除外チャンネル）に関係なく記録する
+        if before_channel is None and after_channel is not None:
+            self._record_stat(member.guild.id, "vc_join", user_id=member.id)
+            audit_log.record(member.guild.id, LogCategory.VOICE, "vc_join", member.id, after_channel.id, after_channel.name)
+        elif before_channel is not None and after_channel is None:
+            self._record_stat(member.guild.id, "vc_leave", user_id=member.id)
+            audit_log.record(member.guild.id, LogCategory.VOICE, "vc_leave", member.id, before_channel.id, before_channel.name)
+        elif before_channel is not None and after_channel is not None and before_channel != after_channel:
+            audit_log.record(
+                member.guild.id, LogCategory.VOICE, "vc_move", member.id, after_channel.id,
+                f"{before_channel.name} → {after_channel.name}"
+            )
+
+        # 除外チャンネルへの出入り・除外チャンネル同士の移動はログに出さない
+        if all(
+            log_routes.is_ignored(member.guild.id, channel.id)
+            for channel in (before_channel, after_channel) if channel is not None
+        ):
+            return
+        log_channel = self.get_log_channel(member.guild, LogCategory.VOICE)
         if not log_channel:
             return
         
         # VC参加
-        if before.channel is None and after.channel is not None:
+        if before_channel is None and after_channel is not None:
             embed = self.create_base_embed(
                 title="🔊 VCに参加",
-                description=f"{member.mention} が **{after.channel.name}** に参加しました",
+                description=f"{member.mention} が **{after_channel.name}** に参加しました",
                 color=LogColor.SUCCESS,
                 category=LogCategory.VOICE
             )
             
             # チャンネル情報
-            member_count = len(after.channel.members)
-            limit_text = f"/{after.channel.user_limit}" if after.channel.user_limit > 0 else ""
+            member_count = len(after_channel.members)
+            limit_text = f"/{after_channel.user_limit}" if after_channel.user_limit > 0 else ""
             embed.add_field(
                 name="📊 チャンネル情報",
                 value=f"```\n"
-                      f"チャンネル: {after.channel.name}\n"
+                      f"チャンネル: {after_channel.name}\n"
                       f"現在の人数: {member_count}{limit_text}人\n"
                       f"```",
                 inline=False
             )
             
             # メンバーリスト
-            members_list = ", ".join([m.display_name for m in after.channel.members[:5]])
-            if len(after.channel.members) > 5:
-                members_list += f" 他{len(after.channel.members) - 5}人"
+            members_list = ", ".join([m.display_name for m in after_channel.members[:5]])
+            if len(after_channel.members) > 5:
+                members_list += f" 他{len(after_channel.members) - 5}人"
             embed.add_field(
                 name="👥 参加中メンバー",
                 value=members_list,
@@ -260,23 +438,22 @@ class Logger(commands.Cog):
             if member.avatar:
                 embed.set_thumbnail(url=member.avatar.url)
             
-            await log_channel.send(embed=embed)
-            await self._record_stat(member.guild.id, "vc_join", user_id=member.id)
+            log_dispatcher.enqueue(log_channel, embed)
         
         # VC退出
-        elif before.channel is not None and after.channel is None:
+        elif before_channel is not None and after_channel is None:
             embed = self.create_base_embed(
                 title="🔇 VCから退出",
-                description=f"{member.mention} が **{before.channel.name}** から退出しました",
+                description=f"{member.mention} が **{before_channel.name}** から退出しました",
                 color=LogColor.ERROR,
                 category=LogCategory.VOICE
             )
             
-            member_count = len(before.channel.members)
+            member_count = len(before_channel.members)
             embed.add_field(
                 name="📊 チャンネル情報",
                 value=f"```\n"
-                      f"チャンネル: {before.channel.name}\n"
+                      f"チャンネル: {before_channel.name}\n"
                       f"残り人数: {member_count}人\n"
                       f"```",
                 inline=False
@@ -285,11 +462,10 @@ class Logger(commands.Cog):
             if member.avatar:
                 embed.set_thumbnail(url=member.avatar.url)
             
-            await log_channel.send(embed=embed)
-            await self._record_stat(member.guild.id, "vc_leave", user_id=member.id)
+            log_dispatcher.enqueue(log_channel, embed)
         
         # VC移動
-        elif before.channel is not None and after.channel is not None and before.channel != after.channel:
+        elif before_channel is not None and after_channel is not None and before_channel != after_channel:
             embed = self.create_base_embed(
                 title="🔀 VCを移動",
                 description=f"{member.mention} がVCを移動しました",
@@ -299,20 +475,20 @@ class Logger(commands.Cog):
             
             embed.add_field(
                 name="🔸 移動元",
-                value=f"**{before.channel.name}**\n残り: {len(before.channel.members)}人",
+                value=f"**{before_channel.name}**\n残り: {len(before_channel.members)}人",
                 inline=True
             )
             
             embed.add_field(
                 name="🔹 移動先",
-                value=f"**{after.channel.name}**\n現在: {len(after.channel.members)}人",
+                value=f"**{after_channel.name}**\n現在: {len(after_channel.members)}人",
                 inline=True
             )
             
             if member.avatar:
                 embed.set_thumbnail(url=member.avatar.url)
             
-            await log_channel.send(embed=embed)
+            log_dispatcher.enqueue(log_channel, embed)
     
     # ==================== メッセージイベント ====================
     
@@ -320,142 +496,288 @@ class Logger(commands.Cog):
     async def on_message(self, message: discord.Message):
         """メッセージをキャッシュに追加"""
         if message.guild and not message.author.bot:
-            self.cache_message(message)
-            await self._record_stat(message.guild.id, "message_sent", user_id=message.author.id)
+            # 削除・編集ログを取らないチャンネルのメッセージはキャッシュしない
+            guild_id = message.guild.id
+            if log_routes.resolve(guild_id, LogCategory.MESSAGE) and not log_routes.is_ignored(guild_id, message.channel.id):
+                self.cache_message(message)
+            self._record_stat(guild_id, "message_sent", user_id=message.author.id)
     
+    @staticmethod
+    def _audit_content(record: CachedMessage) -> str:
+        if record.attachments:
+            return f"{record.content}\n📎 {', '.join(record.attachments)}".strip()
+        return record.content
+
+    def _resolve_deleted(self, message_id: int, cached: Optional[discord.Message]) -> Optional[CachedMessage]:
+        """削除されたメッセージの控えを自前キャッシュ → py-cordのキャッシュの順に探す"""
+        record = self.message_cache.pop(message_id)
+        if record is None and cached is not None and cached.guild and not cached.author.bot:
+            record = CachedMessage.from_message(cached)
+        return record
+
     @commands.Cog.listener()
-    async def on_message_delete(self, message: discord.Message):
-        """メッセージ削除時のログ"""
-        if not message.guild or message.author.bot:
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """メッセージ削除時のログ（py-cordのキャッシュ外のメッセージも対象）"""
+        if not payload.guild_id:
             return
-            
-        log_channel = self.get_log_channel(message.guild)
-        if not log_channel:
+        guild = self.bot.get_guild(payload.guild_id)
+        if not guild:
             return
-        
+
+        record = self._resolve_deleted(payload.message_id, payload.cached_message)
+        # キャッシュにないBotのメッセージは判別できないので、py-cord側で分かる場合だけ除外
+        if record is None and payload.cached_message is not None:
+            return
+
+        # 統計と監査ログはログの設定に関係なく記録する（一括削除と同じ）
+        self._record_stat(guild.id, "message_deleted", user_id=record.author_id if record else None)
+        if record is None:
+            audit_log.record(guild.id, LogCategory.MESSAGE, "message_deleted", channel_id=payload.channel_id)
+        else:
+            audit_log.record(
+                guild.id, LogCategory.MESSAGE, "message_deleted", record.author_id, record.channel_id,
+                self._audit_content(record)
+            )
+
+        log_channel = self.get_log_channel(guild, LogCategory.MESSAGE, payload.channel_id)
         # 同じログチャンネルのメッセージは記録しない
-        if message.channel.id == log_channel.id:
+        if not log_channel or payload.channel_id == log_channel.id:
             return
         
         embed = self.create_base_embed(
             title="🗑️ メッセージが削除されました",
-            description=f"{message.channel.mention} でメッセージが削除されました",
+            description=f"<#{payload.channel_id}> でメッセージが削除されました",
             color=LogColor.ERROR,
             category=LogCategory.MESSAGE
         )
         
+        if record is None:
+            embed.add_field(
+                name="💬 削除されたメッセージ",
+                value=f"*（キャッシュ外のため内容不明）*\nメッセージID: {payload.message_id}",
+                inline=False
+            )
+            log_dispatcher.enqueue(log_channel, embed)
+            return
+        
+        author = guild.get_member(record.author_id)
         embed.add_field(
             name="👤 送信者",
-            value=f"{message.author.mention}\n({message.author})",
+            value=f"<@{record.author_id}>\n({author or record.author_id})",
             inline=True
         )
         
         embed.add_field(
             name="📍 チャンネル",
-            value=f"{message.channel.mention}",
+            value=f"<#{record.channel_id}>",
             inline=True
         )
         
         # メッセージ内容（1024文字まで）
-        content = message.content if message.content else "*（テキストなし）*"
+        content = record.content if record.content else "*（テキストなし）*"
         if len(content) > 1000:
             content = content[:1000] + "..."
         
         embed.add_field(
             name="💬 削除されたメッセージ",
-            value=f"```\n{content}\n```" if message.content else content,
+            value=f"```\n{content}\n```" if record.content else content,
             inline=False
         )
         
         # 添付ファイル
-        if message.attachments:
-            attachment_names = ", ".join([a.filename for a in message.attachments])
+        if record.attachments:
             embed.add_field(
                 name="📎 添付ファイル",
-                value=attachment_names[:500],
+                value=", ".join(record.attachments)[:500],
                 inline=False
             )
         
-        if message.author.avatar:
-            embed.set_thumbnail(url=message.author.avatar.url)
+        if author and author.avatar:
+            embed.set_thumbnail(url=author.avatar.url)
+        
+        log_dispatcher.enqueue(log_channel, embed)
+    
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        """一括削除（/clear など）は1件のまとめログにする"""
+        if not payload.guild_id:
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        if not guild:
+            return
+
+        cached = {m.id: m for m in payload.cached_messages}
+        records = []
+        unknown = 0
+        for message_id in sorted(payload.message_ids):
+            record = self._resolve_deleted(message_id, cached.get(message_id))
+            if record is not None:
+                records.append(record)
+            elif message_id not in cached:
+                unknown += 1
+
+        # 統計は送信者が分かる分はユーザー別にも記録
+        per_author = {}
+        for record in records:
+            per_author[record.author_id] = per_author.get(record.author_id, 0) + 1
+        for author_id, count in per_author.items():
+            self._record_stat(guild.id, "message_deleted", count, user_id=author_id)
+        if unknown:
+            self._record_stat(guild.id, "message_deleted", unknown)
+
+        # 監査ログには内容が分かる分を1件ずつ残す（送信者・本文で検索できるように）
+        for record in records:
+            audit_log.record(
+                guild.id, LogCategory.MESSAGE, "message_bulk_deleted", record.author_id, record.channel_id,
+                self._audit_content(record)
+            )
+
+        log_channel = self.get_log_channel(guild, LogCategory.MESSAGE, payload.channel_id)
+        if not log_channel or payload.channel_id == log_channel.id:
+            return
+
+        total = len(payload.message_ids)
+        embed = self.create_base_embed(
+            title="🧹 メッセージが一括削除されました",
+            description=f"<#{payload.channel_id}> で **{total}件** のメッセージが削除されました",
+            color=LogColor.ERROR,
+            category=LogCategory.MESSAGE
+        )
+        
+        if per_author:
+            top_authors = sorted(per_author.items(), key=lambda kv: kv[1], reverse=True)[:10]
+            embed.add_field(
+                name="👤 送信者別",
+                value="\n".join(f"<@{author_id}>: {count}件" for author_id, count in top_authors),
+                inline=True
+            )
+        
+        embed.add_field(
+            name="📊 内訳",
+            value=f"```\n"
+                  f"内容を記録済み: {len(records)}件\n"
+                  f"内容不明: {unknown}件\n"
+                  f"```",
+            inline=True
+        )
+        
+        # 新しいものから数件だけ抜粋
+        lines = []
+        length = 0
+        for record in reversed(records):
+            snippet = (record.content or "（テキストなし）").replace("\n", " ")[:80]
+            line = f"<@{record.author_id}>: {snippet}"
+            if length + len(line) + 1 > 1000:
+                break
+            lines.append(line)
+            length += len(line) + 1
+        if lines:
+            embed.add_field(name="💬 削除された内容（抜粋）", value="\n".join(lines), inline=False)
         
-        await log_channel.send(embed=embed)
-        await self._record_stat(message.guild.id, "message_deleted", user_id=message.author.id)
+        log_dispatcher.enqueue(log_channel, embed)
     
     @commands.Cog.listener()
-    async def on_message_edit(self, before: discord.Message, after: discord.Message):
-        """メッセージ編集時のログ"""
-        if not after.guild or after.author.bot:
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        """メッセージ編集時のログ（py-cordのキャッシュ外のメッセージも対象）"""
+        data = payload.data
+        if not payload.guild_id or "content" not in data:
             return
+        if data.get("author", {}).get("bot"):
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        if not guild:
+            return
+
+        after_content = data.get("content") or ""
+        edited_at = data.get("edited_timestamp")
+        edited_ts = discord.utils.parse_time(edited_at).timestamp() if edited_at else None
+
+        previous = self.message_cache.update_content(payload.message_id, after_content, edited_ts)
+        if previous is not None:
+            before_content = previous.content
+        elif payload.cached_message is not None:
+            before_content = payload.cached_message.content
+        else:
+            before_content = None
         
         # 内容が変わっていない場合はスキップ（埋め込みの追加など）
-        if before.content == after.content:
+        if before_content == after_content:
             return
-            
-        log_channel = self.get_log_channel(after.guild)
-        if not log_channel:
+        # 編集前が分からず編集時刻もない更新はリンクプレビューの展開なので無視
+        if before_content is None and not edited_at:
             return
         
+        author_id = int(data["author"]["id"]) if "author" in data else (previous.author_id if previous else None)
+        # 統計と監査ログはログの設定に関係なく記録する
+        if author_id:
+            self._record_stat(guild.id, "message_edited", user_id=author_id)
+        audit_log.record(
+            guild.id, LogCategory.MESSAGE, "message_edited", author_id, payload.channel_id,
+            f"{before_content or ''}\n→\n{after_content}"
+        )
+
+        log_channel = self.get_log_channel(guild, LogCategory.MESSAGE, payload.channel_id)
         # ログチャンネル自体の編集は記録しない
-        if after.channel.id == log_channel.id:
+        if not log_channel or payload.channel_id == log_channel.id:
             return
         
+        author = guild.get_member(author_id) if author_id else None
+        jump_url = f"https://discord.com/channels/{payload.guild_id}/{payload.channel_id}/{payload.message_id}"
+        
         embed = self.create_base_embed(
             title="✏️ メッセージが編集されました",
-            description=f"{after.channel.mention} でメッセージが編集されました\n[メッセージへジャンプ]({after.jump_url})",
+            description=f"<#{payload.channel_id}> でメッセージが編集されました\n[メッセージへジャンプ]({jump_url})",
             color=LogColor.MESSAGE,
             category=LogCategory.MESSAGE
         )
         
         embed.add_field(
             name="👤 送信者",
-            value=f"{after.author.mention}\n({after.author})",
+            value=f"<@{author_id}>\n({author or author_id})" if author_id else "不明",
             inline=True
         )
         
         embed.add_field(
             name="📍 チャンネル",
-            value=f"{after.channel.mention}",
+            value=f"<#{payload.channel_id}>",
             inline=True
         )
         
         # 編集前の内容
-        before_content = before.content if before.content else "*（テキストなし）*"
-        if len(before_content) > 500:
-            before_content = before_content[:500] + "..."
+        if before_content is None:
+            before_text = "*（キャッシュ外のため内容不明）*"
+        else:
+            before_text = before_content if before_content else "*（テキストなし）*"
+            if len(before_text) > 500:
+                before_text = before_text[:500] + "..."
         
         embed.add_field(
             name="📝 編集前",
-            value=f"```\n{before_content}\n```" if before.content else before_content,
+            value=f"```\n{before_text}\n```" if before_content else before_text,
             inline=False
         )
         
         # 編集後の内容
-        after_content = after.content if after.content else "*（テキストなし）*"
-        if len(after_content) > 500:
-            after_content = after_content[:500] + "..."
+        after_text = after_content if after_content else "*（テキストなし）*"
+        if len(after_text) > 500:
+            after_text = after_text[:500] + "..."
         
         embed.add_field(
             name="📝 編集後",
-            value=f"```\n{after_content}\n```" if after.content else after_content,
+            value=f"```\n{after_text}\n```" if after_content else after_text,
             inline=False
         )
         
-        if after.author.avatar:
-            embed.set_thumbnail(url=after.author.avatar.url)
+        if author and author.avatar:
+            embed.set_thumbnail(url=author.avatar.url)
         
-        await log_channel.send(embed=embed)
-        await self._record_stat(after.guild.id, "message_edited", user_id=after.author.id)
+        log_dispatcher.enqueue(log_channel, embed)
     
     # ==================== ロールイベント ====================
     
     @commands.Cog.listener()
     async def on_member_update(self, before: discord.Member, after: discord.Member):
         """メンバー更新時のログ（ロール変更など）"""
-        log_channel = self.get_log_channel(after.guild)
-        if not log_channel:
-            return
-        
         # ロール変更をチェック
         before_roles = set(before.roles)
         after_roles = set(after.roles)
@@ -463,6 +785,21 @@ class Logger(commands.Cog):
         added_roles = after_roles - before_roles
         removed_roles = before_roles - after_roles
         
+        # 統計と監査ログはログの設定に関係なく記録する
+        if added_roles:
+            self._record_stat(after.guild.id, "role_added", len(added_roles), user_id=after.id)
+        if removed_roles:
+            self._record_stat(after.guild.id, "role_removed", len(removed_roles), user_id=after.id)
+        if added_roles or removed_roles:
+            audit_log.record(
+                after.guild.id, LogCategory.ROLE, "role_changed", user_id=after.id,
+                content=" ".join([f"+{r.name}" for r in added_roles] + [f"-{r.name}" for r in removed_roles])
+            )
+        
+        log_channel = self.get_log_channel(after.guild, LogCategory.ROLE)
+        if not log_channel:
+            return
+        
         if added_roles or removed_roles:
             embed = self.create_base_embed(
                 title="🏷️ ロールが変更されました",
@@ -496,12 +833,7 @@ class Logger(commands.Cog):
             if after.avatar:
                 embed.set_thumbnail(url=after.avatar.url)
             
-            await log_channel.send(embed=embed)
-            
-            if added_roles:
-                await self._record_stat(after.guild.id, "role_added", len(added_roles), user_id=after.id)
-            if removed_roles:
-                await self._record_stat(after.guild.id, "role_removed", len(removed_roles), user_id=after.id)
+            log_dispatcher.enqueue(log_channel, embed)
     
     # ==================== 募集ログ用のヘルパーメソッド ====================
     
@@ -514,7 +846,9 @@ class Logger(commands.Cog):
         rank_range: str
     ):
         """募集作成ログを記録"""
-        log_channel = self.get_log_channel(guild)
+        self._record_stat(guild.id, "recruit_created", user_id=author.id)
+        audit_log.record(guild.id, LogCategory.RECRUIT, "recruit_created", user_id=author.id, content=f"{mode} {max_members}人 {rank_range}")
+        log_channel = self.get_log_channel(guild, LogCategory.RECRUIT)
         if not log_channel:
             return
         
@@ -532,8 +866,7 @@ class Logger(commands.Cog):
         if author.avatar:
             embed.set_thumbnail(url=author.avatar.url)
         
-        await log_channel.send(embed=embed)
-        await self._record_stat(guild.id, "recruit_created", user_id=author.id)
+        log_dispatcher.enqueue(log_channel, embed)
     
     async def log_recruitment_joined(
         self, 
@@ -542,7 +875,9 @@ class Logger(commands.Cog):
         recruitment_author: discord.Member
     ):
         """募集参加ログを記録"""
-        log_channel = self.get_log_channel(guild)
+        self._record_stat(guild.id, "recruit_joined", user_id=member.id)
+        audit_log.record(guild.id, LogCategory.RECRUIT, "recruit_joined", user_id=member.id, content=f"{recruitment_author} の募集")
+        log_channel = self.get_log_channel(guild, LogCategory.RECRUIT)
         if not log_channel:
             return
         
@@ -556,8 +891,7 @@ class Logger(commands.Cog):
         if member.avatar:
             embed.set_thumbnail(url=member.avatar.url)
         
-        await log_channel.send(embed=embed)
-        await self._record_stat(guild.id, "recruit_joined", user_id=member.id)
+        log_dispatcher.enqueue(log_channel, embed)
     
     async def log_recruitment_closed(
         self, 
@@ -566,7 +900,9 @@ class Logger(commands.Cog):
         participant_count: int
     ):
         """募集終了ログを記録"""
-        log_channel = self.get_log_channel(guild)
+        self._record_stat(guild.id, "recruit_closed", user_id=author.id)
+        audit_log.record(guild.id, LogCategory.RECRUIT, "recruit_closed", user_id=author.id, content=f"{participant_count}人")
+        log_channel = self.get_log_channel(guild, LogCategory.RECRUIT)
         if not log_channel:
             return
         
@@ -586,73 +922,178 @@ class Logger(commands.Cog):
         if author.avatar:
             embed.set_thumbnail(url=author.avatar.url)
         
-        await log_channel.send(embed=embed)
-        await self._record_stat(guild.id, "recruit_closed", user_id=author.id)
+        log_dispatcher.enqueue(log_channel, embed)
     
-    # ==================== 統計データ記録 ====================
-    
-    async def _record_stat(self, guild_id: int, event_type: str, count: int = 1, user_id: Optional[int] = None):
-        """統計データをデータベースに記録"""
-        from utils.db_manager import db
-        
-        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        
+    # ==================== 監査ログ検索 ====================
+
+    log_group = discord.SlashCommandGroup(
+        name="log",
+        description="📋 ログを検索します",
+        default_member_permissions=discord.Permissions(administrator=True)
+    )
+
+    @log_group.command(name="search", description="🔎 記録済みのログを検索")
+    @option("query", description="本文に含まれる語句", required=False)
+    @option("user", description="対象のユーザー", required=False)
+    @option("channel", description="対象のチャンネル", required=False)
+    @option("category", description="ログの種類", required=False, choices=LOG_CATEGORY_CHOICES)
+    @option("since", description="この日以降 (YYYY-MM-DD, UTC)", required=False)
+    @option("until", description="この日まで (YYYY-MM-DD, UTC)", required=False)
+    async def log_search(
+        self,
+        ctx: discord.ApplicationContext,
+        query: str = None,
+        user: discord.User = None,
+        channel: discord.abc.GuildChannel = None,
+        category: str = None,
+        since: str = None,
+        until: str = None
+    ):
+        """監査ログを新しい順に検索"""
         try:
-            # サーバー全体の統計
-            existing = await db.fetchrow(
-                """
-                SELECT count FROM statistics 
-                WHERE guild_id = ? AND event_type = ? AND date = ?
-                """,
-                (guild_id, event_type, today)
-            )
-            
-            if existing:
-                await db.execute(
-                    """
-                    UPDATE statistics SET count = count + ? 
-                    WHERE guild_id = ? AND event_type = ? AND date = ?
-                    """,
-                    (count, guild_id, event_type, today)
-                )
+            since_ts = int(datetime.combine(parse_date(since), datetime.min.time(), timezone.utc).timestamp()) if since else None
+            # until はその日の終わりまで含める
+            until_ts = int(datetime.combine(parse_date(until) + timedelta(days=1), datetime.min.time(), timezone.utc).timestamp()) if until else None
+        except ValueError:
+            await ctx.respond("❌ 日付は YYYY-MM-DD 形式で指定してください", ephemeral=True)
+            return
+
+        await ctx.defer(ephemeral=True)
+
+        # 書き込み待ちの分も検索に含める
+        await audit_log.flush()
+
+        conditions = []
+        if query:
+            conditions.append(f"語句: {query}")
+        if user:
+            conditions.append(f"ユーザー: {user.mention}")
+        if channel:
+            conditions.append(f"チャンネル: {channel.mention}")
+        if category:
+            conditions.append(f"種類: {category}")
+        if since or until:
+            conditions.append(f"期間: {since or '…'} 〜 {until or '…'}")
+
+        view = AuditSearchView(
+            ctx.guild.id,
+            {
+                "text": query,
+                "user_id": user.id if user else None,
+                "channel_id": channel.id if channel else None,
+                "category": category,
+                "since": since_ts,
+                "until": until_ts,
+            },
+            "\n".join(conditions) or "なし（すべて）"
+        )
+        await ctx.respond(embed=await view.render(), view=view, ephemeral=True)
+
+    # ==================== ログの送信先設定 ====================
+
+    @log_group.command(name="channel", description="📍 ログの送信先チャンネルを設定")
+    @option("channel", description="送信先（省略すると設定を外す）", required=False)
+    @option("category", description="ログの種類（省略するとすべての種類の既定の送信先）", required=False, choices=LOG_CATEGORY_CHOICES)
+    async def log_channel(
+        self,
+        ctx: discord.ApplicationContext,
+        channel: discord.TextChannel = None,
+        category: str = None
+    ):
+        """カテゴリごと（または既定）の送信先を設定"""
+        await log_routes.set_channel(ctx.guild.id, category or DEFAULT_CATEGORY, channel.id if channel else None)
+        target = f"**{category}**" if category else "すべての種類（既定）"
+        if channel:
+            await ctx.respond(f"✅ {target} のログを {channel.mention} に送信します", ephemeral=True)
+        else:
+            await ctx.respond(f"✅ {target} の送信先の設定を外しました", ephemeral=True)
+
+    @log_group.command(name="toggle", description="🔀 ログの種類ごとに記録のオン/オフを切り替え")
+    @option("category", description="ログの種類", choices=LOG_CATEGORY_CHOICES)
+    @option("enabled", description="記録する場合は True")
+    async def log_toggle(self, ctx: discord.ApplicationContext, category: str, enabled: bool):
+        """カテゴリを有効化/無効化"""
+        await log_routes.set_enabled(ctx.guild.id, category, enabled)
+        await ctx.respond(f"✅ **{category}** のログを{'有効' if enabled else '無効'}にしました", ephemeral=True)
+
+    @log_group.command(name="ignore", description="🙈 チャンネルのイベントをログに記録しない")
+    @option("channel", description="対象のチャンネル")
+    @option("ignored", description="記録を再開する場合は False", required=False, default=True)
+    async def log_ignore(self, ctx: discord.ApplicationContext, channel: discord.abc.GuildChannel, ignored: bool = True):
+        """チャンネルをログ対象から除外/除外解除"""
+        await log_routes.set_ignored(ctx.guild.id, channel.id, ignored)
+        if ignored:
+            await ctx.respond(f"✅ {channel.mention} のイベントはログに記録しません", ephemeral=True)
+        else:
+            await ctx.respond(f"✅ {channel.mention} のイベントの記録を再開しました", ephemeral=True)
+
+    @log_group.command(name="settings", description="⚙️ ログの送信先設定を表示")
+    async def log_settings(self, ctx: discord.ApplicationContext):
+        """現在のログ設定を表示"""
+        routes = log_routes.get(ctx.guild.id)
+
+        lines = []
+        for choice in LOG_CATEGORY_CHOICES:
+            channel_id = log_routes.resolve(ctx.guild.id, choice.value)
+            if choice.value in routes.disabled:
+                status = "🚫 無効"
+            elif channel_id:
+                status = f"<#{channel_id}>"
             else:
-                await db.execute(
-                    """
-                    INSERT INTO statistics (guild_id, event_type, date, count)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (guild_id, event_type, today, count)
-                )
-            
-            # ユーザー個別の統計
-            if user_id:
-                existing_user = await db.fetchrow(
-                    """
-                    SELECT count FROM user_statistics 
-                    WHERE guild_id = ? AND user_id = ? AND event_type = ? AND date = ?
-                    """,
-                    (guild_id, user_id, event_type, today)
-                )
-                
-                if existing_user:
-                    await db.execute(
-                        """
-                        UPDATE user_statistics SET count = count + ? 
-                        WHERE guild_id = ? AND user_id = ? AND event_type = ? AND date = ?
-                        """,
-                        (count, guild_id, user_id, event_type, today)
-                    )
-                else:
-                    await db.execute(
-                        """
-                        INSERT INTO user_statistics (guild_id, user_id, event_type, date, count)
-                        VALUES (?, ?, ?, ?, ?)
-                        """,
-                        (guild_id, user_id, event_type, today, count)
-                    )
-                
-        except Exception as e:
-            print(f"統計記録エラー: {e}")
+                status = "⚠️ 送信先なし"
+            lines.append(f"{choice.name}: {status}")
+
+        embed = discord.Embed(
+            title="⚙️ ログ設定",
+            description="\n".join(lines),
+            color=LogColor.INFO
+        )
+        default_channel = routes.channels.get(DEFAULT_CATEGORY) or log_routes.fallback_channel_id
+        embed.add_field(
+            name="📍 既定の送信先",
+            value=f"<#{default_channel}>" if default_channel else "なし",
+            inline=True
+        )
+        embed.add_field(
+            name="🙈 除外チャンネル",
+            value=" ".join(f"<#{channel_id}>" for channel_id in sorted(routes.ignored)) or "なし",
+            inline=True
+        )
+        await ctx.respond(embed=embed, ephemeral=True)
+
+    # ==================== 管理コマンド (Bot所有者のみ) ====================
+
+    @commands.command(name="logstats")
+    @commands.is_owner()
+    async def log_stats(self, ctx: commands.Context):
+        """ログ送信キューとメッセージキャッシュの状態"""
+        m = log_dispatcher.get_metrics()
+        c = self.message_cache.get_metrics()
+        r = self.raid_detector.get_metrics()
+        a = audit_log.get_metrics()
+        await ctx.send(
+            f"📋 ログ送信状況\n"
+            f"```yaml\n"
+            f"キュー: {m['queue_depth']}件 (溢れてアウトボックス経由にした件数 {m['shed']:,}件)\n"
+            f"送信メッセージ: {m['messages_sent']:,}件 (Embed {m['embeds_sent']:,}件, 平均 {m['embeds_per_message']}件/通)\n"
+            f"送信時間: 平均 {m['avg_send_ms']}ms / 最大 {m['max_send_ms']}ms\n"
+            f"最大待ち時間: {m['max_delay_ms']}ms\n"
+            f"送信エラー: {m['send_errors']}件 (再試行 {m['retries']}回, 破棄 {m['dropped']}件, 再送 {m['replayed']}件)\n"
+            f"アウトボックス: 未書き込み {m['outbox_unpersisted']}件 (書き込みエラー {m['outbox_flush_errors']}回)\n"
+            f"送信経路: Webhook {m['webhook_sends']:,}件 / Bot {m['bot_sends']:,}件"
+            f" (Webhook{'有効' if m['webhook_enabled'] else '無効'}, 429: {m['rate_limited']}回)\n"
+            f"メッセージキャッシュ: {c['entries']:,}件 / {c['total_bytes'] / 1024:,.0f}KB "
+            f"(ヒット率 {c['hit_rate'] * 100:.1f}%, 追い出し {c['evictions']:,}件)\n"
+            f"監査ログ: 記録 {a['recorded']:,}件 / 未書き込み {a['pending']}件 (最終検索 {a['last_search_ms']}ms)\n"
+            f"急増検知: {r['raids']}回 (検知中 {r['raid_active']}件, 要約にまとめた件数 {r['raid_aggregated']:,}件)\n"
+            f"```"
+        )
+
+    # ==================== 統計データ記録 ====================
+    
+    def _record_stat(self, guild_id: int, event_type: str, count: int = 1, user_id: Optional[int] = None):
+        """統計データを集約バッファに記録（DBへの書き込みは定期的にまとめて行う）"""
+        stats_buffer.add(guild_id, event_type, count, user_id=user_id)
 
 def setup(bot: commands.Bot):
     bot.add_cog(Logger(bot))
@@ -0,0 +1,262 @@
+import discord
+from discord.ext import commands, tasks
+from datetime import datetime, time, timezone
+from pathlib import Path
+from typing import Optional
+import asyncio
+import tempfile
+
+from utils.db_manager import db
+from utils import retention
+from utils.audit_log import audit_log
+from utils.backup import backup_manager
+from utils.event_bus import event_bus
+from utils.guild_config import guild_configs
+from utils.leaderboards import leaderboards
+from utils.log_routes import log_routes
+from utils.query_stats import query_stats
+
+# 利用の少ない時間帯に実行（UTC 19:00 = 日本時間 4:00）
+COMPACTION_TIME = time(hour=19, minute=0, tzinfo=timezone.utc)
+# 6時間ごとにバックアップ（コンパクションとは時間をずらす）
+BACKUP_TIMES = [time(hour=h, minute=30, tzinfo=timezone.utc) for h in (1, 7, 13, 19)]
+
+
+class Maintenance(commands.Cog):
+    """🗄️ 統計データの保持期間管理・アーカイブ・バックアップ・DB計測"""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.compaction_task.start()
+        self.backup_task.start()
+
+    def cog_unload(self):
+        self.compaction_task.cancel()
+        self.backup_task.cancel()
+
+    @tasks.loop(time=COMPACTION_TIME)
+    async def compaction_task(self):
+        """保持期間を過ぎた日次統計をアーカイブへ移し、古い監査ログを消す"""
+        if db.connection is None:
+            return
+        try:
+            await retention.compact()
+        except Exception as e:
+            print(f"統計コンパクションエラー: {e}")
+        try:
+            await audit_log.prune()
+        except Exception as e:
+            print(f"監査ログ削除エラー: {e}")
+
+    @compaction_task.before_loop
+    async def before_compaction(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(time=BACKUP_TIMES)
+    async def backup_task(self):
+        """定期スナップショット"""
+        if db.connection is None:
+            return
+        try:
+            await backup_manager.snapshot()
+        except Exception as e:
+            print(f"バックアップエラー: {e}")
+
+    @backup_task.before_loop
+    async def before_backup(self):
+        await self.bot.wait_until_ready()
+
+    # ==================== 管理コマンド (Bot所有者のみ) ====================
+
+    @commands.command(name="compact")
+    @commands.is_owner()
+    async def compact_now(self, ctx: commands.Context):
+        """コンパクションを今すぐ1回実行"""
+        await ctx.send(f"🗄️ コンパクション開始（保持期間: {retention.retention_days()}日）...")
+        try:
+            result = await retention.compact()
+        except Exception as e:
+            await ctx.send(f"❌ コンパクション失敗: {e}")
+            return
+
+        await ctx.send(
+            f"✅ コンパクション完了\n"
+            f"```yaml\n"
+            f"日次明細の保持開始日: {result['floor']}\n"
+            f"アーカイブした行: {result['archived_rows']:,}行 ({result['batches']}バッチ)\n"
+            f"削除した週次ロールアップ: {result['pruned_weeks']}週\n"
+            f"削除した時間別統計: {result['pruned_hourly_rows']:,}行\n"
+            f"セグメント: {result['segment'] or 'なし'}\n"
+            f"所要時間: {result['elapsed_s']}秒\n"
+            f"```"
+            + ("" if result["finished"] else "\n⚠️ 上限に達したため、残りは次回実行時に処理します。")
+        )
+
+    @commands.command(name="archive_export")
+    @commands.is_owner()
+    async def archive_export(
+        self,
+        ctx: commands.Context,
+        guild_id: Optional[int] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ):
+        """アーカイブ済みの統計を JSONL (gzip) で書き出す: !archive_export [guild_id] [YYYY-MM-DD] [YYYY-MM-DD]"""
+        if not retention.list_segments():
+            await ctx.send("⚠️ アーカイブはまだありません。")
+            return
+
+        await ctx.send("📦 アーカイブを書き出し中...")
+        destination = Path(tempfile.gettempdir()) / f"archive_export_{ctx.message.id}.jsonl.gz"
+        try:
+            count = await asyncio.to_thread(retention.export_archive, destination, guild_id, since, until)
+            size = destination.stat().st_size
+            limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+
+            if size > limit:
+                await ctx.send(
+                    f"⚠️ {count:,}行 ({size / 1024 / 1024:.1f}MB) はアップロード上限を超えています。"
+                    f"条件を絞り込むか、サーバー上の `{retention.ARCHIVE_DIR}` を直接参照してください。"
+                )
+                return
+
+            await ctx.send(
+                f"✅ {count:,}行を書き出しました。",
+                file=discord.File(destination, filename="user_statistics_archive.jsonl.gz")
+            )
+        except Exception as e:
+            await ctx.send(f"❌ 書き出し失敗: {e}")
+        finally:
+            destination.unlink(missing_ok=True)
+
+    @commands.command(name="backup")
+    @commands.is_owner()
+    async def backup_now(self, ctx: commands.Context):
+        """スナップショットを今すぐ作成"""
+        await ctx.send("💾 バックアップ中...")
+        try:
+            path = await backup_manager.snapshot()
+        except Exception as e:
+            await ctx.send(f"❌ バックアップ失敗: {e}")
+            return
+
+        metrics = backup_manager.get_metrics()
+        await ctx.send(
+            f"✅ バックアップ完了: `{path.name}`\n"
+            f"```yaml\n"
+            f"サイズ: {metrics['last_size'] / 1024 / 1024:.2f}MB\n"
+            f"コピー時間: {metrics['last_copy_ms']:.0f}ms\n"
+            f"書き込み停止時間: {metrics['last_writer_blocked_ms']:.0f}ms\n"
+            f"やり直し回数: {metrics['last_restarts']}\n"
+            f"```"
+        )
+
+    @commands.command(name="backups")
+    @commands.is_owner()
+    async def list_backups(self, ctx: commands.Context):
+        """スナップショット一覧"""
+        snapshots = backup_manager.list_snapshots()
+        if not snapshots:
+            await ctx.send("⚠️ スナップショットはまだありません。")
+            return
+
+        lines = [f"• `{p.name}` ({p.stat().st_size / 1024 / 1024:.2f}MB)" for p in reversed(snapshots)]
+        await ctx.send("💾 スナップショット一覧（新しい順）\n" + "\n".join(lines[:20]))
+
+    @commands.command(name="restore")
+    @commands.is_owner()
+    async def restore_backup(self, ctx: commands.Context, name: str):
+        """スナップショットから復元: !restore <ファイル名>"""
+        await ctx.send(f"♻️ `{name}` を検査して復元します...")
+        try:
+            path = await backup_manager.restore(name)
+            # DBから読み込んでいるキャッシュを作り直す
+            await guild_configs.load_all()
+            await log_routes.load_all()
+            await leaderboards.load_all()
+            stats_cog = self.bot.get_cog("Statistics")
+            if stats_cog:
+                stats_cog.cache.clear()
+        except Exception as e:
+            await ctx.send(f"❌ 復元失敗: {e}")
+            return
+
+        await ctx.send(f"✅ `{path.name}` から復元しました（復元前のDBもスナップショットに保存済み）。")
+
+    @commands.command(name="dbtop")
+    @commands.is_owner()
+    async def db_top(self, ctx: commands.Context, limit: int = 10, order: str = "total"):
+        """重いクエリ上位: !dbtop [件数] [total|count|p99|max|wait]"""
+        rows = query_stats.top(min(max(limit, 1), 25), order)
+        if not rows:
+            await ctx.send("⚠️ まだ計測データがありません。")
+            return
+
+        elapsed_min = (datetime.now(timezone.utc).timestamp() - query_stats.started_at) / 60
+        lines = [f"📈 DBクエリ上位 (並び順: {order}, 計測 {elapsed_min:.0f}分)"]
+        for i, r in enumerate(rows, 1):
+            lines.append(
+                f"**{i}. [{r['tag']}] {r['kind']}** ×{r['count']:,} | 合計 {r['total_ms']:,.0f}ms | "
+                f"p50 {r['p50_ms']:.2f} / p95 {r['p95_ms']:.2f} / p99 {r['p99_ms']:.2f}ms | "
+                f"ロック待ち {r['wait_ms']:,.0f}ms\n`{r['statement'][:150]}`"
+            )
+
+        by_tag = sorted(query_stats.by_tag().items(), key=lambda kv: kv[1]["total_ms"], reverse=True)
+        lines.append("🧩 コグ別: " + ", ".join(f"{tag} {v['total_ms']:,.0f}ms/{v['count']:,}回" for tag, v in by_tag[:10]))
+
+        # 2000文字制限に収まるように分けて送る
+        chunk = ""
+        for line in lines:
+            if len(chunk) + len(line) + 1 > 1900:
+                await ctx.send(chunk)
+                chunk = ""
+            chunk += line + "\n"
+        if chunk:
+            await ctx.send(chunk)
+
+    @commands.command(name="dbslow")
+    @commands.is_owner()
+    async def db_slow(self, ctx: commands.Context, limit: int = 5):
+        """スロークエリログ（新しい順）と実行計画"""
+        entries = list(query_stats.slow_log)[-max(limit, 1):]
+        if not entries:
+            await ctx.send(f"✅ {query_stats.slow_query_ms:.0f}ms を超えたクエリはありません。")
+            return
+
+        for entry in reversed(entries):
+            await ctx.send(
+                f"🐢 **{entry['ms']:.0f}ms** [{entry['tag']}] <t:{int(entry['at'])}:R>\n"
+                f"`{entry['statement'][:300]}`\n"
+                f"```\n{(entry['plan'] or '(実行計画なし)')[:1200]}\n```"
+            )
+
+    @commands.command(name="dbreset")
+    @commands.is_owner()
+    async def db_reset(self, ctx: commands.Context):
+        """クエリ計測をリセット（最適化の前後比較用）"""
+        query_stats.reset()
+        await ctx.send("🔄 クエリ計測をリセットしました。")
+
+    @commands.command(name="busstats")
+    @commands.is_owner()
+    async def bus_stats(self, ctx: commands.Context):
+        """イベントバスの購読者ごとのキュー・破棄数・遅延"""
+        metrics = event_bus.get_metrics()
+        if not metrics:
+            await ctx.send("⚠️ 購読者がいません。")
+            return
+
+        lines = ["📬 イベントバス", "```yaml"]
+        for name, m in metrics.items():
+            lines.append(
+                f"{name} ({m['topic']}, ワーカー{m['concurrency']}): "
+                f"キュー {m['depth']}/{m['capacity']}件 (最大 {m['max_depth']}件, 処理中 {m['busy']}件)\n"
+                f"  処理 {m['processed']:,}件 / 破棄 {m['dropped']:,}件 / エラー {m['errors']}件 | "
+                f"遅延 平均 {m['lag_ms']}ms / 最大 {m['max_lag_ms']}ms"
+            )
+        lines.append("```")
+        await ctx.send("\n".join(lines))
+
+
+def setup(bot: commands.Bot):
+    bot.add_cog(Maintenance(bot))
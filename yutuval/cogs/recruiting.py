@@ -2,7 +2,8 @@ import discord
 from discord.ext import commands, tasks
 from discord.ui import Button, View, Select, Modal, InputText
 from utils.db_manager import db
-import json
+from utils.guild_config import guild_configs
+import time
 from typing import Optional, List, Union
 import datetime
 
@@ -352,9 +353,9 @@ class RecruitmentWizard(View):
         target_channel = interaction.channel
         
         # 設定された募集チャンネルを確認
-        conf_row = await db.fetchrow("SELECT recruit_channel_id FROM server_config WHERE guild_id = ?", (interaction.guild.id,))
-        if conf_row and conf_row[0]:
-            setting_channel = interaction.guild.get_channel(conf_row[0])
+        recruit_channel_id = guild_configs.get(interaction.guild.id).recruit_channel_id
+        if recruit_channel_id:
+            setting_channel = interaction.guild.get_channel(recruit_channel_id)
             if setting_channel:
                 target_channel = setting_channel
 
@@ -369,9 +370,9 @@ class RecruitmentWizard(View):
         
         # DB登録
         await db.execute(
-            """INSERT INTO recruitments (message_id, channel_id, author_id, max_members, rank_range, mode, joined_members, is_closed, vc_id)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (msg.id, target_channel.id, interaction.user.id, self.needed_members, rank_display, self.mode, json.dumps([]), 0, vc_id)
+            """INSERT INTO recruitments (message_id, channel_id, author_id, max_members, rank_range, mode, is_closed, vc_id)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (msg.id, target_channel.id, interaction.user.id, self.needed_members, rank_display, self.mode, 0, vc_id)
         )
 
         # ログを記録
@@ -448,7 +449,10 @@ class RecruitmentView(View):
                 return
             
             self.joined_members.append(interaction.user.id)
-            await db.execute("UPDATE recruitments SET joined_members = ? WHERE message_id = ?", (json.dumps(self.joined_members), interaction.message.id))
+            await db.execute(
+                "INSERT OR IGNORE INTO recruitment_members (message_id, user_id, joined_at) VALUES (?, ?, ?)",
+                (interaction.message.id, interaction.user.id, int(time.time()))
+            )
             
             # VC権限付与
             if self.vc_id:
@@ -488,7 +492,10 @@ class RecruitmentView(View):
                 return
             
             self.joined_members.remove(interaction.user.id)
-            await db.execute("UPDATE recruitments SET joined_members = ? WHERE message_id = ?", (json.dumps(self.joined_members), interaction.message.id))
+            await db.execute(
+                "DELETE FROM recruitment_members WHERE message_id = ? AND user_id = ?",
+                (interaction.message.id, interaction.user.id)
+            )
             
             # VC権限剥奪はあえてしない（複雑になるため）。退出は自主的に。
             
@@ -569,7 +576,7 @@ class RecruitDashboardView(View):
 
     @discord.ui.button(label="募集を作成する", style=discord.ButtonStyle.success, emoji="🎮", custom_id="persistent_recruit_create")
     async def create_recruit(self, button: Button, interaction: discord.Interaction):
-        config = await interaction.client.get_cog("Recruiting").get_guild_rank_config(interaction.guild.id)
+        config = interaction.client.get_cog("Recruiting").get_guild_rank_config(interaction.guild.id)
         view = RecruitmentWizard(interaction.user.id, config)
         await interaction.response.send_message(embed=view.get_embed(), view=view, ephemeral=True)
 
@@ -580,7 +587,7 @@ class RecruitConfigView(View):
 
     @discord.ui.button(label="このチャンネルを募集用に設定", style=discord.ButtonStyle.primary, emoji="📍", row=0)
     async def set_channel(self, button: Button, interaction: discord.Interaction):
-        await db.execute("UPDATE server_config SET recruit_channel_id = ? WHERE guild_id = ?", (interaction.channel.id, self.guild_id))
+        await guild_configs.set_recruit_channel(self.guild_id, interaction.channel.id)
         await interaction.response.send_message(f"✅ このチャンネル (<#{interaction.channel.id}>) を募集ボタンの表示先に設定しました。\n募集が作成されると、自動的にボタンが一番下に再配置されます。", ephemeral=True)
         # Immediately post dashboard
         recruiting_cog = interaction.client.get_cog("Recruiting")
@@ -604,7 +611,7 @@ class EmojiInputModal(Modal):
         else:
              config_str = value
         
-        await db.update_rank_emoji(self.guild_id, self.rank_name, config_str)
+        await guild_configs.set_rank_emoji(self.guild_id, self.rank_name, config_str)
         await interaction.response.send_message(f"✅ {self.rank_name} の絵文字を更新しました！\n確認: {config_str}", ephemeral=True)
 
 class ConfigRankSelect(View):
@@ -632,9 +639,8 @@ class Recruiting(commands.Cog):
     def cog_unload(self):
         self.cleanup_recruitments.cancel()
 
-    async def get_guild_rank_config(self, guild_id: int):
-        server_conf = await db.get_config(guild_id)
-        custom_emojis = server_conf.get("rank_emojis", {})
+    def get_guild_rank_config(self, guild_id: int):
+        custom_emojis = guild_configs.get(guild_id).rank_emojis
         config = []
         for r in DEFAULT_RANK_CONFIG:
             new_r = r.copy()
@@ -649,20 +655,32 @@ class Recruiting(commands.Cog):
             # VC IDを特定するために active_vcs と recruitments を紐付けるのは難しい（テーブルにFKがないため）
             # 新しい募集では vc_id を紐付けられるが、既存は無理。
             # Persistence復元時は vc_id=None になる可能性があるが、それでも動くようにする。
-            active_recruits = await db.fetchall("SELECT * FROM recruitments WHERE is_closed = 0")
+            active_recruits = await db.fetchall(
+                "SELECT message_id, author_id, max_members, rank_range, mode, vc_id FROM recruitments WHERE is_closed = 0"
+            )
             count = 0
             if active_recruits:
-                for row in active_recruits:
-                    # row: msg_id, ch_id, author, max, rank, mode, joined, closed, vc_id
-                    vc_id = row[8] if len(row) > 8 else None
-                    view = RecruitmentView(row[2], row[3], row[4], row[5], vc_id=vc_id)
+                # 参加者は1クエリでまとめて取得（rowid順 = 参加順）
+                member_rows = await db.fetchall(
+                    """
+                    SELECT m.message_id, m.user_id FROM recruitment_members m
+                    JOIN recruitments r ON r.message_id = m.message_id
+                    WHERE r.is_closed = 0
+                    ORDER BY m.rowid
+                    """
+                )
+                joined_by_message = {}
+                for message_id, user_id in member_rows:
+                    joined_by_message.setdefault(message_id, []).append(user_id)
+
+                for msg_id, author_id, max_members, rank_range, mode, vc_id in active_recruits:
+                    view = RecruitmentView(author_id, max_members, rank_range, mode, vc_id=vc_id)
                     try:
-                        joined = json.loads(row[6]) if row[6] else []
-                        view.joined_members = joined
-                        self.bot.add_view(view, message_id=row[0])
+                        view.joined_members = joined_by_message.get(msg_id, [])
+                        self.bot.add_view(view, message_id=msg_id)
                         count += 1
                     except Exception as e:
-                        print(f"Failed to restore view for {row[0]}: {e}")
+                        print(f"Failed to restore view for {msg_id}: {e}")
                 print(f"🔄 復元された募集パネル: {count}件")
 
             # Dashboard Button Restore
@@ -674,7 +692,7 @@ class Recruiting(commands.Cog):
     @discord.slash_command(name="recruit", description="Valorantの募集を作成します")
     async def recruit(self, ctx: discord.ApplicationContext):
         await ctx.defer(ephemeral=True)
-        config = await self.get_guild_rank_config(ctx.guild.id)
+        config = self.get_guild_rank_config(ctx.guild.id)
         view = RecruitmentWizard(ctx.author.id, config)
         embed = view.get_embed()
         await ctx.followup.send(embed=embed, view=view)
@@ -683,7 +701,7 @@ class Recruiting(commands.Cog):
     @commands.has_permissions(administrator=True)
     async def recruit_config(self, ctx: discord.ApplicationContext):
         embed = discord.Embed(title="⚙️ 募集機能設定", description="設定を変更したい項目を選択してください。", color=discord.Color.dark_gray())
-        config = await self.get_guild_rank_config(ctx.guild.id)
+        config = self.get_guild_rank_config(ctx.guild.id)
         
         # Current Config Summary
         summary = "現在の設定:\n"
@@ -692,8 +710,7 @@ class Recruiting(commands.Cog):
         embed.add_field(name="ランク絵文字", value=summary[:1000], inline=False)
         
         # Channel Config
-        conf_row = await db.fetchrow("SELECT recruit_channel_id FROM server_config WHERE guild_id = ?", (ctx.guild.id,))
-        ch_id = conf_row[0] if conf_row else None
+        ch_id = guild_configs.get(ctx.guild.id).recruit_channel_id
         ch_mention = f"<#{ch_id}>" if ch_id else "未設定"
         embed.add_field(name="募集チャンネル (固定ボタン表示先)", value=ch_mention, inline=False)
         
@@ -703,9 +720,9 @@ class Recruiting(commands.Cog):
     async def on_guild_channel_delete(self, channel):
         # VC deleted manually -> Close recruitment
         if isinstance(channel, discord.VoiceChannel):
-            row = await db.fetchrow("SELECT message_id, channel_id, author_id, joined_members, rank_range FROM recruitments WHERE vc_id = ?", (channel.id,))
+            row = await db.fetchrow("SELECT message_id, channel_id, author_id, rank_range FROM recruitments WHERE vc_id = ?", (channel.id,))
             if row:
-                msg_id, ch_id, author_id, joined_json, rank_range = row
+                msg_id, ch_id, author_id, rank_range = row
                 try:
                     ch = self.bot.get_channel(ch_id)
                     if ch:
@@ -717,7 +734,10 @@ class Recruiting(commands.Cog):
                         embed.set_footer(text="VCが削除されたため終了しました")
                         
                         # Disabled view
-                        joined = json.loads(joined_json) if joined_json else []
+                        member_rows = await db.fetchall(
+                            "SELECT user_id FROM recruitment_members WHERE message_id = ? ORDER BY rowid", (msg_id,)
+                        )
+                        joined = [r[0] for r in member_rows]
                         view = RecruitmentView(author_id, 5, rank_range, "Unknown", vc_id=None) # params dont matter for disabled
                         view.joined_members = joined
                         for child in view.children: child.disabled = True
@@ -729,10 +749,10 @@ class Recruiting(commands.Cog):
 
     async def repost_dashboard(self, guild: discord.Guild):
         """募集チャンネルの最後にダッシュボードを再配置"""
-        row = await db.fetchrow("SELECT recruit_channel_id, last_recruit_msg_id FROM server_config WHERE guild_id = ?", (guild.id,))
-        if not row or not row[0]: return
+        config = guild_configs.get(guild.id)
+        if not config.recruit_channel_id: return
 
-        channel_id, last_msg_id = row
+        channel_id, last_msg_id = config.recruit_channel_id, config.last_recruit_msg_id
         channel = guild.get_channel(channel_id)
         if not channel: return
 
@@ -752,7 +772,7 @@ class Recruiting(commands.Cog):
         )
         view = RecruitDashboardView()
         msg = await channel.send(embed=embed, view=view)
-        await db.execute("UPDATE server_config SET last_recruit_msg_id = ? WHERE guild_id = ?", (msg.id, guild.id))
+        await guild_configs.set_last_recruit_msg(guild.id, msg.id)
 
     async def start_additional_recruitment(self, interaction: discord.Interaction, vc_id: int, needed: int):
         """追加募集を開始する"""
@@ -794,9 +814,9 @@ class Recruiting(commands.Cog):
         
         # DB登録 (mode="追加募集")
         await db.execute(
-            """INSERT INTO recruitments (message_id, channel_id, author_id, max_members, rank_range, mode, joined_members, is_closed)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (msg.id, channel.id, interaction.user.id, needed, "追加募集", "追加募集", json.dumps([]), 0)
+            """INSERT INTO recruitments (message_id, channel_id, author_id, max_members, rank_range, mode, is_closed)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (msg.id, channel.id, interaction.user.id, needed, "追加募集", "追加募集", 0)
         )
         
         await interaction.response.send_message(f"✅ 追加募集を <#{channel.id}> に送信しました。", ephemeral=True)
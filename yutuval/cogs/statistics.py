@@ -3,13 +3,42 @@ from discord.ext import commands
 from discord import option
 from datetime import datetime, timezone, timedelta
 from typing import Optional
-import json
+import time
+from utils.event_bus import VOICE_STATE, VoiceStateEvent, event_bus
+from utils.guild_config import guild_configs, load_timezone
+from utils.leaderboards import leaderboards
+from utils.rollups import build_range_query, parse_date, plan_range
+from utils.retention import daily_floor
+from utils.stats_buffer import stats_buffer
+from utils.stats_cache import StatsCache
+from utils.stats_query import WindowedStats, fetch_windows, period, previous_period, today_utc
+from utils.timeseries import DAY, MONTH, WEEK, TimeSeries, bucket_for, fetch_heatmap, fetch_series
+from utils.voice_sessions import voice_sessions
+
+# VCの出入りを溜めておけるイベント数
+VOICE_EVENT_CAPACITY = 10000
+
+# 推移グラフの集計単位ごとの見出し
+BUCKET_LABELS = {DAY: "日別", WEEK: "週別", MONTH: "月別"}
+
+# ヒートマップの濃淡（0件は「·」、最大値に対する割合で4段階）
+HEATMAP_SHADES = "░▒▓█"
+WEEKDAY_NAMES = "月火水木金土日"
 
 class Statistics(commands.Cog):
     """📊 統計データトラッキング・表示機能"""
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        # セッションの開閉はメモリ上の処理だけなので、取りこぼさないようにキューを大きめに取る
+        event_bus.subscribe(VOICE_STATE, "voice_sessions", self._on_voice_state, capacity=VOICE_EVENT_CAPACITY)
+        # 集計結果のキャッシュ（新しい統計が書き込まれたサーバーの分は捨てる）
+        self.cache = StatsCache()
+        stats_buffer.add_flush_listener(self.cache.on_flush)
+
+    def cog_unload(self):
+        event_bus.unsubscribe_nowait("voice_sessions")
+        stats_buffer.remove_flush_listener(self.cache.on_flush)
     
     stats_group = discord.SlashCommandGroup(
         name="stats",
@@ -17,26 +46,34 @@ class Statistics(commands.Cog):
         default_member_permissions=discord.Permissions(administrator=True)
     )
     
+    # ==================== VC滞在時間の計測 ====================
+
+    async def _on_voice_state(self, event: VoiceStateEvent):
+        """VCの出入りでセッションを開閉（滞在時間は定期的に日別の分数として記録）"""
+        voice_sessions.update(event.member, event.before, event.after, now=event.at)
+
     # ==================== 統計表示コマンド ====================
     
     @stats_group.command(name="overview", description="📊 サーバー全体の統計概要を表示")
     async def stats_overview(self, ctx: discord.ApplicationContext):
         """サーバー統計の概要を表示"""
         await ctx.defer()
-        
-        from utils.db_manager import db
-        
-        guild = ctx.guild
-        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).strftime("%Y-%m-%d")
-        month_ago = (datetime.now(timezone.utc) - timedelta(days=30)).strftime("%Y-%m-%d")
-        
-        # 今日の統計
-        today_stats = await self._get_stats_for_period(guild.id, today, today)
-        # 週間統計
-        week_stats = await self._get_stats_for_period(guild.id, week_ago, today)
-        # 月間統計
-        month_stats = await self._get_stats_for_period(guild.id, month_ago, today)
+        embed = await self.build_overview_embed(ctx.guild)
+        await ctx.respond(embed=embed)
+
+    async def build_overview_embed(self, guild: discord.Guild) -> discord.Embed:
+        """統計ダッシュボードのEmbed（/stats overview とダッシュボードの統計メニューで共用）"""
+        today = today_utc()
+        # 今日・週間・月間と前週比の比較用の期間を1回の集計で求める
+        windows = await self._get_windows(guild.id, {
+            "today": (today, today),
+            "week": period(7, today),
+            "previous_week": previous_period(7, today),
+            "month": period(30, today),
+        })
+        today_stats = windows.totals("today")
+        week_stats = windows.totals("week")
+        month_stats = windows.totals("month")
         
         embed = discord.Embed(
             title="📊 サーバー統計ダッシュボード",
@@ -80,7 +117,7 @@ class Statistics(commands.Cog):
         
         # 今日のアクティビティ
         embed.add_field(
-            name=f"📈 今日のアクティビティ ({today})",
+            name=f"📈 今日のアクティビティ ({today:%Y-%m-%d})",
             value=self._format_activity_stats(today_stats),
             inline=False
         )
@@ -88,7 +125,7 @@ class Statistics(commands.Cog):
         # 週間アクティビティ
         embed.add_field(
             name="📅 週間アクティビティ (7日間)",
-            value=self._format_activity_stats(week_stats),
+            value=self._format_activity_stats(week_stats, windows, "week", "previous_week"),
             inline=True
         )
         
@@ -120,8 +157,7 @@ class Statistics(commands.Cog):
             embed.set_thumbnail(url=guild.icon.url)
         
         embed.set_footer(text="📊 統計システム | データは毎日自動集計されます")
-        
-        await ctx.respond(embed=embed)
+        return embed
     
     @stats_group.command(name="messages", description="💬 メッセージ統計を表示")
     @option("days", description="表示する日数", required=False, default=7, min_value=1, max_value=30)
@@ -129,13 +165,9 @@ class Statistics(commands.Cog):
         """メッセージ統計を表示"""
         await ctx.defer()
         
-        from utils.db_manager import db
-        
-        end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
-        
-        stats = await self._get_stats_for_period(ctx.guild.id, start_date, end_date)
-        daily_stats = await self._get_daily_stats(ctx.guild.id, start_date, end_date, 'message_sent')
+        start, end = period(days)
+        stats = (await self._get_windows(ctx.guild.id, {"period": (start, end)})).totals("period")
+        series = (await self._get_series(ctx.guild.id, start, end, ['message_sent']))['message_sent']
         
         embed = discord.Embed(
             title="💬 メッセージ統計",
@@ -160,14 +192,9 @@ class Statistics(commands.Cog):
             inline=False
         )
         
-        # 日別グラフ（簡易版）
-        if daily_stats:
-            graph = self._create_bar_graph(daily_stats, max_width=15)
-            embed.add_field(
-                name="📈 日別推移（直近7日）",
-                value=f"```\n{graph}\n```",
-                inline=False
-            )
+        # 推移グラフ（長い期間は週・月単位にまとめる）
+        if series.total():
+            self._add_trend_fields(embed, series, "送信", "件")
         
         embed.set_footer(text="📊 メッセージ統計")
         
@@ -179,12 +206,7 @@ class Statistics(commands.Cog):
         """VC統計を表示"""
         await ctx.defer()
         
-        from utils.db_manager import db
-        
-        end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
-        
-        stats = await self._get_stats_for_period(ctx.guild.id, start_date, end_date)
+        stats = (await self._get_windows(ctx.guild.id, {"period": period(days)})).totals("period")
         
         embed = discord.Embed(
             title="🔊 ボイスチャンネル統計",
@@ -196,6 +218,7 @@ class Statistics(commands.Cog):
         # VC統計
         vc_join = stats.get('vc_join', 0)
         vc_leave = stats.get('vc_leave', 0)
+        vc_minutes = stats.get('vc_minutes', 0)
         
         embed.add_field(
             name="📊 VC利用統計",
@@ -207,6 +230,17 @@ class Statistics(commands.Cog):
             inline=True
         )
         
+        embed.add_field(
+            name="⏱️ VC滞在時間",
+            value=f"```yaml\n"
+                  f"合計: {self._format_minutes(vc_minutes)}\n"
+                  f"日平均: {self._format_minutes(vc_minutes // days if days > 0 else 0)}\n"
+                  f"1回あたり: {self._format_minutes(vc_minutes // vc_join if vc_join > 0 else 0)}\n"
+                  f"現在VCにいる人数: {voice_sessions.open_sessions(ctx.guild.id):,}人\n"
+                  f"```",
+            inline=True
+        )
+        
         # 現在のVC状況
         active_vcs = []
         for vc in ctx.guild.voice_channels:
@@ -236,12 +270,7 @@ class Statistics(commands.Cog):
         """募集統計を表示"""
         await ctx.defer()
         
-        from utils.db_manager import db
-        
-        end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
-        
-        stats = await self._get_stats_for_period(ctx.guild.id, start_date, end_date)
+        stats = (await self._get_windows(ctx.guild.id, {"period": period(days)})).totals("period")
         
         embed = discord.Embed(
             title="📣 募集統計",
@@ -290,14 +319,9 @@ class Statistics(commands.Cog):
         """メンバー増減統計を表示"""
         await ctx.defer()
         
-        from utils.db_manager import db
-        
-        end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
-        
-        stats = await self._get_stats_for_period(ctx.guild.id, start_date, end_date)
-        daily_join = await self._get_daily_stats(ctx.guild.id, start_date, end_date, 'member_join')
-        daily_leave = await self._get_daily_stats(ctx.guild.id, start_date, end_date, 'member_leave')
+        start, end = period(days)
+        stats = (await self._get_windows(ctx.guild.id, {"period": (start, end)})).totals("period")
+        series = await self._get_series(ctx.guild.id, start, end, ['member_join', 'member_leave'])
         
         embed = discord.Embed(
             title="👥 メンバー増減統計",
@@ -334,6 +358,12 @@ class Statistics(commands.Cog):
             inline=True
         )
         
+        # 参加・退出の推移
+        if series['member_join'].total():
+            self._add_trend_fields(embed, series['member_join'], "参加", "人")
+        if series['member_leave'].total():
+            self._add_trend_fields(embed, series['member_leave'], "退出", "人")
+        
         # 現在のメンバー構成
         guild = ctx.guild
         new_members = sum(1 for m in guild.members if m.joined_at and (datetime.now(timezone.utc) - m.joined_at.replace(tzinfo=timezone.utc)).days < 7)
@@ -358,12 +388,7 @@ class Statistics(commands.Cog):
         """ロール変更統計を表示"""
         await ctx.defer()
         
-        from utils.db_manager import db
-        
-        end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
-        
-        stats = await self._get_stats_for_period(ctx.guild.id, start_date, end_date)
+        stats = (await self._get_windows(ctx.guild.id, {"period": period(days)})).totals("period")
         
         embed = discord.Embed(
             title="🏷️ ロール変更統計",
@@ -405,10 +430,80 @@ class Statistics(commands.Cog):
         
         await ctx.respond(embed=embed)
     
+    @stats_group.command(name="heatmap", description="🗓️ 曜日×時間帯のアクティビティを表示")
+    @option("category", description="集計するイベント", required=False, default="message_sent", choices=[
+        discord.OptionChoice("💬 メッセージ送信数", "message_sent"),
+        discord.OptionChoice("🔊 VC参加回数", "vc_join"),
+        discord.OptionChoice("📣 募集作成回数", "recruit_created"),
+        discord.OptionChoice("👋 メンバー参加数", "member_join")
+    ])
+    @option("weeks", description="集計期間（週）", required=False, default=4, min_value=1, max_value=12)
+    async def stats_heatmap(self, ctx: discord.ApplicationContext, category: str = "message_sent", weeks: int = 4):
+        """曜日×時間帯のヒートマップを表示（サーバーのタイムゾーンで集計）"""
+        await ctx.defer()
+        
+        tz = guild_configs.get(ctx.guild.id).tzinfo
+        # 今の1時間を含む直近 weeks 週間
+        end_hour = int(time.time()) // 3600 + 1
+        start_hour = end_hour - weeks * 7 * 24
+        grid = await self._get_heatmap(ctx.guild.id, category, start_hour, end_hour, tz)
+        
+        total = sum(sum(row) for row in grid)
+        embed = discord.Embed(
+            title="🗓️ 曜日×時間帯のアクティビティ",
+            description=f"過去 **{weeks}週間** ・ タイムゾーン: `{tz.key}`",
+            color=0x5865F2,
+            timestamp=datetime.now(timezone.utc)
+        )
+        
+        if not total:
+            embed.description += "\n\n⚠️ データがありません"
+        else:
+            embed.add_field(name="📊 ヒートマップ", value=f"```\n{self._create_heatmap(grid)}\n```", inline=False)
+            
+            peak_day, peak_hour = max(
+                ((day, hour) for day in range(7) for hour in range(24)),
+                key=lambda cell: grid[cell[0]][cell[1]]
+            )
+            by_day = [sum(row) for row in grid]
+            by_hour = [sum(row[hour] for row in grid) for hour in range(24)]
+            busiest_day = by_day.index(max(by_day))
+            busiest_hour = by_hour.index(max(by_hour))
+            embed.add_field(
+                name="🔥 ピーク",
+                value=f"```yaml\n"
+                      f"最も多い枠: {WEEKDAY_NAMES[peak_day]}曜 {peak_hour}時台 ({grid[peak_day][peak_hour]:,}件)\n"
+                      f"最も多い曜日: {WEEKDAY_NAMES[busiest_day]}曜 ({by_day[busiest_day]:,}件)\n"
+                      f"最も多い時間帯: {busiest_hour}時台 ({by_hour[busiest_hour]:,}件)\n"
+                      f"合計: {total:,}件\n"
+                      f"```",
+                inline=False
+            )
+        
+        embed.set_footer(text="📊 /stats timezone でタイムゾーンを変更できます")
+        await ctx.respond(embed=embed)
+    
+    @stats_group.command(name="timezone", description="🌐 統計の表示に使うタイムゾーンを設定")
+    @option("name", description="タイムゾーン名（例: Asia/Tokyo, America/New_York）。省略すると現在の設定を表示", required=False, default=None)
+    async def stats_timezone(self, ctx: discord.ApplicationContext, name: Optional[str] = None):
+        """サーバーのタイムゾーンを設定・表示"""
+        if name is None:
+            await ctx.respond(f"🌐 現在のタイムゾーン: `{guild_configs.get(ctx.guild.id).tzinfo.key}`", ephemeral=True)
+            return
+        
+        tz = load_timezone(name.strip())
+        if tz is None:
+            await ctx.respond(f"❌ `{name}` は不明なタイムゾーンです（例: `Asia/Tokyo`）。", ephemeral=True)
+            return
+        
+        await guild_configs.set_timezone(ctx.guild.id, tz.key)
+        await ctx.respond(f"✅ 統計のタイムゾーンを `{tz.key}` に設定しました。", ephemeral=True)
+    
     @stats_group.command(name="ranking", description="🏆 サーバー内ランキングを表示")
     @option("category", description="ランキングのカテゴリ", choices=[
         discord.OptionChoice("💬 メッセージ送信数", "message_sent"),
         discord.OptionChoice("🔊 VC参加回数", "vc_join"),
+        discord.OptionChoice("⏱️ VC滞在時間", "vc_minutes"),
         discord.OptionChoice("📣 募集参加回数", "recruit_joined"),
         discord.OptionChoice("🎮 募集作成回数", "recruit_created")
     ])
@@ -417,17 +512,23 @@ class Statistics(commands.Cog):
         """サーバー内ランキングを表示"""
         await ctx.defer()
         
-        from utils.db_manager import db
-        
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
         start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
         
-        # ランキングデータ取得
-        ranking_data = await self._get_ranking_stats(ctx.guild.id, category, start_date, end_date)
+        # ランキングデータ取得（1/7/30/90日はメモリ上のランキングから、それ以外はDBで集計）
+        if leaderboards.supports(category, days):
+            ranking_data = leaderboards.top(ctx.guild.id, category, days, 10)
+            my_rank = leaderboards.rank(ctx.guild.id, category, days, ctx.author.id)
+        else:
+            ranking_data = await self._get_ranking_stats(ctx.guild.id, category, start_date, end_date)
+            my_rank = next(
+                ((i, count) for i, (uid, count) in enumerate(ranking_data, 1) if uid == ctx.author.id), None
+            )
         
         category_names = {
             "message_sent": "💬 メッセージ送信数",
             "vc_join": "🔊 VC参加回数",
+            "vc_minutes": "⏱️ VC滞在時間",
             "recruit_joined": "📣 募集参加回数",
             "recruit_created": "🎮 募集作成回数"
         }
@@ -450,112 +551,177 @@ class Statistics(commands.Cog):
                 user = ctx.guild.get_member(user_id)
                 user_name = user.display_name if user else f"Unknown User ({user_id})"
                 
-                rank_text += f"**{medal} {user_name}**: {count:,}回\n"
+                rank_text += f"**{medal} {user_name}**: {self._format_count(category, count)}\n"
             
             embed.add_field(name="Top 10", value=rank_text, inline=False)
             
             # 自分の順位
-            my_rank = next((i for i, (uid, _) in enumerate(ranking_data, 1) if uid == ctx.author.id), None)
             if my_rank:
-                count = next((c for u, c in ranking_data if u == ctx.author.id), 0)
-                embed.set_footer(text=f"あなたの順位: {my_rank}位 ({count}回)")
+                rank, count = my_rank
+                embed.set_footer(text=f"あなたの順位: {rank}位 ({self._format_count(category, count)})")
             else:
                 embed.set_footer(text="あなたはランク外です")
                 
         await ctx.respond(embed=embed)
 
+    @commands.command(name="statscache")
+    @commands.is_owner()
+    async def stats_cache_info(self, ctx: commands.Context):
+        """統計キャッシュのヒット率とランキングの状態"""
+        m = self.cache.get_metrics()
+        lb = leaderboards.get_metrics()
+        await ctx.send(
+            f"🗃️ 統計キャッシュ\n"
+            f"```yaml\n"
+            f"保持: {m['entries']:,}件 (実行中 {m['inflight']}件, TTL {self.cache.ttl:.0f}秒)\n"
+            f"ヒット率: {m['hit_rate'] * 100:.1f}% "
+            f"(ヒット {m['hits']:,}回 / 実行待ちの共有 {m['shared']:,}回 / ミス {m['misses']:,}回)\n"
+            f"無効化: {m['invalidations']:,}回\n"
+            f"ランキング: {lb['boards']:,}件 / {lb['entries']:,}人 "
+            f"(構築 {lb['rebuild_ms']:.0f}ms, 更新 {lb['updates']:,}回, 参照 {lb['lookups']:,}回)\n"
+            f"30/90日の作り直し: {lb['rollup_rebuilds']:,}回{'' if lb['rollups_current'] else ' (作り直し中、SQLで集計)'}\n"
+            f"```"
+        )
+
     # ==================== ヘルパーメソッド ====================
     
     async def _get_ranking_stats(self, guild_id: int, event_type: str, start_date: str, end_date: str) -> list:
-        """期間内のユーザー別ランキングを取得"""
+        """期間内のユーザー別ランキングを取得（月次/週次ロールアップ + 端の日次のみ読む）"""
         from utils.db_manager import db
-        
-        try:
+
+        async def compute() -> list:
+            plan = plan_range(parse_date(start_date), parse_date(end_date), daily_floor())
+            query, params = build_range_query(
+                plan, "user_statistics", "user_id",
+                "guild_id = ? AND event_type = ?", (guild_id, event_type)
+            )
             rows = await db.fetchall(
-                """
-                SELECT user_id, SUM(count) as total
-                FROM user_statistics
-                WHERE guild_id = ? AND event_type = ? AND date >= ? AND date <= ?
-                GROUP BY user_id
-                ORDER BY total DESC
-                LIMIT 50
-                """,
-                (guild_id, event_type, start_date, end_date)
+                query + " ORDER BY total DESC LIMIT 50",
+                tuple(params),
+                read_only=True
             )
             return [(row[0], row[1]) for row in rows] if rows else []
+        
+        try:
+            return await self.cache.get((guild_id, "ranking", (start_date, end_date), event_type), compute)
         except Exception as e:
             print(f"ランキング取得エラー: {e}")
             return []
 
-    async def _get_stats_for_period(self, guild_id: int, start_date: str, end_date: str) -> dict:
-        """指定期間の統計を取得"""
-        from utils.db_manager import db
-        
+    async def _get_windows(self, guild_id: int, ranges: dict, event_types: Optional[list] = None) -> WindowedStats:
+        """複数の期間の統計を1回の集計で取得（月次/週次ロールアップ + 端の日次のみ読む）"""
+        key = (guild_id, "windows", tuple(ranges.items()), tuple(event_types or ()))
         try:
-            rows = await db.fetchall(
-                """
-                SELECT event_type, SUM(count) as total
-                FROM statistics
-                WHERE guild_id = ? AND date >= ? AND date <= ?
-                GROUP BY event_type
-                """,
-                (guild_id, start_date, end_date)
-            )
-            
-            return {row[0]: row[1] for row in rows} if rows else {}
+            return await self.cache.get(key, lambda: fetch_windows(guild_id, ranges, event_types))
         except Exception as e:
             print(f"統計取得エラー: {e}")
-            return {}
+            return WindowedStats(ranges, {})
     
-    async def _get_daily_stats(self, guild_id: int, start_date: str, end_date: str, event_type: str) -> list:
-        """日別統計を取得"""
-        from utils.db_manager import db
-        
+    async def _get_series(self, guild_id: int, start, end, event_types: list) -> dict:
+        """日別の時系列を種別ごとに取得（記録の無い日は0。期間の終わりは今日なので、サーバー・日ごとにキャッシュされる）"""
+        key = (guild_id, "series", (start, end), tuple(event_types))
         try:
-            rows = await db.fetchall(
-                """
-                SELECT date, count
-                FROM statistics
-                WHERE guild_id = ? AND event_type = ? AND date >= ? AND date <= ?
-                ORDER BY date DESC
-                LIMIT 7
-                """,
-                (guild_id, event_type, start_date, end_date)
-            )
-            
-            return [(row[0], row[1]) for row in rows] if rows else []
+            return await self.cache.get(key, lambda: fetch_series(guild_id, start, end, event_types, bucket=DAY))
         except Exception as e:
             print(f"日別統計取得エラー: {e}")
-            return []
+            return {event_type: TimeSeries.daily(start, end, []) for event_type in event_types}
+    
+    async def _get_heatmap(self, guild_id: int, event_type: str, start_hour: int, end_hour: int, tz) -> list:
+        """曜日×時間帯の集計を取得（時間別の統計から、サーバーのタイムゾーンで振り分け）"""
+        key = (guild_id, "heatmap", (start_hour, end_hour), (event_type, tz.key))
+        try:
+            return await self.cache.get(key, lambda: fetch_heatmap(guild_id, event_type, start_hour, end_hour, tz))
+        except Exception as e:
+            print(f"ヒートマップ取得エラー: {e}")
+            return [[0] * 24 for _ in range(7)]
     
-    def _format_activity_stats(self, stats: dict) -> str:
-        """アクティビティ統計をフォーマット"""
-        messages = stats.get('message_sent', 0)
-        vc_joins = stats.get('vc_join', 0)
-        recruits = stats.get('recruit_created', 0)
-        
-        return f"```yaml\n" \
-               f"💬 メッセージ: {messages:,}件\n" \
-               f"🔊 VC参加: {vc_joins:,}回\n" \
-               f"📣 募集作成: {recruits:,}件\n" \
-               f"```"
+    def _format_minutes(self, minutes: int) -> str:
+        """分を「X時間Y分」に"""
+        hours, rest = divmod(int(minutes), 60)
+        return f"{hours:,}時間{rest}分" if hours else f"{rest}分"
+
+    def _format_count(self, event_type: str, count: int) -> str:
+        """ランキングの値を単位つきで表示"""
+        if event_type == "vc_minutes":
+            return self._format_minutes(count)
+        return f"{count:,}回"
+
+    def _format_activity_stats(
+        self,
+        stats: dict,
+        windows: Optional[WindowedStats] = None,
+        current: Optional[str] = None,
+        previous: Optional[str] = None
+    ) -> str:
+        """アクティビティ統計をフォーマット（比較する期間を渡すと増減率も付ける）"""
+        lines = [
+            ("💬 メッセージ", 'message_sent', "件"),
+            ("🔊 VC参加", 'vc_join', "回"),
+            ("📣 募集作成", 'recruit_created', "件"),
+        ]
+        text = "```yaml\n"
+        for label, event_type, unit in lines:
+            text += f"{label}: {stats.get(event_type, 0):,}{unit}"
+            if windows is not None:
+                _, rate = windows.delta(event_type, current, previous)
+                if rate is not None:
+                    text += f" ({rate:+.0f}%)"
+            text += "\n"
+        return text + "```"
     
-    def _create_bar_graph(self, daily_stats: list, max_width: int = 15) -> str:
-        """簡易バーグラフを作成"""
-        if not daily_stats:
+    def _add_trend_fields(self, embed: discord.Embed, series: TimeSeries, label: str, unit: str):
+        """推移グラフと傾向（直近7日の移動平均・1日あたりの増減）を追加"""
+        graph = series.downsample(bucket_for(len(series)))
+        embed.add_field(
+            name=f"📈 {label}の{BUCKET_LABELS[graph.bucket]}推移",
+            value=f"```\n{self._create_bar_graph(graph, max_width=15)}\n```",
+            inline=False
+        )
+        slope = series.slope()
+        trend = "↗️ 増加" if slope > 0.05 else "↘️ 減少" if slope < -0.05 else "➡️ 横ばい"
+        embed.add_field(
+            name=f"📉 {label}の傾向",
+            value=f"```yaml\n"
+                  f"直近7日の平均: {series.moving_average(7)[-1]:.1f}{unit}/日\n"
+                  f"傾向: {trend} ({slope:+.2f}{unit}/日)\n"
+                  f"```",
+            inline=False
+        )
+
+    def _create_heatmap(self, grid: list) -> str:
+        """7×24 のヒートマップ（行が曜日、列が時刻）"""
+        max_value = max(max(max(row) for row in grid), 1)
+        
+        # 6時間ごとに時刻の目盛り
+        header = [" "] * 24
+        for hour in range(0, 24, 6):
+            for i, char in enumerate(str(hour)):
+                header[hour + i] = char
+        lines = ["   " + "".join(header)]
+        
+        for day, row in enumerate(grid):
+            cells = "".join(
+                HEATMAP_SHADES[min(-(-count * len(HEATMAP_SHADES) // max_value), len(HEATMAP_SHADES)) - 1]
+                if count else "·"
+                for count in row
+            )
+            lines.append(f"{WEEKDAY_NAMES[day]} {cells}")
+        lines.append(f"   ·=0件  {HEATMAP_SHADES} 少→多 (最大 {max_value:,}件)")
+        return "\n".join(lines)
+
+    def _create_bar_graph(self, series: TimeSeries, max_width: int = 15) -> str:
+        """簡易バーグラフを作成（記録の無い区間も0として表示）"""
+        if not len(series):
             return "データなし"
         
-        max_value = max(count for _, count in daily_stats) if daily_stats else 1
-        max_value = max(max_value, 1)  # 0除算防止
+        max_value = max(max(series.values), 1)  # 0除算防止
         
         lines = []
-        for date_str, count in reversed(daily_stats):
-            # 日付を短縮
-            try:
-                date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-                short_date = date_obj.strftime("%m/%d")
-            except:
-                short_date = date_str[-5:]
+        for start, count in series.points():
+            # 日付を短縮（月単位は年/月、週単位は週の開始日）
+            short_date = start.strftime("%Y/%m") if series.bucket == MONTH else start.strftime("%m/%d")
+            if series.bucket == WEEK:
+                short_date += "~"
             
             bar_length = int((count / max_value) * max_width)
             bar = "█" * bar_length + "░" * (max_width - bar_length)
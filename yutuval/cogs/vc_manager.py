@@ -2,10 +2,14 @@ import discord
 from discord.ext import commands, tasks
 from discord.ui import Button, View, Modal, InputText, Select
 from utils.db_manager import db
+from utils.event_bus import VOICE_STATE, VoiceStateEvent, event_bus
 import os
 import asyncio
 from typing import Optional, List
 
+# VCの出入りを処理するワーカー数（パネル更新は Discord API 待ちがあるので並列にする）
+VOICE_EVENT_CONCURRENCY = 4
+
 # --- Modals & Sub-Views ---
 
 class PartyCodeModal(Modal):
@@ -235,9 +239,14 @@ class VCManager(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.cleanup_task.start()
+        event_bus.subscribe(
+            VOICE_STATE, "vc_manager", self._on_voice_state,
+            concurrency=VOICE_EVENT_CONCURRENCY, key=lambda event: event.key
+        )
     
     def cog_unload(self):
         self.cleanup_task.cancel()
+        event_bus.unsubscribe_nowait("vc_manager")
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -303,22 +312,22 @@ class VCManager(commands.Cog):
         # update panel to show new member if they joined
         await update_vc_panel(self.bot, vc_id)
 
-    @commands.Cog.listener()
-    async def on_voice_state_update(self, member, before, after):
+    async def _on_voice_state(self, event: VoiceStateEvent):
+        """VCの出入り（イベントバスの購読者。チャンネルが変わった更新だけが届く）"""
         # 退出時の処理
-        if before.channel:
-            row = await db.fetchrow("SELECT vc_id FROM active_vcs WHERE vc_id = ?", (before.channel.id,))
+        if event.before:
+            row = await db.fetchrow("SELECT vc_id FROM active_vcs WHERE vc_id = ?", (event.before.id,))
             if row:
-                if len(before.channel.members) == 0:
-                    self.bot.loop.create_task(self.schedule_vc_deletion(before.channel.id))
+                if len(event.before.members) == 0:
+                    self.bot.loop.create_task(self.schedule_vc_deletion(event.before.id))
                 else:
-                    await update_vc_panel(self.bot, before.channel.id)
+                    await update_vc_panel(self.bot, event.before.id)
 
         # 参加時の処理
-        if after.channel:
-            row = await db.fetchrow("SELECT vc_id FROM active_vcs WHERE vc_id = ?", (after.channel.id,))
+        if event.after:
+            row = await db.fetchrow("SELECT vc_id FROM active_vcs WHERE vc_id = ?", (event.after.id,))
             if row:
-                await update_vc_panel(self.bot, after.channel.id)
+                await update_vc_panel(self.bot, event.after.id)
 
     @discord.slash_command(name="moveall", description="現在のVCのメンバー全員を指定したVCに移動します（管理者のみ）")
     @commands.has_permissions(administrator=True)
@@ -4,6 +4,14 @@ import asyncio
 from discord.ext import commands
 from dotenv import load_dotenv
 from utils.db_manager import db
+from utils.audit_log import audit_log
+from utils.event_bus import VOICE_STATE, VoiceStateEvent, event_bus
+from utils.log_dispatcher import log_dispatcher
+from utils.stats_buffer import stats_buffer
+from utils.guild_config import guild_configs
+from utils.leaderboards import leaderboards
+from utils.log_routes import log_routes
+from utils.voice_sessions import voice_sessions
 
 load_dotenv()
 
@@ -23,15 +31,24 @@ class ValorantBot(commands.Bot):
         super().__init__(
             command_prefix="!",
             intents=intents,
-            help_command=None
+            help_command=None,
+            # 削除・編集ログは Logger のキャッシュと raw イベントで拾うので、py-cord 側は最小限でよい
+            max_messages=100
             # debug_guilds=DEBUG_GUILDS # コンストラクタでの指定を廃止し、on_readyで手動同期する
         )
         self.synced = False  # 同期済みフラグ
+        self.started = False  # DB接続・バックグラウンド処理の開始済みフラグ
 
     async def on_ready(self):
         # Prevent multiple executions
-        if self.synced:
+        if self.started:
+            # 再接続時は、切断中に見逃したVCの出入りを現在の状態で補正する
+            voice_sessions.rebuild(self.guilds)
+            # 起動時のコマンド同期に失敗していれば、同期だけやり直す
+            if not self.synced:
+                await self._sync_commands()
             return
+        self.started = True
 
         print("=" * 50)
         print("🚀 Bot起動処理を開始...")
@@ -40,6 +57,22 @@ class ValorantBot(commands.Bot):
         # Database connection
         await db.connect()
         print("✅ データベース接続完了")
+
+        # サーバー設定をメモリに一括読み込み
+        await guild_configs.load_all()
+        await log_routes.load_all()
+        # ランキングは統計のフラッシュで更新するので、フラッシュ開始前に作り直す
+        await leaderboards.load_all()
+
+        # 統計カウンタの定期フラッシュを開始
+        stats_buffer.start()
+        audit_log.start()
+
+        # 現在VCにいるメンバーから滞在時間の計測を再開
+        voice_sessions.start(self.guilds)
+
+        # 前回送れなかったログを読み込んでからログ送信を開始
+        await log_dispatcher.start(self)
         
         # Load extensions
         loaded_cogs = []
@@ -57,7 +90,26 @@ class ValorantBot(commands.Bot):
         
         print(f"\n📦 ロード済みCog: {', '.join(loaded_cogs)}")
         
-        # Sync commands
+        await self._sync_commands()
+
+        print("\n" + "=" * 50)
+        print(f"✅ ログイン成功!")
+        print(f"👤 Bot名: {self.user}")
+        print(f"🆔 Bot ID: {self.user.id}")
+        print(f"🖥️ 参加サーバー数: {len(self.guilds)}")
+        
+        if self.guilds:
+            print(f"\n📡 参加中のサーバー:")
+            for guild in self.guilds:
+                print(f"  - {guild.name} (ID: {guild.id})")
+        
+        print("=" * 50)
+        print("✨ Botは正常に動作しています！")
+        print("💡 スラッシュコマンドが表示されない場合は、チャンネルで !sync と入力してください")
+        print("=" * 50 + "\n")
+
+    async def _sync_commands(self):
+        """スラッシュコマンドを同期（成功したら synced を立てる）"""
         try:
             if GUILD_ID:
                 guild = discord.Object(id=int(GUILD_ID))
@@ -83,21 +135,11 @@ class ValorantBot(commands.Bot):
             import traceback
             traceback.print_exc()
 
-        print("\n" + "=" * 50)
-        print(f"✅ ログイン成功!")
-        print(f"👤 Bot名: {self.user}")
-        print(f"🆔 Bot ID: {self.user.id}")
-        print(f"🖥️ 参加サーバー数: {len(self.guilds)}")
-        
-        if self.guilds:
-            print(f"\n📡 参加中のサーバー:")
-            for guild in self.guilds:
-                print(f"  - {guild.name} (ID: {guild.id})")
-        
-        print("=" * 50)
-        print("✨ Botは正常に動作しています！")
-        print("💡 スラッシュコマンドが表示されない場合は、チャンネルで !sync と入力してください")
-        print("=" * 50 + "\n")
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        """VCの出入りはイベントバスに積むだけ（ログ・VC管理・統計はそれぞれのワーカーで処理）"""
+        # ミュート切り替えなど、チャンネルが変わらない更新はどの購読者も使わない
+        if before.channel != after.channel:
+            event_bus.publish(VOICE_STATE, VoiceStateEvent(member, before.channel, after.channel))
 
     async def on_application_command_error(self, ctx: discord.ApplicationContext, error):
         """グローバルエラーハンドラ"""
@@ -124,6 +166,12 @@ class ValorantBot(commands.Bot):
                 pass
 
     async def close(self):
+        # 未書き込みの統計・監査ログと未送信のログを書き出してから切断
+        await event_bus.stop()
+        await voice_sessions.stop()
+        await stats_buffer.stop()
+        await audit_log.stop()
+        await log_dispatcher.stop()
         await db.close()
         await super().close()
 
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Bot と同じく yutuval/ を基準に utils・cogs を import する
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,107 @@
+import asyncio
+import sqlite3
+
+from utils.db_manager import DBManager
+from utils.migrations import MIGRATIONS
+
+LATEST = max(version for version, *_ in MIGRATIONS)
+
+
+def _run(tmp_path, scenario):
+    async def run():
+        db = DBManager()
+        db.db_path = str(tmp_path / "bot_data.db")
+        await db.connect()
+        try:
+            return await scenario(db)
+        finally:
+            await db.close()
+    return asyncio.run(run())
+
+
+async def _read_during_transaction(db, **kwargs):
+    """トランザクションの途中で別タスクから読む"""
+    entered = asyncio.Event()
+    release = asyncio.Event()
+
+    async def writer():
+        async with db.transaction() as tx:
+            await tx.execute("INSERT INTO server_config (guild_id) VALUES (1)")
+            entered.set()
+            await release.wait()
+
+    task = asyncio.create_task(writer())
+    await entered.wait()
+    read = asyncio.create_task(db.fetchrow("SELECT COUNT(*) FROM server_config WHERE guild_id = 1", **kwargs))
+    for _ in range(10):
+        await asyncio.sleep(0)
+    finished_early = read.done()
+    release.set()
+    await task
+    return finished_early, (await read)[0]
+
+
+def test_writer_read_waits_for_open_transaction(tmp_path):
+    finished_early, count = _run(tmp_path, _read_during_transaction)
+    # コミット前の行は見えず、コミット後に読む
+    assert not finished_early
+    assert count == 1
+
+
+def test_read_only_does_not_see_uncommitted_rows(tmp_path):
+    async def scenario(db):
+        entered = asyncio.Event()
+        release = asyncio.Event()
+
+        async def writer():
+            async with db.transaction() as tx:
+                await tx.execute("INSERT INTO server_config (guild_id) VALUES (1)")
+                entered.set()
+                await release.wait()
+
+        task = asyncio.create_task(writer())
+        await entered.wait()
+        row = await db.fetchrow("SELECT COUNT(*) FROM server_config WHERE guild_id = 1", read_only=True)
+        release.set()
+        await task
+        return row[0]
+
+    assert _run(tmp_path, scenario) == 0
+
+
+def test_connect_is_idempotent(tmp_path):
+    async def scenario(db):
+        connection = db.connection
+        await db.connect()
+        return connection is db.connection, len(db._reader_connections)
+
+    same, readers = _run(tmp_path, scenario)
+    assert same
+    assert readers == 3
+
+
+def test_replace_database_migrates_before_releasing_the_lock(tmp_path):
+    source = tmp_path / "source.db"
+    conn = sqlite3.connect(source)
+    conn.execute("CREATE TABLE server_config (guild_id INTEGER PRIMARY KEY, rank_emojis TEXT)")
+    conn.execute("INSERT INTO server_config (guild_id) VALUES (42)")
+    conn.commit()
+    conn.close()
+
+    async def scenario(db):
+        restore = asyncio.create_task(db.replace_database(str(source)))
+        await asyncio.sleep(0)
+        # 差し替え中に来た読み書きは、移行済みの新しいDBで実行される
+        write = asyncio.create_task(db.execute("INSERT INTO server_config (guild_id, timezone) VALUES (7, 'Asia/Tokyo')"))
+        read = asyncio.create_task(db.fetchall("SELECT guild_id FROM server_config ORDER BY guild_id"))
+        await restore
+        await write
+        pooled = await db.fetchall("SELECT guild_id FROM server_config ORDER BY guild_id", read_only=True)
+        version = await db.fetchrow("PRAGMA user_version")
+        return (await read), pooled, version[0]
+
+    rows, pooled, version = _run(tmp_path, scenario)
+    # timezone 列は移行で追加されるので、書き込みが通れば移行後に実行されている
+    assert (42,) in rows
+    assert pooled == [(7,), (42,)]
+    assert version == LATEST
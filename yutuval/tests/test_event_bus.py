@@ -0,0 +1,105 @@
+import asyncio
+import random
+
+import pytest
+
+from utils.event_bus import DEFAULT_CAPACITY, EventBus, queue_capacity
+
+
+@pytest.mark.parametrize("value, capacity", [
+    ("50", 50),
+    ("", DEFAULT_CAPACITY),
+    ("abc", DEFAULT_CAPACITY),
+    ("0", 1),
+    ("-5", 1),
+])
+def test_queue_capacity_falls_back_and_clamps(monkeypatch, value, capacity):
+    monkeypatch.setenv("EVENT_BUS_QUEUE_SIZE", value)
+    assert queue_capacity() == capacity
+
+
+def test_queue_capacity_default(monkeypatch):
+    monkeypatch.delenv("EVENT_BUS_QUEUE_SIZE", raising=False)
+    assert queue_capacity() == DEFAULT_CAPACITY
+
+
+def test_full_queue_drops_and_counts():
+    async def run():
+        bus = EventBus()
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(event):
+            await release.wait()
+            handled.append(event)
+
+        bus.subscribe("topic", "slow", handler, capacity=2)
+        # ワーカーが動く前に積むので、上限の2件だけ入る
+        accepted = [bus.publish("topic", i) for i in range(5)]
+        release.set()
+        while len(handled) < 2:
+            await asyncio.sleep(0.001)
+        metrics = bus.get_metrics()["slow"]
+        await bus.stop()
+        return accepted, handled, metrics
+
+    accepted, handled, metrics = asyncio.run(run())
+    assert accepted == [1, 1, 0, 0, 0]
+    assert handled == [0, 1]
+    assert metrics["dropped"] == 3
+    assert metrics["published"] == 2
+    assert metrics["processed"] == 2
+
+
+def test_same_key_is_processed_in_order_across_workers():
+    async def run():
+        bus = EventBus()
+        handled = {}
+        rng = random.Random(0)
+
+        async def handler(event):
+            key, index = event
+            # 処理時間がばらついても、同じキーは追い越さない
+            await asyncio.sleep(rng.random() * 0.002)
+            handled.setdefault(key, []).append(index)
+
+        bus.subscribe("topic", "sharded", handler, concurrency=4, capacity=400, key=lambda event: event[0])
+        for index in range(30):
+            for key in range(6):
+                bus.publish("topic", (key, index))
+        while sum(len(v) for v in handled.values()) < 180:
+            await asyncio.sleep(0.001)
+        await bus.stop()
+        return handled
+
+    handled = asyncio.run(run())
+    assert handled == {key: list(range(30)) for key in range(6)}
+
+
+def test_lag_and_errors_are_recorded():
+    async def run():
+        bus = EventBus()
+        done = []
+
+        async def handler(event):
+            await asyncio.sleep(0.05)
+            done.append(event)
+            if event == 0:
+                raise RuntimeError("boom")
+
+        bus.subscribe("topic", "lagging", handler)
+        bus.publish("topic", 0)
+        bus.publish("topic", 1)
+        while len(done) < 2:
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0)
+        metrics = bus.get_metrics()["lagging"]
+        await bus.stop()
+        return metrics
+
+    metrics = asyncio.run(run())
+    # 2件目は1件目の処理（50ms）を待ってから取り出される
+    assert metrics["max_lag_ms"] >= 45
+    assert metrics["errors"] == 1
+    assert metrics["processed"] == 1
+    assert metrics["depth"] == 0
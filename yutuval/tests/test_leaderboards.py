@@ -0,0 +1,204 @@
+import asyncio
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from utils import leaderboards as leaderboards_module
+from utils import stats_buffer as stats_buffer_module
+from utils.db_manager import DBManager
+from utils.leaderboards import LeaderboardIndex, _Board, _EventBoards, _RankedKeys
+from utils.stats_buffer import StatsBuffer
+
+GUILD_ID = 1
+EVENT = "message_sent"
+TODAY = date(2024, 3, 20)
+
+
+def _day(offset: int, today: date = TODAY) -> str:
+    return (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+# ==================== 順位付きリスト ====================
+
+def test_ranked_keys_match_a_sorted_list(monkeypatch):
+    # バケットの分割・削除が起きるよう小さくする
+    monkeypatch.setattr(leaderboards_module, "BUCKET_LOAD", 4)
+    rng = random.Random(0)
+    keys = _RankedKeys()
+    expected = []
+    for _ in range(2000):
+        if expected and rng.random() < 0.45:
+            key = rng.choice(expected)
+            expected.remove(key)
+            keys.remove(key)
+        else:
+            key = (rng.randint(-50, 0), rng.randint(0, 10_000))
+            if key in expected:
+                continue
+            expected.append(key)
+            keys.insert(key)
+        expected.sort()
+
+    assert len(keys) == len(expected)
+    assert keys.head(len(expected) + 5) == expected
+    assert all(keys.index(key) == i for i, key in enumerate(expected))
+
+
+def test_ranked_keys_built_from_sorted_keys(monkeypatch):
+    monkeypatch.setattr(leaderboards_module, "BUCKET_LOAD", 3)
+    keys = _RankedKeys([(i,) for i in range(10)])
+    assert len(keys.buckets) == 4
+    assert keys.index((7,)) == 7
+    keys.remove((0,))
+    keys.remove((1,))
+    keys.remove((2,))
+    assert len(keys.buckets) == 3
+    assert keys.index((7,)) == 4
+    assert keys.head(3) == [(3,), (4,), (5,)]
+
+
+# ==================== ランキング ====================
+
+def test_board_orders_by_total_then_user_id():
+    board = _Board()
+    board.add(30, 5)
+    board.add(10, 5)
+    board.add(20, 8)
+    assert board.top(10) == [(20, 8), (10, 5), (30, 5)]
+    assert board.rank(30) == (3, 5)
+
+    board.add(30, 4)
+    assert board.top(2) == [(30, 9), (20, 8)]
+    assert board.rank(10) == (3, 5)
+
+    # 0 になったら外れる
+    board.add(20, -8)
+    assert board.rank(20) is None
+    assert board.top(10) == [(30, 9), (10, 5)]
+
+
+def test_sliding_windows_drop_days_that_leave_the_window():
+    boards = _EventBoards()
+    boards.add(_day(0), 1, 3, TODAY)
+    boards.add(_day(1), 2, 4, TODAY)
+    boards.add(_day(7), 3, 5, TODAY)
+    assert boards.boards[1].top(10) == [(2, 4), (1, 3)]
+    assert boards.boards[7].top(10) == [(3, 5), (2, 4), (1, 3)]
+
+    tomorrow = TODAY + timedelta(days=1)
+    boards.slide(TODAY, tomorrow)
+    assert boards.boards[1].top(10) == [(1, 3)]
+    assert boards.boards[7].top(10) == [(2, 4), (1, 3)]
+    # 7日より前の明細は捨てる
+    assert _day(7) not in boards.days
+
+
+# ==================== DBからの構築 ====================
+
+# (日付のずれ, user_id, 件数)
+HISTORY = [
+    (0, 1, 5),
+    (1, 2, 4),
+    (3, 2, 3),
+    (7, 3, 6),
+    (8, 4, 9),
+    (20, 5, 10),
+    (30, 6, 2),
+    (31, 7, 50),
+    (45, 1, 20),
+    (89, 8, 11),
+    (90, 9, 12),
+    (91, 10, 100),
+]
+
+
+def _expected(window: int, today: date, history) -> list:
+    totals = {}
+    for offset, user_id, count in history:
+        day = today - timedelta(days=offset)
+        if today - timedelta(days=window) <= day <= today:
+            totals[user_id] = totals.get(user_id, 0) + count
+    return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """一時DBと専用の StatsBuffer でランキングを動かす（今日は TODAY に固定）"""
+    today = {"value": TODAY}
+    monkeypatch.setattr(leaderboards_module, "_today", lambda: today["value"])
+
+    def runner(scenario):
+        async def main():
+            db = DBManager()
+            db.db_path = str(tmp_path / "bot_data.db")
+            await db.connect()
+            buffer = StatsBuffer()
+            monkeypatch.setattr(stats_buffer_module, "db", db)
+            monkeypatch.setattr(leaderboards_module, "db", db)
+            monkeypatch.setattr(leaderboards_module, "stats_buffer", buffer)
+            try:
+                return await scenario(buffer, today)
+            finally:
+                await db.close()
+        return asyncio.run(main())
+    return runner
+
+
+async def _write_history(buffer: StatsBuffer, history):
+    for offset, user_id, count in history:
+        buffer.add(GUILD_ID, EVENT, count, user_id=user_id, day=_day(offset))
+    await buffer.flush()
+
+
+def test_load_all_matches_sql_totals_for_every_window(run):
+    async def scenario(buffer, today):
+        await _write_history(buffer, HISTORY)
+        index = LeaderboardIndex()
+        await index.load_all()
+        return {window: index.top(GUILD_ID, EVENT, window, 20) for window in (1, 7, 30, 90)}
+
+    tops = run(scenario)
+    for window, top in tops.items():
+        assert top == _expected(window, TODAY, HISTORY), window
+
+
+def test_flushes_update_every_window(run):
+    async def scenario(buffer, today):
+        await _write_history(buffer, HISTORY)
+        index = LeaderboardIndex()
+        await index.load_all()
+        await _write_history(buffer, [(0, 8, 40), (2, 3, 1)])
+        return {window: index.top(GUILD_ID, EVENT, window, 20) for window in (1, 7, 30, 90)}, index.rank(GUILD_ID, EVENT, 90, 8)
+
+    tops, rank = run(scenario)
+    history = HISTORY + [(0, 8, 40), (2, 3, 1)]
+    for window, top in tops.items():
+        assert top == _expected(window, TODAY, history), window
+    assert rank == (1, 51)
+
+
+def test_day_change_slides_short_windows_and_rebuilds_long_ones(run):
+    async def scenario(buffer, today):
+        await _write_history(buffer, HISTORY)
+        index = LeaderboardIndex()
+        await index.load_all()
+
+        today["value"] = TODAY + timedelta(days=1)
+        # 長い期間は作り直しが終わるまでSQLに任せる
+        stale = index.supports(EVENT, 30), index.supports(EVENT, 7)
+        # 作り直しの途中に届いたフラッシュも二重に数えない
+        buffer.add(GUILD_ID, EVENT, 7, user_id=9, day=_day(0, today["value"]))
+        flush = asyncio.create_task(buffer.flush())
+        await index._rollup_task
+        await flush
+        current = index.supports(EVENT, 30)
+        return stale, current, {window: index.top(GUILD_ID, EVENT, window, 20) for window in (1, 7, 30, 90)}
+
+    stale, current, tops = run(scenario)
+    assert stale == (False, True)
+    assert current
+    tomorrow = TODAY + timedelta(days=1)
+    history = [(offset + 1, user_id, count) for offset, user_id, count in HISTORY] + [(0, 9, 7)]
+    for window, top in tops.items():
+        assert top == _expected(window, tomorrow, history), window
@@ -0,0 +1,252 @@
+import asyncio
+import time
+
+import discord
+import pytest
+
+from utils import log_dispatcher as dispatcher_module
+from utils import log_outbox
+from utils.db_manager import DBManager
+from utils.log_dispatcher import LogDispatcher
+from utils.webhook_sink import WebhookSink
+
+
+class _Response:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "error"
+
+
+class _Channel:
+    """channel.send だけを持つ送信先。failures に積んだ例外を先頭から1回ずつ投げる"""
+
+    def __init__(self, channel_id: int = 100):
+        self.id = channel_id
+        self.sent = []
+        self.attempts = []
+        self.failures = []
+
+    async def send(self, embeds):
+        self.attempts.append(time.perf_counter())
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append([embed.title for embed in embeds])
+
+
+class _Bot:
+    def __init__(self, *channels):
+        self.channels = {channel.id: channel for channel in channels}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+
+def _embed(i: int, description: str = "") -> discord.Embed:
+    return discord.Embed(title=f"e{i}", description=description or None)
+
+
+async def _until(condition, timeout: float = 2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "タイムアウト"
+        await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """一時DBで LogDispatcher を動かす（Webhook は使わず channel.send で送る）"""
+    monkeypatch.setattr(dispatcher_module, "RETRY_BASE", 0.02)
+
+    def runner(scenario):
+        async def main():
+            db = DBManager()
+            db.db_path = str(tmp_path / "bot_data.db")
+            await db.connect()
+            monkeypatch.setattr(log_outbox, "db", db)
+            try:
+                return await scenario(db)
+            finally:
+                await db.close()
+        return asyncio.run(main())
+    return runner
+
+
+def _dispatcher() -> LogDispatcher:
+    dispatcher = LogDispatcher(flush_window=0.02)
+    dispatcher.sink = WebhookSink(enabled=False)
+    return dispatcher
+
+
+def test_embeds_in_one_window_are_sent_as_one_message(run):
+    channel = _Channel()
+
+    async def scenario(db):
+        dispatcher = _dispatcher()
+        await dispatcher.start(_Bot(channel))
+        for i in range(3):
+            dispatcher.enqueue(channel, _embed(i))
+        await _until(lambda: dispatcher.queue_depth() == 0)
+        await dispatcher.stop()
+        return dispatcher
+
+    dispatcher = run(scenario)
+    assert channel.sent == [["e0", "e1", "e2"]]
+    assert dispatcher.messages_sent == 1
+    assert dispatcher.embeds_sent == 3
+
+
+def test_batches_are_split_at_ten_embeds_in_order(run):
+    channel = _Channel()
+
+    async def scenario(db):
+        dispatcher = _dispatcher()
+        for i in range(25):
+            dispatcher.enqueue(channel, _embed(i))
+        await dispatcher.start(_Bot(channel))
+        await _until(lambda: dispatcher.queue_depth() == 0)
+        await dispatcher.stop()
+
+    run(scenario)
+    assert [len(message) for message in channel.sent] == [10, 10, 5]
+    assert [title for message in channel.sent for title in message] == [f"e{i}" for i in range(25)]
+
+
+def test_batches_are_split_at_6000_characters(run):
+    channel = _Channel()
+
+    async def scenario(db):
+        dispatcher = _dispatcher()
+        for i in range(5):
+            dispatcher.enqueue(channel, _embed(i, "x" * 2500))
+        await dispatcher.start(_Bot(channel))
+        await _until(lambda: dispatcher.queue_depth() == 0)
+        await dispatcher.stop()
+
+    run(scenario)
+    assert channel.sent == [["e0", "e1"], ["e2", "e3"], ["e4"]]
+
+
+def test_retryable_errors_back_off_and_keep_order(run):
+    channel = _Channel()
+    channel.failures = [
+        discord.HTTPException(_Response(503), "unavailable"),
+        discord.HTTPException(_Response(429), "rate limited"),
+    ]
+
+    async def scenario(db):
+        dispatcher = _dispatcher()
+        await dispatcher.start(_Bot(channel))
+        for i in range(3):
+            dispatcher.enqueue(channel, _embed(i))
+        await _until(lambda: dispatcher.queue_depth() == 0)
+        # 再試行中に受け付けた分は後ろに並ぶ
+        dispatcher.enqueue(channel, _embed(3))
+        await _until(lambda: dispatcher.queue_depth() == 0)
+        await dispatcher.stop()
+        return dispatcher
+
+    dispatcher = run(scenario)
+    assert channel.sent == [["e0", "e1", "e2"], ["e3"]]
+    assert dispatcher.retries == 2
+    assert dispatcher.dropped == 0
+    # 再試行の間隔は RETRY_BASE から倍々になる
+    first_gap = channel.attempts[1] - channel.attempts[0]
+    second_gap = channel.attempts[2] - channel.attempts[1]
+    assert first_gap >= 0.02
+    assert second_gap >= 0.04
+
+
+def test_non_retryable_error_drops_only_that_batch(run):
+    channel = _Channel()
+    channel.failures = [discord.HTTPException(_Response(403), "missing permissions")]
+
+    async def scenario(db):
+        dispatcher = _dispatcher()
+        for i in range(12):
+            dispatcher.enqueue(channel, _embed(i))
+        await dispatcher.start(_Bot(channel))
+        await _until(lambda: dispatcher.queue_depth() == 0)
+        await dispatcher.stop()
+        remaining = await db.fetchrow("SELECT COUNT(*) FROM log_outbox")
+        return dispatcher, remaining[0]
+
+    dispatcher, remaining = run(scenario)
+    assert channel.sent == [["e10", "e11"]]
+    assert dispatcher.dropped == 10
+    assert dispatcher.retries == 0
+    # 捨てた分も送信済みとして ack され、再送されない
+    assert remaining == 0
+
+
+def test_unsent_logs_are_replayed_after_restart(run):
+    channel = _Channel()
+    channel.failures = [OSError("network down")] * 2
+
+    async def scenario(db):
+        first = _dispatcher()
+        await first.start(_Bot(channel))
+        first.enqueue(channel, _embed(0))
+        first.enqueue(channel, _embed(1))
+        await _until(lambda: channel.attempts)
+        # 再試行待ちの間に止める（stop() でも送れなければ次回に回る）
+        await first.stop()
+        assert channel.sent == []
+
+        second = _dispatcher()
+        await second.start(_Bot(channel))
+        await _until(lambda: second.queue_depth() == 0)
+        await second.stop()
+        return second
+
+    second = run(scenario)
+    assert channel.sent == [["e0", "e1"]]
+    assert second.replayed == 2
+
+
+def _sent_titles(channel) -> list:
+    return [title for message in channel.sent for title in message]
+
+
+def test_overflow_is_shed_to_outbox_and_read_back_in_order(run, monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "MAX_QUEUED_PER_CHANNEL", 5)
+    channel = _Channel()
+
+    async def scenario(db):
+        dispatcher = _dispatcher()
+        await dispatcher.start(_Bot(channel))
+        for i in range(23):
+            dispatcher.enqueue(channel, _embed(i))
+        depth = dispatcher.queue_depth()
+        await _until(lambda: len(_sent_titles(channel)) == 23)
+        await dispatcher.stop()
+        remaining = await db.fetchrow("SELECT COUNT(*) FROM log_outbox")
+        return dispatcher, depth, remaining[0]
+
+    dispatcher, depth, remaining = run(scenario)
+    assert depth == 5
+    assert dispatcher.shed == 18
+    assert _sent_titles(channel) == [f"e{i}" for i in range(23)]
+    assert remaining == 0
+
+
+def test_replay_is_capped_and_read_back_in_order(run, monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "MAX_QUEUED_PER_CHANNEL", 5)
+    channel = _Channel()
+
+    async def scenario(db):
+        first = _dispatcher()
+        for i in range(12):
+            first.enqueue(channel, _embed(i))
+        # 送信を始めずに止める（全件がアウトボックスに残る）
+        await first.outbox.stop()
+
+        second = _dispatcher()
+        second.enqueue(channel, _embed(12))
+        await second.start(_Bot(channel))
+        depth = second.queue_depth()
+        await _until(lambda: len(_sent_titles(channel)) == 13)
+        await second.stop()
+        return depth
+
+    assert run(scenario) == 5
+    assert _sent_titles(channel) == [f"e{i}" for i in range(13)]
@@ -0,0 +1,128 @@
+import random
+
+from utils.message_cache import RECORD_OVERHEAD, CachedMessage, MessageCache
+
+
+def _record(message_id: int, guild_id: int, length: int = 10) -> CachedMessage:
+    return CachedMessage(message_id, guild_id, 100 + guild_id, 1000 + message_id, "x" * length, float(message_id))
+
+
+def _ids(cache: MessageCache) -> list:
+    return list(cache._messages)
+
+
+def _check_accounting(cache: MessageCache):
+    records = list(cache._messages.values())
+    assert cache.total_bytes == sum(record.size for record in records)
+    for guild_id, order in cache._guilds.items():
+        assert order
+        assert cache._guild_bytes[guild_id] == sum(cache._messages[message_id].size for message_id in order)
+    assert sum(len(order) for order in cache._guilds.values()) == len(records)
+
+
+def test_guild_budget_evicts_only_that_guilds_oldest():
+    size = RECORD_OVERHEAD + 10
+    cache = MessageCache(max_guild_bytes=size * 3, max_total_bytes=size * 100)
+    for message_id in range(3):
+        cache.put(_record(message_id, guild_id=1))
+    cache.put(_record(100, guild_id=2))
+    cache.put(_record(3, guild_id=1))
+
+    assert _ids(cache) == [1, 2, 100, 3]
+    assert cache.evictions == 1
+    _check_accounting(cache)
+
+
+def test_total_budget_evicts_globally_oldest():
+    size = RECORD_OVERHEAD + 10
+    cache = MessageCache(max_guild_bytes=size * 100, max_total_bytes=size * 3)
+    cache.put(_record(1, guild_id=1))
+    cache.put(_record(2, guild_id=2))
+    cache.put(_record(3, guild_id=1))
+    cache.put(_record(4, guild_id=3))
+
+    assert _ids(cache) == [2, 3, 4]
+    _check_accounting(cache)
+
+
+def test_get_refreshes_recency():
+    size = RECORD_OVERHEAD + 10
+    cache = MessageCache(max_guild_bytes=size * 2, max_total_bytes=size * 100)
+    cache.put(_record(1, guild_id=1))
+    cache.put(_record(2, guild_id=1))
+    assert cache.get(1).id == 1
+    cache.put(_record(3, guild_id=1))
+
+    assert _ids(cache) == [1, 3]
+
+
+def test_oversized_record_is_kept_alone():
+    cache = MessageCache(max_guild_bytes=RECORD_OVERHEAD, max_total_bytes=RECORD_OVERHEAD)
+    cache.put(_record(1, guild_id=1, length=5000))
+    assert _ids(cache) == [1]
+    cache.put(_record(2, guild_id=1, length=5000))
+    assert _ids(cache) == [2]
+    _check_accounting(cache)
+
+
+def test_update_content_returns_previous_and_resizes():
+    cache = MessageCache()
+    cache.put(_record(1, guild_id=1, length=10))
+    previous = cache.update_content(1, "y" * 500, edited_at=5.0)
+
+    assert previous.content == "x" * 10
+    assert cache.get(1).content == "y" * 500
+    assert cache.total_bytes == RECORD_OVERHEAD + 500
+    assert cache.update_content(999, "z") is None
+
+
+def test_pop_is_not_an_eviction_and_drops_empty_guilds():
+    cache = MessageCache()
+    cache.put(_record(1, guild_id=1))
+    assert cache.pop(1).id == 1
+    assert cache.pop(1) is None
+
+    assert len(cache) == 0 and cache.total_bytes == 0
+    assert cache.evictions == 0
+    assert not cache._guilds and not cache._guild_bytes
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_random_operations_match_reference_lru():
+    """追加・参照・削除を乱数で繰り返し、素朴なLRUと同じものが残ることを確かめる"""
+    rng = random.Random(1)
+    max_guild, max_total = 3000, 7000
+    cache = MessageCache(max_guild_bytes=max_guild, max_total_bytes=max_total)
+    reference = []  # (message_id, guild_id, size) の古い順
+
+    def guild_bytes(guild_id):
+        return sum(size for _, g, size in reference if g == guild_id)
+
+    for step in range(5000):
+        op = rng.random()
+        message_id = rng.randrange(300)
+        if op < 0.6:
+            record = _record(message_id, rng.randrange(4), rng.randrange(0, 800))
+            cache.put(record)
+            reference[:] = [entry for entry in reference if entry[0] != message_id]
+            reference.append((record.id, record.guild_id, record.size))
+            while guild_bytes(record.guild_id) > max_guild and sum(g == record.guild_id for _, g, _ in reference) > 1:
+                reference.remove(next(entry for entry in reference if entry[1] == record.guild_id))
+            while sum(size for *_, size in reference) > max_total and len(reference) > 1:
+                reference.pop(0)
+        elif op < 0.8:
+            found = cache.get(message_id)
+            entry = next((entry for entry in reference if entry[0] == message_id), None)
+            assert (found is None) == (entry is None)
+            if entry:
+                reference.remove(entry)
+                reference.append(entry)
+        else:
+            found = cache.pop(message_id)
+            entry = next((entry for entry in reference if entry[0] == message_id), None)
+            assert (found is None) == (entry is None)
+            if entry:
+                reference.remove(entry)
+
+        assert _ids(cache) == [entry[0] for entry in reference], step
+    _check_accounting(cache)
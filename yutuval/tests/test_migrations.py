@@ -0,0 +1,115 @@
+import asyncio
+import json
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from utils.db_manager import DBManager
+from utils.migrations import MIGRATIONS
+
+BASELINE_DB = Path(__file__).resolve().parent.parent / "database" / "bot_data.db"
+LATEST = max(version for version, *_ in MIGRATIONS)
+
+
+def _dump(path) -> dict:
+    """全テーブルの定義と中身（FTSの内部テーブルは除く）"""
+    conn = sqlite3.connect(path)
+    try:
+        tables = [
+            (name, sql) for name, sql in conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'audit_log_fts%' ORDER BY name"
+            )
+        ]
+        return {
+            "user_version": conn.execute("PRAGMA user_version").fetchone()[0],
+            "indexes": sorted(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")),
+            "tables": {
+                name: (sql, sorted(conn.execute(f"SELECT * FROM {name}").fetchall(), key=repr))
+                for name, sql in tables
+            },
+        }
+    finally:
+        conn.close()
+
+
+def _connect(path) -> None:
+    async def run():
+        db = DBManager()
+        db.db_path = str(path)
+        await db.connect()
+        await db.close()
+    asyncio.run(run())
+
+
+def _set_user_version(path, version: int):
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def baseline_copy(tmp_path):
+    path = tmp_path / "bot_data.db"
+    shutil.copyfile(BASELINE_DB, path)
+    return path
+
+
+def test_baseline_is_migrated_to_latest_without_losing_rows(baseline_copy):
+    before = _dump(baseline_copy)
+    _connect(baseline_copy)
+    after = _dump(baseline_copy)
+
+    assert after["user_version"] == LATEST
+    for table in ("recruitments", "server_config", "statistics", "active_vcs"):
+        assert len(after["tables"][table][1]) == len(before["tables"][table][1])
+
+
+def test_backfills_match_source_tables(baseline_copy):
+    _connect(baseline_copy)
+    conn = sqlite3.connect(baseline_copy)
+    try:
+        expected = set()
+        for message_id, joined in conn.execute("SELECT message_id, joined_members FROM recruitments WHERE joined_members IS NOT NULL"):
+            expected.update((message_id, int(user_id)) for user_id in json.loads(joined or "[]"))
+        assert set(conn.execute("SELECT message_id, user_id FROM recruitment_members")) == expected
+
+        daily = conn.execute("SELECT COALESCE(SUM(count), 0) FROM statistics").fetchone()[0]
+        for table in ("statistics_weekly", "statistics_monthly"):
+            assert conn.execute(f"SELECT COALESCE(SUM(count), 0) FROM {table}").fetchone()[0] == daily
+    finally:
+        conn.close()
+
+
+def test_reconnect_applies_nothing(baseline_copy, capsys):
+    _connect(baseline_copy)
+    first = _dump(baseline_copy)
+    capsys.readouterr()
+
+    _connect(baseline_copy)
+    assert "マイグレーション" not in capsys.readouterr().out
+    assert _dump(baseline_copy) == first
+
+
+@pytest.mark.parametrize("version", [version for version, _, _, chunked in MIGRATIONS if chunked])
+def test_chunked_migrations_can_be_rerun(baseline_copy, version):
+    """途中で落ちた想定で user_version を戻して再実行しても同じ結果になる"""
+    _connect(baseline_copy)
+    first = _dump(baseline_copy)
+
+    _set_user_version(baseline_copy, version - 1)
+    _connect(baseline_copy)
+    assert _dump(baseline_copy) == first
+
+
+def test_fresh_database_gets_the_same_tables(baseline_copy, tmp_path):
+    fresh = tmp_path / "fresh.db"
+    _connect(fresh)
+    _connect(baseline_copy)
+
+    fresh_dump, migrated_dump = _dump(fresh), _dump(baseline_copy)
+    assert fresh_dump["user_version"] == LATEST
+    assert set(fresh_dump["tables"]) == set(migrated_dump["tables"])
+    assert fresh_dump["indexes"] == migrated_dump["indexes"]
@@ -0,0 +1,109 @@
+from utils import raid_detector
+from utils.raid_detector import RaidDetector
+
+GUILD_ID = 1
+
+
+def _observe(detector: RaidDetector, now: float, user_id: int = 0, kind: str = "join", account_age: int = 100, guild_id: int = GUILD_ID) -> bool:
+    return detector.observe(guild_id, kind, user_id, f"user{user_id}", account_age, now=now)
+
+
+def _start_raid(detector: RaidDetector, at: float = 0.0) -> float:
+    """閾値ちょうどの件数を1秒おきに入れてまとめ表示に切り替え、最後の時刻を返す"""
+    for i in range(detector.threshold):
+        _observe(detector, at + i, user_id=i)
+    return at + detector.threshold - 1
+
+
+def test_enters_at_threshold_and_keeps_the_triggering_event():
+    detector = RaidDetector(threshold=5, window=60, summary_interval=30)
+    results = [_observe(detector, float(i), user_id=i) for i in range(5)]
+
+    assert results == [False] * 4 + [True]
+    assert detector.is_active(GUILD_ID, "join")
+    [summary] = detector.drain(now=4.0)
+    assert summary.first and not summary.ended
+    assert [entry.user_id for entry in summary.entries] == [4]
+    assert summary.rate == 5
+
+
+def test_spread_out_events_never_enter():
+    detector = RaidDetector(threshold=5, window=60)
+    assert not any(_observe(detector, i * 20.0, user_id=i) for i in range(50))
+    assert detector.raids == 0
+
+
+def test_stays_active_between_release_and_enter_thresholds():
+    detector = RaidDetector(threshold=10, window=60, summary_interval=30)
+    last = _start_raid(detector)
+    detector.drain(now=last)
+
+    # 窓内が閾値未満でも、解除の閾値（半分）以上なら続く
+    now = 60.0 + 5
+    assert _observe(detector, now, user_id=100)
+    detector._prune(detector._windows[(GUILD_ID, "join")], now)
+    assert detector.release_threshold <= len(detector._windows[(GUILD_ID, "join")].events) < detector.threshold
+    assert not any(summary.ended for summary in detector.drain(now=now))
+    assert detector.is_active(GUILD_ID, "join")
+
+
+def test_exits_below_release_threshold_and_can_reenter():
+    detector = RaidDetector(threshold=4, window=60, summary_interval=30)
+    last = _start_raid(detector)
+    detector.drain(now=last)
+
+    [summary] = detector.drain(now=last + 61)
+    assert summary.ended and not summary.first
+    assert summary.total == 1
+    assert not detector.is_active(GUILD_ID, "join")
+
+    # 解除後は1件ごとのログに戻り、また閾値に達すれば切り替わる
+    assert not _observe(detector, 200.0, user_id=50)
+    last = _start_raid(detector, at=300.0)
+    assert detector.is_active(GUILD_ID, "join")
+    assert detector.raids == 2
+
+
+def test_summaries_follow_the_interval():
+    detector = RaidDetector(threshold=3, window=60, summary_interval=30)
+    last = _start_raid(detector)
+    assert len(detector.drain(now=last)) == 1
+
+    for i in range(3):
+        assert _observe(detector, last + 1 + i, user_id=10 + i)
+    assert detector.drain(now=last + 10) == []
+
+    [summary] = detector.drain(now=last + 30)
+    assert [entry.user_id for entry in summary.entries] == [10, 11, 12]
+    assert summary.total == 4
+
+
+def test_kinds_and_guilds_are_independent():
+    detector = RaidDetector(threshold=3, window=60)
+    _start_raid(detector)
+
+    assert not _observe(detector, 3.0, kind="leave")
+    assert not _observe(detector, 3.0, guild_id=2)
+    assert not detector.is_active(GUILD_ID, "leave")
+    assert not detector.is_active(2, "join")
+
+
+def test_entries_are_capped_and_new_accounts_counted(monkeypatch):
+    monkeypatch.setattr(raid_detector, "MAX_ENTRIES_PER_SUMMARY", 3)
+    detector = RaidDetector(threshold=2, window=60)
+    for i in range(6):
+        _observe(detector, float(i), user_id=i, account_age=i)
+
+    [summary] = detector.drain(now=6.0)
+    assert len(summary.entries) == 3
+    assert summary.omitted == 2
+    # アカウント作成から7日未満（1〜5日目）が新規アカウント
+    assert summary.new_accounts == 5
+    assert all(entry.is_new_account for entry in summary.entries)
+
+
+def test_idle_windows_are_dropped():
+    detector = RaidDetector(threshold=5, window=60)
+    _observe(detector, 0.0)
+    detector.drain(now=61.0)
+    assert detector._windows == {}
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from utils import retention
+from utils.db_manager import DBManager
+
+
+def _compact(tmp_path, monkeypatch, expired: int, **kwargs) -> dict:
+    """期限切れの日次行を expired 行入れてからコンパクションする"""
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(retention, "BATCH_PAUSE", 0)
+
+    async def run():
+        db = DBManager()
+        db.db_path = str(tmp_path / "bot_data.db")
+        await db.connect()
+        monkeypatch.setattr(retention, "db", db)
+        try:
+            await db.executemany(
+                "INSERT INTO user_statistics (guild_id, user_id, event_type, date, count) VALUES (1, ?, 'message', '2000-01-01', 1)",
+                [(user_id,) for user_id in range(expired)]
+            )
+            result = await retention.compact(**kwargs)
+            remaining = (await db.fetchrow("SELECT COUNT(*) FROM user_statistics"))[0]
+        finally:
+            await db.close()
+        return result, remaining
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("expired, finished", [
+    (0, True),
+    (5, True),    # 最後のバッチが LIMIT に満たない
+    (6, True),    # ちょうど max_batches 回で終わる
+    (7, False),   # 上限に達して残りがある
+])
+def test_finished_reflects_remaining_rows(tmp_path, monkeypatch, expired, finished):
+    result, remaining = _compact(tmp_path, monkeypatch, expired, max_batches=3, batch_size=2)
+    assert result["finished"] is finished
+    assert remaining == (0 if finished else expired - 6)
+    assert result["archived_rows"] == expired - remaining
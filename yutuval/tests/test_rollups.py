@@ -0,0 +1,178 @@
+import random
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from utils.rollups import build_range_query, build_windowed_query, plan_range, split_windows
+
+START = date(2024, 1, 1)
+END = date(2025, 12, 31)
+GUILD_ID = 1
+EVENTS = ("message_sent", "vc_join")
+
+
+def _days(start: date, end: date):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def _expand(plan) -> list:
+    """RangePlan が読む日付の一覧（重複もそのまま）"""
+    covered = []
+    for month in plan.months:
+        first = date.fromisoformat(f"{month}-01")
+        covered += [day for day in _days(first, first + timedelta(days=31)) if day.month == first.month]
+    for week in plan.weeks:
+        covered += list(_days(date.fromisoformat(week), date.fromisoformat(week) + timedelta(days=6)))
+    for day_start, day_end in plan.day_ranges:
+        covered += list(_days(date.fromisoformat(day_start), date.fromisoformat(day_end)))
+    return covered
+
+
+def _random_ranges(count: int, seed: int):
+    rng = random.Random(seed)
+    span = (END - START).days
+    for _ in range(count):
+        start = START + timedelta(days=rng.randrange(span))
+        yield start, min(start + timedelta(days=rng.randrange(400)), END)
+
+
+# ==================== plan_range ====================
+
+@pytest.mark.parametrize("start,end", list(_random_ranges(300, seed=7)) + [
+    (date(2024, 2, 1), date(2024, 2, 29)),   # ちょうど1か月（うるう年）
+    (date(2024, 1, 1), date(2024, 1, 7)),    # 月曜始まりのちょうど1週
+    (date(2024, 3, 5), date(2024, 3, 5)),    # 1日
+])
+def test_plan_covers_each_day_exactly_once(start, end):
+    plan = plan_range(start, end)
+    assert sorted(_expand(plan)) == list(_days(start, end))
+    # 月に満たない前後の端それぞれで、日次は週の前後に6日まで・週次は4週まで
+    assert sum((date.fromisoformat(b) - date.fromisoformat(a)).days + 1 for a, b in plan.day_ranges) <= 24
+    assert len(plan.weeks) <= 8
+
+
+def test_empty_range():
+    plan = plan_range(date(2024, 5, 2), date(2024, 5, 1))
+    assert not plan.months and not plan.weeks and not plan.day_ranges
+
+
+@pytest.mark.parametrize("start,end", list(_random_ranges(100, seed=11)))
+def test_plan_rounds_to_months_before_daily_floor(start, end):
+    floor = date(2025, 1, 1)
+    plan = plan_range(start, end, daily_floor=floor)
+    covered = sorted(_expand(plan))
+
+    # 日次が残っている範囲はちょうど1回ずつ
+    assert [day for day in covered if day >= floor] == [day for day in _days(start, end) if day >= floor]
+    # それより前は月次だけ（期間の一部でも含む月をまるごと読む）
+    before = {day.strftime("%Y-%m") for day in _days(start, min(end, floor - timedelta(days=1)))}
+    assert set(plan.months) >= before
+    assert not any(date.fromisoformat(week) < floor for week in plan.weeks)
+    assert not any(date.fromisoformat(day_start) < floor for day_start, _ in plan.day_ranges)
+
+
+# ==================== SQL と日次の単純合計の比較 ====================
+
+@pytest.fixture(scope="module")
+def stats_db():
+    """ランダムな日次統計と、マイグレーションと同じ式で作ったロールアップ"""
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE statistics (guild_id INTEGER, event_type TEXT, date TEXT, count INTEGER);
+        CREATE TABLE statistics_weekly (guild_id INTEGER, event_type TEXT, week_start TEXT, count INTEGER);
+        CREATE TABLE statistics_monthly (guild_id INTEGER, event_type TEXT, month TEXT, count INTEGER);
+    """)
+    rng = random.Random(3)
+    daily = {}
+    for day in _days(START, END):
+        for event_type in EVENTS:
+            if rng.random() < 0.7:
+                daily[(event_type, day)] = rng.randrange(1, 50)
+    conn.executemany(
+        "INSERT INTO statistics VALUES (?, ?, ?, ?)",
+        [(GUILD_ID, event_type, day.isoformat(), count) for (event_type, day), count in daily.items()]
+    )
+    # 別サーバーの行は合計に入らないこと
+    conn.execute("INSERT INTO statistics VALUES (2, 'message_sent', '2024-06-01', 1000)")
+    conn.executescript("""
+        INSERT INTO statistics_weekly
+        SELECT guild_id, event_type, date(date, 'weekday 0', '-6 days'), SUM(count) FROM statistics GROUP BY 1, 2, 3;
+        INSERT INTO statistics_monthly
+        SELECT guild_id, event_type, substr(date, 1, 7), SUM(count) FROM statistics GROUP BY 1, 2, 3;
+    """)
+    yield conn, daily
+    conn.close()
+
+
+def _brute_force(daily: dict, start: date, end: date) -> dict:
+    totals = {}
+    for (event_type, day), count in daily.items():
+        if start <= day <= end:
+            totals[event_type] = totals.get(event_type, 0) + count
+    return totals
+
+
+@pytest.mark.parametrize("start,end", list(_random_ranges(100, seed=5)))
+def test_range_query_matches_daily_sum(stats_db, start, end):
+    conn, daily = stats_db
+    sql, params = build_range_query(plan_range(start, end), "statistics", "event_type", "guild_id = ?", [GUILD_ID])
+    assert dict(conn.execute(sql, params).fetchall()) == _brute_force(daily, start, end)
+
+
+def test_range_query_for_empty_range(stats_db):
+    conn, _ = stats_db
+    sql, params = build_range_query(plan_range(END, START), "statistics", "event_type", "guild_id = ?", [GUILD_ID])
+    assert conn.execute(sql, params).fetchall() == []
+
+
+# ==================== 複数期間の同時集計 ====================
+
+def _random_windows(count: int, seed: int):
+    rng = random.Random(seed)
+    ranges = list(_random_ranges(count * 4, seed))
+    for _ in range(count):
+        yield rng.sample(ranges, rng.randrange(1, 5))
+
+
+@pytest.mark.parametrize("windows", list(_random_windows(100, seed=13)))
+def test_split_windows_tiles_every_window(windows):
+    pieces = split_windows(windows)
+
+    # 区間は重ならず昇順
+    for (_, previous_end), (start, _) in zip(pieces, pieces[1:]):
+        assert previous_end < start
+    # 各期間は、その期間に含まれる区間でちょうど覆える
+    for start, end in windows:
+        covered = [day for low, high in pieces if start <= low and high <= end for day in _days(low, high)]
+        assert covered == list(_days(start, end))
+    # どの期間にも含まれない区間は作らない
+    for low, high in pieces:
+        assert any(start <= low and high <= end for start, end in windows)
+
+
+@pytest.mark.parametrize("windows", list(_random_windows(60, seed=17)) + [
+    [(date(2025, 3, 1), date(2025, 3, 31)), (date(2025, 3, 1), date(2025, 3, 31))],   # 同じ期間
+    [(date(2025, 1, 1), date(2025, 1, 10)), (date(2025, 6, 1), date(2025, 6, 10))],   # 離れた期間
+])
+def test_windowed_query_matches_daily_sum(stats_db, windows):
+    conn, daily = stats_db
+    sql, params = build_windowed_query(windows, "statistics", "event_type", "guild_id = ?", [GUILD_ID])
+    rows = {event_type: sums for event_type, *sums in conn.execute(sql, params)}
+
+    for index, (start, end) in enumerate(windows):
+        expected = _brute_force(daily, start, end)
+        assert {event_type: sums[index] for event_type, sums in rows.items() if sums[index]} == expected
+
+
+def test_windowed_query_with_an_empty_window(stats_db):
+    conn, daily = stats_db
+    windows = [(date(2025, 2, 1), date(2025, 2, 28)), (date(2025, 2, 10), date(2025, 2, 9))]
+    sql, params = build_windowed_query(windows, "statistics", "event_type", "guild_id = ?", [GUILD_ID])
+    rows = {event_type: sums for event_type, *sums in conn.execute(sql, params)}
+
+    assert {event_type: sums[0] for event_type, sums in rows.items()} == _brute_force(daily, *windows[0])
+    assert all(sums[1] == 0 for sums in rows.values())
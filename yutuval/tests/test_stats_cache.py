@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from utils.stats_cache import StatsCache
+
+KEY = (1, "windows", 7, None)
+
+
+class _Source:
+    """呼ばれた回数を数え、release されるまで結果を返さない集計"""
+
+    def __init__(self):
+        self.value = 0
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def started(self, calls: int):
+        """calls 回目の呼び出しが始まるまで待つ（始まらなければ諦めて、後の assert で落とす）"""
+        for _ in range(100):
+            if self.calls >= calls:
+                return
+            await asyncio.sleep(0)
+
+    async def compute(self):
+        self.calls += 1
+        value = self.value
+        await self.release.wait()
+        return value
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_calls_share_one_computation():
+    async def run():
+        cache, source = StatsCache(), _Source()
+        tasks = [asyncio.create_task(cache.get(KEY, source.compute)) for _ in range(5)]
+        await source.started(1)
+        source.release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert results == [0] * 5
+        assert source.calls == 1
+        assert (cache.misses, cache.shared) == (1, 4)
+        assert await cache.get(KEY, source.compute) == 0
+        assert cache.hits == 1
+    _run(run())
+
+
+def test_flush_invalidates_only_that_guild():
+    async def run():
+        cache, source = StatsCache(), _Source()
+        source.release.set()
+        other = (2, "windows", 7, None)
+        await cache.get(KEY, source.compute)
+        await cache.get(other, source.compute)
+
+        source.value = 1
+        cache.on_flush({(1, "message_sent", "2025-01-01"): 1}, {})
+        assert await cache.get(KEY, source.compute) == 1
+        assert await cache.get(other, source.compute) == 0
+        assert source.calls == 3
+    _run(run())
+
+
+def test_call_after_flush_does_not_join_a_computation_started_before_it():
+    async def run():
+        cache, source = StatsCache(), _Source()
+        before = asyncio.create_task(cache.get(KEY, source.compute))
+        await source.started(1)
+
+        source.value = 1
+        cache.invalidate(1)
+        after = asyncio.create_task(cache.get(KEY, source.compute))
+        await source.started(2)
+        source.release.set()
+
+        # 先に始まった呼び出しは古い結果、無効化後の呼び出しは新しい結果
+        assert (await before, await after) == (0, 1)
+        assert source.calls == 2
+        assert cache.shared == 0
+        # 古い結果は保存されない
+        assert await cache.get(KEY, source.compute) == 1
+        assert cache.hits == 1
+    _run(run())
+
+
+def test_expired_entries_are_dropped_on_lookup():
+    async def run():
+        cache, source = StatsCache(ttl=0.01), _Source()
+        source.release.set()
+        await cache.get(KEY, source.compute)
+        await asyncio.sleep(0.02)
+
+        source.value = 1
+        assert await cache.get(KEY, source.compute) == 1
+        assert source.calls == 2
+        assert cache.get_metrics()["entries"] == 1
+    _run(run())
+
+
+def test_errors_are_not_cached():
+    async def run():
+        cache = StatsCache()
+        calls = []
+
+        async def failing():
+            calls.append(1)
+            raise RuntimeError("db error")
+
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await cache.get(KEY, failing)
+        assert len(calls) == 2
+        assert cache.get_metrics()["inflight"] == 0
+    _run(run())
+
+
+def test_cancelled_waiter_does_not_cancel_shared_computation():
+    async def run():
+        cache, source = StatsCache(), _Source()
+        first = asyncio.create_task(cache.get(KEY, source.compute))
+        second = asyncio.create_task(cache.get(KEY, source.compute))
+        await source.started(1)
+        first.cancel()
+        source.release.set()
+
+        assert await second == 0
+        assert first.cancelled()
+    _run(run())
+
+
+def test_per_guild_entries_are_capped():
+    async def run():
+        cache = StatsCache(max_entries_per_guild=3)
+
+        async def compute():
+            return 0
+
+        for days in range(5):
+            await cache.get((1, "windows", days, None), compute)
+        assert list(key[2] for key in cache._entries[1]) == [2, 3, 4]
+    _run(run())
@@ -0,0 +1,76 @@
+import random
+from array import array
+from datetime import date, timedelta
+
+import pytest
+
+from utils.timeseries import DAY, MONTH, WEEK, TimeSeries, bucket_for
+
+
+def _daily(start: date, values) -> TimeSeries:
+    days = [start + timedelta(days=i) for i in range(len(values))]
+    return TimeSeries(DAY, days, array("q", values))
+
+
+def test_daily_fills_missing_days_and_ignores_out_of_range_rows():
+    series = TimeSeries.daily(date(2025, 1, 1), date(2025, 1, 5), [
+        ("2025-01-02", 3), ("2025-01-05", 4), ("2025-01-02", 1), ("2024-12-31", 99), ("2025-01-06", 99),
+    ])
+    assert series.points() == [
+        (date(2025, 1, 1), 0), (date(2025, 1, 2), 4), (date(2025, 1, 3), 0), (date(2025, 1, 4), 0), (date(2025, 1, 5), 4),
+    ]
+    assert TimeSeries.daily(date(2025, 1, 2), date(2025, 1, 1), []).points() == []
+
+
+def test_bucket_for():
+    assert [bucket_for(days) for days in (1, 15, 16, 180, 181)] == [DAY, DAY, WEEK, WEEK, MONTH]
+
+
+@pytest.mark.parametrize("bucket", [WEEK, MONTH])
+@pytest.mark.parametrize("seed", range(20))
+def test_downsample_matches_grouped_sums(bucket, seed):
+    rng = random.Random(seed)
+    start = date(2024, 1, 1) + timedelta(days=rng.randrange(400))
+    series = _daily(start, [rng.randrange(100) for _ in range(rng.randrange(1, 400))])
+
+    expected = {}
+    for day, value in series.points():
+        key = day - timedelta(days=day.weekday()) if bucket == WEEK else day.replace(day=1)
+        expected[max(key, start)] = expected.get(max(key, start), 0) + value
+
+    downsampled = series.downsample(bucket)
+    assert downsampled.bucket == bucket
+    # 最初の区間は期間の開始日から数える
+    assert downsampled.points() == sorted(expected.items())
+    assert downsampled.total() == series.total()
+
+
+def test_downsample_to_same_bucket_is_identity():
+    series = _daily(date(2025, 1, 1), [1, 2, 3])
+    assert series.downsample(DAY) is series
+
+
+def test_moving_average_uses_available_prefix():
+    series = _daily(date(2025, 1, 1), [2, 4, 6, 8, 10])
+    assert list(series.moving_average(3)) == [2.0, 3.0, 4.0, 6.0, 8.0]
+    assert list(series.moving_average(1)) == [2.0, 4.0, 6.0, 8.0, 10.0]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_slope_matches_least_squares(seed):
+    rng = random.Random(seed)
+    values = [rng.randrange(-50, 50) for _ in range(rng.randrange(2, 60))]
+    n = len(values)
+    mean_x, mean_y = (n - 1) / 2, sum(values) / n
+    expected = (
+        sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+        / sum((x - mean_x) ** 2 for x in range(n))
+    )
+    assert _daily(date(2025, 1, 1), values).slope() == pytest.approx(expected)
+
+
+def test_slope_of_lines_and_short_series():
+    assert _daily(date(2025, 1, 1), [5, 8, 11, 14]).slope() == pytest.approx(3.0)
+    assert _daily(date(2025, 1, 1), [7, 7, 7]).slope() == 0.0
+    assert _daily(date(2025, 1, 1), [7]).slope() == 0.0
+    assert _daily(date(2025, 1, 1), []).slope() == 0.0
@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from utils import voice_sessions as voice_sessions_module
+from utils.stats_buffer import StatsBuffer
+from utils.voice_sessions import EVENT_TYPE, VoiceSessionTracker
+
+GUILD_ID = 1
+# 2024-03-01 00:00:00 UTC
+MIDNIGHT = datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp()
+
+
+def _channel(channel_id: int, *members):
+    return SimpleNamespace(id=channel_id, members=list(members))
+
+
+def _guild(*channels, afk=None):
+    return SimpleNamespace(id=GUILD_ID, afk_channel=afk, voice_channels=list(channels), stage_channels=[])
+
+
+def _member(user_id: int, guild, bot: bool = False):
+    return SimpleNamespace(id=user_id, guild=guild, bot=bot)
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    """記録先を空の StatsBuffer に差し替える（フラッシュはしない）"""
+    buffer = StatsBuffer()
+    monkeypatch.setattr(voice_sessions_module, "stats_buffer", buffer)
+    return buffer
+
+
+def _minutes(buffer, user_id: int) -> dict:
+    return {
+        day: count for (guild_id, uid, event_type, day), count in buffer._user.items()
+        if uid == user_id and event_type == EVENT_TYPE
+    }
+
+
+def test_minutes_are_split_at_utc_midnight(buffer):
+    guild = _guild()
+    member = _member(10, guild)
+    channel = _channel(100)
+    tracker = VoiceSessionTracker()
+
+    # 23:58:30 に入って 00:03:30 に出る（各1分はその分が始まった日に数える）
+    tracker.update(member, None, channel, now=MIDNIGHT - 90)
+    tracker.update(member, channel, None, now=MIDNIGHT + 210)
+
+    assert _minutes(buffer, 10) == {"2024-02-29": 2, "2024-03-01": 3}
+    assert tracker.minutes_credited == 5
+
+
+def test_checkpoint_carries_the_remainder_to_the_close(buffer):
+    guild = _guild()
+    member = _member(10, guild)
+    channel = _channel(100)
+    tracker = VoiceSessionTracker()
+
+    tracker.update(member, None, channel, now=MIDNIGHT)
+    tracker.checkpoint(now=MIDNIGHT + 150)
+    assert _minutes(buffer, 10) == {"2024-03-01": 2}
+
+    # 持ち越した30秒 + 50秒 = 80秒 → 閉じるときに1分
+    tracker.update(member, channel, None, now=MIDNIGHT + 200)
+    assert _minutes(buffer, 10) == {"2024-03-01": 3}
+
+
+@pytest.mark.parametrize("seconds, minutes", [
+    (29, 0),
+    (30, 1),
+    (89, 1),
+    (90, 2),
+    (150, 3),
+])
+def test_close_rounds_half_up(buffer, seconds, minutes):
+    guild = _guild()
+    member = _member(10, guild)
+    channel = _channel(100)
+    tracker = VoiceSessionTracker()
+
+    tracker.update(member, None, channel, now=MIDNIGHT)
+    tracker.update(member, channel, None, now=MIDNIGHT + seconds)
+
+    assert sum(_minutes(buffer, 10).values()) == minutes
+
+
+def test_afk_channel_and_bots_are_not_counted(buffer):
+    afk = _channel(999)
+    guild = _guild(afk=afk)
+    tracker = VoiceSessionTracker()
+
+    tracker.update(_member(10, guild), None, afk, now=MIDNIGHT)
+    tracker.update(_member(11, guild, bot=True), None, _channel(100), now=MIDNIGHT)
+
+    assert tracker.open_sessions(GUILD_ID) == 0
+
+
+def test_rebuild_reconciles_with_current_voice_state(buffer):
+    guild = _guild()
+    stay, leave, move, join, bot = (_member(user_id, guild) for user_id in (10, 11, 12, 13, 14))
+    bot.bot = True
+    first, second = _channel(100), _channel(200)
+    tracker = VoiceSessionTracker()
+    for member in (stay, leave, move):
+        tracker.update(member, None, first, now=MIDNIGHT)
+
+    # 切断中に leave は退出、move は別のVCへ移動、join は新しく参加していた
+    first.members = [stay]
+    second.members = [move, join, bot]
+    guild.voice_channels = [first, second]
+    tracker.rebuild([guild], now=MIDNIGHT + 600)
+
+    assert tracker.open_sessions(GUILD_ID) == 3
+    assert tracker._open[(GUILD_ID, 10)].started_at == MIDNIGHT
+    assert tracker._open[(GUILD_ID, 12)].channel_id == 200
+    assert tracker._open[(GUILD_ID, 12)].started_at == MIDNIGHT + 600
+    assert tracker._open[(GUILD_ID, 13)].started_at == MIDNIGHT + 600
+    # 閉じた分だけ記録され、残っている stay はまだ記録されない
+    assert _minutes(buffer, 11) == {"2024-03-01": 10}
+    assert _minutes(buffer, 12) == {"2024-03-01": 10}
+    assert _minutes(buffer, 10) == {}
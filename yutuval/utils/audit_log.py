@@ -0,0 +1,293 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from utils.db_manager import db
+
+# フラッシュ間隔（秒）と、溜まった件数がこれを超えたら即フラッシュする閾値
+FLUSH_INTERVAL = 2.0
+MAX_PENDING_ROWS = 1000
+
+# 1件に保存する本文の上限（文字）
+MAX_CONTENT_CHARS = 4000
+
+# 保持日数（これより古い分は定期メンテナンスで削除）
+DEFAULT_RETENTION_DAYS = 90
+
+# 古い行を消すときの1バッチの id 幅と、バッチ間で書き込みロックを手放す時間
+PRUNE_BATCH = 5000
+PRUNE_PAUSE = 0.2
+MAX_PRUNE_BATCHES = 200
+
+PAGE_SIZE = 10
+
+INSERT_EVENT = """
+    INSERT INTO audit_log (guild_id, created_at, category, event_type, user_id, channel_id, content)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+COLUMNS = "a.id, a.created_at, a.category, a.event_type, a.user_id, a.channel_id, a.content"
+
+# (id, created_at, category, event_type, user_id, channel_id, content)
+AuditRow = Tuple[int, int, str, str, Optional[int], Optional[int], str]
+
+
+def retention_days() -> int:
+    try:
+        return max(int(os.getenv("AUDIT_LOG_RETENTION_DAYS", DEFAULT_RETENTION_DAYS)), 1)
+    except ValueError:
+        return DEFAULT_RETENTION_DAYS
+
+
+def _fts_phrase(text: str) -> str:
+    """入力をそのまま1つのフレーズとして検索する（FTS5 の演算子として解釈させない）"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _like_pattern(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class AuditLog:
+    """
+    Logger の全イベントを audit_log テーブルに残す（Discord を見ずに検索できるように）。
+    record() はメモリに積むだけで、定期フラッシュが1トランザクションでまとめて INSERT する。
+    全文検索インデックス (audit_log_fts) はトリガーで同じトランザクション内に更新される。
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING_ROWS):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: List[tuple] = []
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._pending_flush: Optional[asyncio.Task] = None
+        # 全文検索のトークナイザ（"trigram" / "unicode61"、インデックスが無ければ ""、未確認は None）
+        self._tokenizer: Optional[str] = None
+
+        # メトリクス
+        self.recorded = 0
+        self.persisted = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+        self.searches = 0
+        self.last_search_ms = 0.0
+
+    # ==================== 記録 ====================
+
+    def record(
+        self,
+        guild_id: int,
+        category: str,
+        event_type: str,
+        user_id: Optional[int] = None,
+        channel_id: Optional[int] = None,
+        content: str = ""
+    ):
+        """イベントを1件記録する（DBアクセスなし）"""
+        self._pending.append((
+            guild_id, int(time.time()), category, event_type,
+            user_id, channel_id, (content or "")[:MAX_CONTENT_CHARS]
+        ))
+        self.recorded += 1
+
+        if len(self._pending) >= self.max_pending and not self._flush_in_progress():
+            self._pending_flush = asyncio.get_running_loop().create_task(self.flush())
+
+    def _flush_in_progress(self) -> bool:
+        return self._pending_flush is not None and not self._pending_flush.done()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            rows, self._pending = self._pending, []
+            started = time.perf_counter()
+            try:
+                async with db.transaction() as tx:
+                    await tx.executemany(INSERT_EVENT, rows)
+            except Exception as e:
+                # 失敗した分は次回に持ち越す
+                self._pending[:0] = rows
+                self.flush_errors += 1
+                print(f"監査ログ書き込みエラー: {e}")
+                return
+
+            self.persisted += len(rows)
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    # ==================== 検索 ====================
+
+    async def _fts_tokenizer(self) -> str:
+        if self._tokenizer is None:
+            row = await db.fetchrow("SELECT sql FROM sqlite_master WHERE name = 'audit_log_fts'", read_only=True)
+            if row is None:
+                self._tokenizer = ""
+            else:
+                self._tokenizer = "trigram" if "trigram" in row[0] else "unicode61"
+        return self._tokenizer
+
+    async def _id_bounds(self, since: Optional[int], until: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+        """
+        時刻の範囲を id の範囲に置き換える（id は記録順なので created_at と同じ順に並ぶ）。
+        以後の絞り込みは id の範囲だけで済み、どのインデックスを使っても範囲外を読まない。
+        該当する行が無い側は None（読み取り専用プールで実行する）
+        """
+        low = high = None
+        if since is not None:
+            row = await db.fetchrow(
+                "SELECT id FROM audit_log WHERE created_at >= ? ORDER BY created_at, id LIMIT 1", (since,),
+                read_only=True
+            )
+            low = row[0] if row else None
+        if until is not None:
+            row = await db.fetchrow(
+                "SELECT id FROM audit_log WHERE created_at < ? ORDER BY created_at DESC, id DESC LIMIT 1", (until,),
+                read_only=True
+            )
+            high = row[0] if row else None
+        return low, high
+
+    async def search(
+        self,
+        guild_id: int,
+        text: Optional[str] = None,
+        user_id: Optional[int] = None,
+        channel_id: Optional[int] = None,
+        category: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        before_id: Optional[int] = None,
+        limit: int = PAGE_SIZE
+    ) -> Tuple[List[AuditRow], Optional[int]]:
+        """
+        新しい順に limit 件を返す。2つ目の値は次のページのカーソル（無ければ None）で、
+        次回 before_id に渡すと続きから読む（OFFSET を使わないので何ページ目でも同じ速さ）
+        """
+        started = time.perf_counter()
+        text = (text or "").strip()
+        tokenizer = await self._fts_tokenizer() if text else ""
+        # trigram は3文字未満を検索できないので、短い語は LIKE で絞る
+        use_fts = bool(text) and tokenizer != "" and not (tokenizer == "trigram" and len(text) < 3)
+
+        # FTS 経由のときは id の条件を FTS 側の rowid に付けて、インデックス内で範囲を絞らせる
+        id_column = "audit_log_fts.rowid" if use_fts else "a.id"
+        conditions = ["a.guild_id = ?"]
+        parameters: list = [guild_id]
+
+        if user_id is not None:
+            conditions.append("a.user_id = ?")
+            parameters.append(user_id)
+        if channel_id is not None:
+            conditions.append("a.channel_id = ?")
+            parameters.append(channel_id)
+        if category is not None:
+            conditions.append("a.category = ?")
+            parameters.append(category)
+
+        low, high = await self._id_bounds(since, until)
+        if (since is not None and low is None) or (until is not None and high is None):
+            return [], None
+        if since is not None:
+            conditions.append(f"{id_column} >= ? AND a.created_at >= ?")
+            parameters.extend([low, since])
+        if until is not None:
+            conditions.append(f"{id_column} <= ? AND a.created_at < ?")
+            parameters.extend([high, until])
+        if before_id is not None:
+            conditions.append(f"{id_column} < ?")
+            parameters.append(before_id)
+
+        if use_fts:
+            query = f"""
+                SELECT {COLUMNS} FROM audit_log_fts JOIN audit_log a ON a.id = audit_log_fts.rowid
+                WHERE audit_log_fts MATCH ? AND {' AND '.join(conditions)}
+                ORDER BY audit_log_fts.rowid DESC LIMIT ?
+            """
+            parameters.insert(0, _fts_phrase(text))
+        else:
+            if text:
+                conditions.append("a.content LIKE ? ESCAPE '\\'")
+                parameters.append(_like_pattern(text))
+            query = f"""
+                SELECT {COLUMNS} FROM audit_log a
+                WHERE {' AND '.join(conditions)}
+                ORDER BY a.id DESC LIMIT ?
+            """
+        # 1件多く読んで、次のページがあるかを判定する
+        parameters.append(limit + 1)
+
+        # 全文検索・LIKE の走査は読み取り専用プールで行い、書き込み（統計・ログのフラッシュ）を待たせない
+        rows = await db.fetchall(query, tuple(parameters), read_only=True)
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+
+        self.searches += 1
+        self.last_search_ms = (time.perf_counter() - started) * 1000
+        return list(rows[:limit]), next_cursor
+
+    # ==================== 保持期間 ====================
+
+    async def prune(self, days: Optional[int] = None) -> int:
+        """保持期間を過ぎた行を id の範囲ごとに少しずつ削除し、削除した行数を返す"""
+        cutoff = int(datetime.now(timezone.utc).timestamp()) - (days or retention_days()) * 86400
+        _, high = await self._id_bounds(None, cutoff)
+        if high is None:
+            return 0
+        row = await db.fetchrow("SELECT MIN(id) FROM audit_log")
+        low = row[0]
+
+        deleted = 0
+        for _ in range(MAX_PRUNE_BATCHES):
+            if low > high:
+                break
+            upper = min(low + PRUNE_BATCH, high + 1)
+            deleted += await db.execute(
+                "DELETE FROM audit_log WHERE id >= ? AND id < ? AND created_at < ?",
+                (low, upper, cutoff)
+            )
+            low = upper
+            await asyncio.sleep(PRUNE_PAUSE)
+
+        if deleted:
+            print(f"🧹 監査ログ: {deleted:,}件を削除（{days or retention_days()}日より前）")
+        return deleted
+
+    # ==================== ライフサイクル ====================
+
+    def start(self):
+        """定期フラッシュを開始"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self):
+        """定期フラッシュを止めて、残りを書き込む"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_metrics(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "persisted": self.persisted,
+            "pending": len(self._pending),
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "searches": self.searches,
+            "last_search_ms": round(self.last_search_ms, 2),
+        }
+
+
+audit_log = AuditLog()
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from utils.db_manager import db
+
+BACKUP_DIR = Path("database") / "backups"
+SNAPSHOT_PREFIX = "bot_data-"
+DEFAULT_KEEP = 7
+
+# 1ステップでコピーするページ数と、ステップ間の休み（秒）
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+
+# コピー中に元DBの変更でやり直しになった回数がこれを超えたら、書き込みを止めて取り直す
+MAX_RESTARTS = 5
+
+
+class BackupRestarted(Exception):
+    pass
+
+
+def _keep_count() -> int:
+    try:
+        return max(int(os.getenv("BACKUP_KEEP", DEFAULT_KEEP)), 1)
+    except ValueError:
+        return DEFAULT_KEEP
+
+
+def _copy_database(source: str, destination: Path, pause: float, max_restarts: Optional[int]) -> int:
+    """
+    SQLite のオンラインバックアップAPIで source を destination にコピーする（スレッドで呼ぶ）。
+    読み取りトランザクションを開いたままコピーするので、WALでは書き込みが続いても
+    同じスナップショットを最後まで読み切れる（やり直しにならない）。やり直し回数を返す。
+    """
+    uri = Path(source).resolve().as_uri() + "?mode=ro"
+    src = sqlite3.connect(uri, uri=True)
+    dst = sqlite3.connect(destination)
+    state = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if max_restarts is not None and state["restarts"] > max_restarts:
+                raise BackupRestarted(f"{state['restarts']} restarts")
+        state["remaining"] = remaining
+        if pause:
+            time.sleep(pause)
+
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # スナップショットを固定
+        src.backup(dst, pages=PAGES_PER_STEP, progress=progress)
+        src.rollback()
+
+        # スナップショットは単体で持ち運べるように WAL を外す
+        dst.execute("PRAGMA journal_mode = DELETE")
+        result = dst.execute("PRAGMA quick_check").fetchone()
+        if not result or result[0] != "ok":
+            raise sqlite3.DatabaseError(f"quick_check failed: {result}")
+    finally:
+        src.close()
+        dst.close()
+    return state["restarts"]
+
+
+def check_integrity(path: Path) -> str:
+    """PRAGMA integrity_check の結果（問題なければ "ok"）"""
+    uri = path.resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    return "\n".join(row[0] for row in rows)
+
+
+class BackupManager:
+    """bot_data.db のオンラインバックアップ（タイムスタンプ付きスナップショット + ローテーション）"""
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+        # メトリクス
+        self.snapshot_count = 0
+        self.failures = 0
+        self.last_copy_ms = 0.0
+        self.last_writer_blocked_ms = 0.0
+        self.last_restarts = 0
+        self.last_size = 0
+        self.last_snapshot: Optional[str] = None
+
+    def list_snapshots(self) -> List[Path]:
+        """スナップショット一覧（古い順）"""
+        if not BACKUP_DIR.exists():
+            return []
+        return sorted(BACKUP_DIR.glob(f"{SNAPSHOT_PREFIX}*.db"))
+
+    def _rotate(self):
+        snapshots = self.list_snapshots()
+        for old in snapshots[:-_keep_count()]:
+            old.unlink(missing_ok=True)
+
+    async def snapshot(self, rotate: bool = True) -> Path:
+        """スナップショットを1つ作成し、パスを返す"""
+        async with self._lock:
+            BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            final = BACKUP_DIR / f"{SNAPSHOT_PREFIX}{stamp}.db"
+            suffix = 1
+            while final.exists():
+                final = BACKUP_DIR / f"{SNAPSHOT_PREFIX}{stamp}-{suffix}.db"
+                suffix += 1
+            partial = final.with_suffix(".db.partial")
+            partial.unlink(missing_ok=True)
+
+            started = time.perf_counter()
+            blocked_ms = 0.0
+            try:
+                try:
+                    restarts = await asyncio.to_thread(
+                        _copy_database, db.db_path, partial, STEP_PAUSE, MAX_RESTARTS
+                    )
+                except BackupRestarted:
+                    # 変更が多すぎて追いつけない場合だけ、書き込みを止めて一気にコピーする
+                    partial.unlink(missing_ok=True)
+                    async with db.hold_writes():
+                        blocked_started = time.perf_counter()
+                        restarts = await asyncio.to_thread(_copy_database, db.db_path, partial, 0, None)
+                        blocked_ms = (time.perf_counter() - blocked_started) * 1000
+                os.replace(partial, final)
+            except Exception:
+                self.failures += 1
+                partial.unlink(missing_ok=True)
+                raise
+
+            self.snapshot_count += 1
+            self.last_copy_ms = (time.perf_counter() - started) * 1000
+            self.last_writer_blocked_ms = blocked_ms
+            self.last_restarts = restarts
+            self.last_size = final.stat().st_size
+            self.last_snapshot = final.name
+            if rotate:
+                self._rotate()
+
+            print(f"💾 バックアップ作成: {final.name} ({self.last_copy_ms:.0f}ms, 書き込み停止 {blocked_ms:.0f}ms)")
+            return final
+
+    async def restore(self, name: str) -> Path:
+        """
+        スナップショットから復元する。
+        integrity_check に通ったものだけを使い、差し替え前に現在のDBもスナップショットに残す。
+        """
+        path = BACKUP_DIR / Path(name).name
+        if not path.exists():
+            raise FileNotFoundError(f"{path.name} が見つかりません")
+
+        result = await asyncio.to_thread(check_integrity, path)
+        if result != "ok":
+            raise sqlite3.DatabaseError(f"integrity_check failed: {result[:200]}")
+
+        # 復元元がローテーションで消えないよう、ここでは古いものを消さない
+        await self.snapshot(rotate=False)
+        await db.replace_database(str(path))
+        return path
+
+    def get_metrics(self) -> dict:
+        return {
+            "snapshot_count": self.snapshot_count,
+            "failures": self.failures,
+            "last_copy_ms": round(self.last_copy_ms, 2),
+            "last_writer_blocked_ms": round(self.last_writer_blocked_ms, 2),
+            "last_restarts": self.last_restarts,
+            "last_size": self.last_size,
+            "last_snapshot": self.last_snapshot,
+        }
+
+
+backup_manager = BackupManager()
@@ -1,185 +1,363 @@
 import aiosqlite
+import asyncio
 import os
+import re
+import shutil
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+from utils.migrations import run_migrations
+from utils.query_stats import caller_tag, query_stats
 
 DATABASE_PATH = "database/bot_data.db"
 
+# 統計クエリ用の読み取り専用接続の数
+READER_POOL_SIZE = 3
+
+# 全接続に適用するPRAGMA
+CONNECTION_PRAGMAS = (
+    "PRAGMA cache_size = -16000",      # 16MB
+    "PRAGMA mmap_size = 134217728",    # 128MB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# EXPLAIN QUERY PLAN を取れる文
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+_explain_tasks = set()
+
+
+def _record(tag: str, kind: str, query: str, parameters, started: float, wait_ms: float = 0.0):
+    """実行時間を集計し、スロークエリなら実行計画の取得を予約する"""
+    entry = query_stats.record(tag, kind, query, (time.perf_counter() - started) * 1000, wait_ms)
+    if entry is not None and _EXPLAINABLE.match(query):
+        task = asyncio.get_running_loop().create_task(db._explain(entry, query, parameters))
+        _explain_tasks.add(task)
+        task.add_done_callback(_explain_tasks.discard)
+
+
+class Transaction:
+    """DBManager.transaction() 内で使う書き込みハンドル（コミットはブロック終了時に1回だけ）"""
+
+    def __init__(self, connection: aiosqlite.Connection):
+        self.connection = connection
+
+    async def execute(self, query: str, parameters: tuple = ()) -> int:
+        tag, started = caller_tag(), time.perf_counter()
+        async with self.connection.execute(query, parameters) as cursor:
+            rowcount = cursor.rowcount
+        _record(tag, "execute", query, parameters, started)
+        return rowcount
+
+    async def executemany(self, query: str, parameters_list) -> int:
+        tag, started = caller_tag(), time.perf_counter()
+        parameters_list = list(parameters_list)
+        async with self.connection.executemany(query, parameters_list) as cursor:
+            rowcount = cursor.rowcount
+        _record(tag, "executemany", query, parameters_list[0] if parameters_list else (), started)
+        return rowcount
+
+    async def fetchrow(self, query: str, parameters: tuple = ()):
+        tag, started = caller_tag(), time.perf_counter()
+        async with self.connection.execute(query, parameters) as cursor:
+            row = await cursor.fetchone()
+        _record(tag, "fetchrow", query, parameters, started)
+        return row
+
+    async def fetchall(self, query: str, parameters: tuple = ()):
+        tag, started = caller_tag(), time.perf_counter()
+        async with self.connection.execute(query, parameters) as cursor:
+            rows = await cursor.fetchall()
+        _record(tag, "fetchall", query, parameters, started)
+        return rows
+
+
+class _LockedWriter(Transaction):
+    """書き込みロックを握ったまま DBManager と同じように書くハンドル（接続直後・リストア中のマイグレーション用）"""
+
+    async def execute(self, query: str, parameters: tuple = ()) -> int:
+        rowcount = await super().execute(query, parameters)
+        await self.connection.commit()
+        return rowcount
+
+    async def executemany(self, query: str, parameters_list) -> int:
+        rowcount = await super().executemany(query, parameters_list)
+        await self.connection.commit()
+        return rowcount
+
+    @asynccontextmanager
+    async def transaction(self):
+        await self.connection.execute("BEGIN")
+        try:
+            yield Transaction(self.connection)
+        except BaseException:
+            await self.connection.rollback()
+            raise
+        else:
+            await self.connection.commit()
+
+
 class DBManager:
     def __init__(self):
         self.db_path = DATABASE_PATH
         self.connection = None
+        # 書き込み（コミット単位）を直列化するロック
+        self._write_lock = asyncio.Lock()
+        # 読み取り専用接続のプール（WALなので書き込みをブロックしない）
+        self._readers: asyncio.Queue = asyncio.Queue()
+        self._reader_connections = []
 
     async def connect(self):
-        # Ensure directory exists
-        folder = os.path.dirname(self.db_path)
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-            print(f"Created database directory: {folder}")
+        # 接続済みなら何もしない（接続やリーダーを二重に開かない）
+        if self.connection:
+            return
 
-        self.connection = await aiosqlite.connect(self.db_path)
-        await self.connection.execute("PRAGMA foreign_keys = ON")
-        await self.create_tables()
-        print("Database connected.")
+        async with self._write_lock:
+            # ロック待ちの間に他のタスク（またはリストア）が開いていれば何もしない
+            if self.connection:
+                return
 
+            # Ensure directory exists
+            folder = os.path.dirname(self.db_path)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+                print(f"Created database directory: {folder}")
 
-    async def create_tables(self):
-        # サーバー設定用テーブル
-        await self.execute("""
-            CREATE TABLE IF NOT EXISTS server_config (
-                guild_id INTEGER PRIMARY KEY,
-                rank_emojis TEXT
-            )
-        """)
-
-        # 募集管理用テーブル
-        await self.execute("""
-            CREATE TABLE IF NOT EXISTS recruitments (
-                message_id INTEGER PRIMARY KEY,
-                channel_id INTEGER,
-                author_id INTEGER,
-                max_members INTEGER,
-                rank_range TEXT,
-                mode TEXT,
-                joined_members TEXT, -- JSON or comma separated IDs
-                is_closed INTEGER DEFAULT 0
-            )
-        """)
-        
-        # VC管理用テーブル
-        await self.execute("""
-            CREATE TABLE IF NOT EXISTS active_vcs (
-                vc_id INTEGER PRIMARY KEY,
-                text_channel_id INTEGER,
-                owner_id INTEGER,
-                party_code TEXT,
-                is_locked INTEGER DEFAULT 0,
-                panel_message_id INTEGER,
-                source_channel_id INTEGER
-            )
-        """)
-        
-        # 統計データ用テーブル (サーバー全体)
-        await self.execute("""
-            CREATE TABLE IF NOT EXISTS statistics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                guild_id INTEGER NOT NULL,
-                event_type TEXT NOT NULL,
-                date TEXT NOT NULL,
-                count INTEGER DEFAULT 0,
-                UNIQUE(guild_id, event_type, date)
-            )
-        """)
-
-        # 統計データ用テーブル (ユーザー別・ランキング用)
-        await self.execute("""
-            CREATE TABLE IF NOT EXISTS user_statistics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                guild_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                event_type TEXT NOT NULL,
-                date TEXT NOT NULL,
-                count INTEGER DEFAULT 0,
-                UNIQUE(guild_id, user_id, event_type, date)
-            )
-        """)
-        
-        # 統計テーブルのインデックス作成
-        await self.execute("""
-            CREATE INDEX IF NOT EXISTS idx_statistics_guild_date 
-            ON statistics(guild_id, date)
-        """)
-        
-        await self.execute("""
-            CREATE INDEX IF NOT EXISTS idx_user_statistics_ranking
-            ON user_statistics(guild_id, event_type, date)
-        """)
-        
-        await self.execute("""
-            CREATE INDEX IF NOT EXISTS idx_statistics_guild_event 
-            ON statistics(guild_id, event_type)
-        """)
-        
-        # カラム追加のマイグレーション
-        try:
-            await self.execute("ALTER TABLE active_vcs ADD COLUMN panel_message_id INTEGER")
-        except:
-            pass
-            
-        try:
-            await self.execute("ALTER TABLE active_vcs ADD COLUMN source_channel_id INTEGER")
-        except:
-            pass
+            query_stats.configure()
+            await self._open_writer()
+            await run_migrations(_LockedWriter(self.connection))
+            await self._open_readers()
+        print("Database connected.")
 
-        try:
-            await self.execute("ALTER TABLE recruitments ADD COLUMN vc_id INTEGER")
-        except:
-            pass
+    async def _open_writer(self):
+        self.connection = await aiosqlite.connect(self.db_path)
+        await self.connection.execute("PRAGMA journal_mode = WAL")
+        # WALではNORMALでも破損しない（電源断時に直近のコミットが失われ得るだけ）
+        await self.connection.execute("PRAGMA synchronous = NORMAL")
+        for pragma in CONNECTION_PRAGMAS:
+            await self.connection.execute(pragma)
+        await self.connection.execute("PRAGMA foreign_keys = ON")
 
-        try:
-            await self.execute("ALTER TABLE server_config ADD COLUMN recruit_channel_id INTEGER")
-        except:
-            pass
+    async def _open_readers(self):
+        """読み取り専用接続のプールを作成"""
+        uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        for _ in range(READER_POOL_SIZE):
+            reader = await aiosqlite.connect(uri, uri=True)
+            for pragma in CONNECTION_PRAGMAS:
+                await reader.execute(pragma)
+            await reader.execute("PRAGMA query_only = ON")
+            self._reader_connections.append(reader)
+            self._readers.put_nowait(reader)
 
+    @asynccontextmanager
+    async def _reader(self):
+        """プールから読み取り専用接続を借りる"""
+        reader = await self._readers.get()
         try:
-            await self.execute("ALTER TABLE server_config ADD COLUMN last_recruit_msg_id INTEGER")
-        except:
-            pass
-            
-        await self.connection.commit()
+            yield reader
+        finally:
+            self._readers.put_nowait(reader)
 
-    async def get_config(self, guild_id: int):
-        """サーバー設定を取得"""
-        row = await self.fetchrow("SELECT * FROM server_config WHERE guild_id = ?", (guild_id,))
-        if row:
-            import json
-            try:
-                rank_emojis = json.loads(row[1]) if row[1] else {}
-            except:
-                rank_emojis = {}
-            return {"rank_emojis": rank_emojis}
-        return {"rank_emojis": {}}
 
     async def update_rank_emoji(self, guild_id: int, rank_name: str, emoji_str: str):
-        """ランク絵文字を更新"""
-        import json
-        config = await self.get_config(guild_id)
-        current_emojis = config["rank_emojis"]
-        current_emojis[rank_name] = emoji_str
-        
-        # UPSERT的な処理 (SQLite 3.24+ なら INSERT OR REPLACE や ON CONFLICT が使えるが汎用的に)
-        exists = await self.fetchrow("SELECT 1 FROM server_config WHERE guild_id = ?", (guild_id,))
-        if exists:
-            await self.execute(
-                "UPDATE server_config SET rank_emojis = ? WHERE guild_id = ?",
-                (json.dumps(current_emojis), guild_id)
-            )
-        else:
-            await self.execute(
-                "INSERT INTO server_config (guild_id, rank_emojis) VALUES (?, ?)",
-                (guild_id, json.dumps(current_emojis))
+        """ランク絵文字を更新（1文のUPSERTでJSONの該当キーだけ書き換える）"""
+        json_path = f'$."{rank_name}"'
+        await self.execute(
+            """
+            INSERT INTO server_config (guild_id, rank_emojis) VALUES (?, json_object(?, ?))
+            ON CONFLICT(guild_id) DO UPDATE SET rank_emojis = json_set(
+                CASE WHEN json_valid(rank_emojis) THEN rank_emojis ELSE '{}' END, ?, ?
             )
+            """,
+            (guild_id, rank_name, emoji_str, json_path, emoji_str)
+        )
+
+    async def set_recruit_channel(self, guild_id: int, channel_id: int):
+        """募集チャンネルを設定"""
+        await self.execute(
+            """
+            INSERT INTO server_config (guild_id, recruit_channel_id) VALUES (?, ?)
+            ON CONFLICT(guild_id) DO UPDATE SET recruit_channel_id = excluded.recruit_channel_id
+            """,
+            (guild_id, channel_id)
+        )
+
+    async def set_last_recruit_msg(self, guild_id: int, message_id: int):
+        """募集ダッシュボードの最終メッセージIDを記録"""
+        await self.execute(
+            """
+            INSERT INTO server_config (guild_id, last_recruit_msg_id) VALUES (?, ?)
+            ON CONFLICT(guild_id) DO UPDATE SET last_recruit_msg_id = excluded.last_recruit_msg_id
+            """,
+            (guild_id, message_id)
+        )
+
+    async def set_timezone(self, guild_id: int, timezone_name: Optional[str]):
+        """統計の表示に使うタイムゾーンを設定（None で既定に戻す）"""
+        await self.execute(
+            """
+            INSERT INTO server_config (guild_id, timezone) VALUES (?, ?)
+            ON CONFLICT(guild_id) DO UPDATE SET timezone = excluded.timezone
+            """,
+            (guild_id, timezone_name)
+        )
+
+    @asynccontextmanager
+    async def hold_writes(self):
+        """ブロック内の間、他の書き込みを待たせる（バックアップのフォールバック用）"""
+        async with self._write_lock:
+            yield
+
+    async def replace_database(self, source_path: str):
+        """
+        DBファイルを source_path の内容に置き換えて開き直す（リストア用）。
+        マイグレーションと読み取り接続の作成まで書き込みロックを握ったまま行うので、
+        待っていた書き込み・読み取りは移行済みの新しいDBに対して実行される。
+        """
+        async with self._write_lock:
+            # 貸し出し中の読み取り接続が戻るのを待ってから閉じる
+            for _ in range(len(self._reader_connections)):
+                reader = await self._readers.get()
+                await reader.close()
+            self._reader_connections = []
+            # 差し替え中に来た処理が閉じた接続を使わないよう、先に外してから閉じる
+            connection, self.connection = self.connection, None
+            if connection:
+                await connection.close()
+
+            staging = self.db_path + ".restore"
+            shutil.copyfile(source_path, staging)
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(self.db_path + suffix):
+                    os.remove(self.db_path + suffix)
+            os.replace(staging, self.db_path)
+
+            await self._open_writer()
+            await run_migrations(_LockedWriter(self.connection))
+            await self._open_readers()
+        print(f"Database restored from {source_path}")
 
     async def close(self):
+        for reader in self._reader_connections:
+            await reader.close()
+        self._reader_connections = []
+        self._readers = asyncio.Queue()
         if self.connection:
             await self.connection.close()
+            self.connection = None
             print("Database connection closed.")
 
-    async def execute(self, query: str, parameters: tuple = ()):
+    async def execute(self, query: str, parameters: tuple = ()) -> int:
+        tag, requested = caller_tag(), time.perf_counter()
         if not self.connection:
             await self.connect()
-        async with self.connection.cursor() as cursor:
-            await cursor.execute(query, parameters)
-            await self.connection.commit()
+        async with self._write_lock:
+            started = time.perf_counter()
+            async with self.connection.cursor() as cursor:
+                await cursor.execute(query, parameters)
+                await self.connection.commit()
+                rowcount = cursor.rowcount
+        _record(tag, "execute", query, parameters, started, (started - requested) * 1000)
+        return rowcount
 
-    async def fetchrow(self, query: str, parameters: tuple = ()):
+    async def executemany(self, query: str, parameters_list) -> int:
+        """同じ文を複数のパラメータでまとめて実行（コミットは1回）"""
+        tag, requested = caller_tag(), time.perf_counter()
+        parameters_list = list(parameters_list)
         if not self.connection:
             await self.connect()
-        async with self.connection.execute(query, parameters) as cursor:
-            return await cursor.fetchone()
+        async with self._write_lock:
+            started = time.perf_counter()
+            async with self.connection.cursor() as cursor:
+                await cursor.executemany(query, parameters_list)
+                await self.connection.commit()
+                rowcount = cursor.rowcount
+        _record(
+            tag, "executemany", query, parameters_list[0] if parameters_list else (),
+            started, (started - requested) * 1000
+        )
+        return rowcount
 
-    async def fetchall(self, query: str, parameters: tuple = ()):
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        複数の書き込みを1トランザクションにまとめる。
+        ブロック内では yield された Transaction を使うこと（db.execute を呼ぶとロック待ちになる）。
+        """
         if not self.connection:
             await self.connect()
-        async with self.connection.execute(query, parameters) as cursor:
-            return await cursor.fetchall()
+        async with self._write_lock:
+            await self.connection.execute("BEGIN")
+            try:
+                yield Transaction(self.connection)
+            except BaseException:
+                await self.connection.rollback()
+                raise
+            else:
+                await self.connection.commit()
+
+    async def fetchrow(self, query: str, parameters: tuple = (), read_only: bool = False):
+        """
+        read_only=True なら読み取り専用プールで実行（直前の書き込みはコミット済みのものだけ見える）。
+        それ以外は書き込みロックを取って書き込み接続で読む。
+        """
+        tag, requested = caller_tag(), time.perf_counter()
+        if not self.connection:
+            await self.connect()
+        if read_only and self._reader_connections:
+            async with self._reader() as reader:
+                started = time.perf_counter()
+                async with reader.execute(query, parameters) as cursor:
+                    row = await cursor.fetchone()
+        else:
+            # 書き込み接続はトランザクションの途中を見せないよう、コミットの合間だけで読む
+            async with self._write_lock:
+                started = time.perf_counter()
+                async with self.connection.execute(query, parameters) as cursor:
+                    row = await cursor.fetchone()
+        _record(tag, "fetchrow", query, parameters, started, (started - requested) * 1000)
+        return row
+
+    async def fetchall(self, query: str, parameters: tuple = (), read_only: bool = False):
+        """read_only=True なら読み取り専用プールで実行（重い集計を書き込みキューから切り離す）"""
+        tag, requested = caller_tag(), time.perf_counter()
+        if not self.connection:
+            await self.connect()
+        if read_only and self._reader_connections:
+            async with self._reader() as reader:
+                started = time.perf_counter()
+                async with reader.execute(query, parameters) as cursor:
+                    rows = await cursor.fetchall()
+        else:
+            # 書き込み接続はトランザクションの途中を見せないよう、コミットの合間だけで読む
+            async with self._write_lock:
+                started = time.perf_counter()
+                async with self.connection.execute(query, parameters) as cursor:
+                    rows = await cursor.fetchall()
+        _record(tag, "fetchall", query, parameters, started, (started - requested) * 1000)
+        return rows
+
+    async def _explain(self, entry: dict, query: str, parameters):
+        """スロークエリの EXPLAIN QUERY PLAN を取得してログのエントリに付ける（計測対象外）"""
+        statement = entry["statement"]
+        plan = query_stats.plans.get(statement)
+        if plan is None:
+            try:
+                if self._reader_connections:
+                    async with self._reader() as reader:
+                        async with reader.execute("EXPLAIN QUERY PLAN " + query, parameters) as cursor:
+                            rows = await cursor.fetchall()
+                elif self.connection:
+                    async with self.connection.execute("EXPLAIN QUERY PLAN " + query, parameters) as cursor:
+                        rows = await cursor.fetchall()
+                else:
+                    return
+            except Exception as e:
+                plan = f"(実行計画を取得できません: {e})"
+            else:
+                plan = "\n".join(row[-1] for row in rows)
+            query_stats.plans[statement] = plan
+        entry["plan"] = plan
 
 db = DBManager()
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import discord
+
+# 購読者ごとのキューの上限（全シャード合計）。溢れた分は捨てて数える
+DEFAULT_CAPACITY = 1000
+
+# 遅延の移動平均の重み
+LAG_EMA_WEIGHT = 0.1
+
+
+def queue_capacity() -> int:
+    """EVENT_BUS_QUEUE_SIZE（数値でなければ既定値、最低1）"""
+    try:
+        capacity = int(os.getenv("EVENT_BUS_QUEUE_SIZE", DEFAULT_CAPACITY))
+    except ValueError:
+        capacity = DEFAULT_CAPACITY
+    return max(capacity, 1)
+
+# ==================== イベント ====================
+
+VOICE_STATE = "voice_state"
+
+
+class VoiceStateEvent:
+    """
+    VCの出入り・移動1件分（ミュートなどチャンネルが変わらない更新は流さない）。
+    VoiceState は持たず、購読者が使うメンバーと前後のチャンネルだけを参照で持つ
+    """
+
+    __slots__ = ("member", "before", "after", "at")
+
+    def __init__(
+        self,
+        member: discord.Member,
+        before: Optional[discord.abc.GuildChannel],
+        after: Optional[discord.abc.GuildChannel],
+        at: Optional[float] = None
+    ):
+        self.member = member
+        self.before = before
+        self.after = after
+        # ゲートウェイで受け取った時刻（処理が遅れても滞在時間などはこの時刻で数える）
+        self.at = time.time() if at is None else at
+
+    @property
+    def guild_id(self) -> int:
+        return self.member.guild.id
+
+    @property
+    def key(self) -> tuple:
+        """同じメンバーのイベントは同じワーカーで順番どおりに処理する"""
+        return (self.member.guild.id, self.member.id)
+
+
+# ==================== 購読者 ====================
+
+Handler = Callable[[Any], Awaitable[None]]
+
+
+class _Consumer:
+    """1購読者分のキューとワーカー"""
+
+    def __init__(self, name: str, topic: str, handler: Handler, concurrency: int, capacity: int,
+                 key: Optional[Callable[[Any], Hashable]]):
+        self.name = name
+        self.topic = topic
+        self.handler = handler
+        self.key = key
+        # ワーカー1つにキュー1つ。キーで振り分けるので、同じキーのイベントは追い越さない
+        per_shard = max(capacity // concurrency, 1)
+        self.queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=per_shard) for _ in range(concurrency)]
+        self.capacity = per_shard * concurrency
+        self.tasks: List[asyncio.Task] = []
+
+        # メトリクス
+        self.published = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.busy = 0
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    def offer(self, event: Any) -> bool:
+        """キューに積む（溢れたら捨てる）。ここで待つとゲートウェイ側が止まるので待たない"""
+        shard = hash(self.key(event)) % len(self.queues) if self.key and len(self.queues) > 1 else 0
+        try:
+            self.queues[shard].put_nowait((event, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.published += 1
+        depth = self.depth()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            event, enqueued_at = await queue.get()
+            lag = (time.perf_counter() - enqueued_at) * 1000
+            self.lag_ms += (lag - self.lag_ms) * LAG_EMA_WEIGHT
+            self.max_lag_ms = max(self.max_lag_ms, lag)
+            self.busy += 1
+            try:
+                await self.handler(event)
+                self.processed += 1
+            except Exception as e:
+                # 1件の失敗で購読者ごと止めない
+                self.errors += 1
+                print(f"イベント処理エラー ({self.name}): {e}")
+            finally:
+                self.busy -= 1
+                queue.task_done()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self._work(q)) for q in self.queues]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def get_metrics(self) -> dict:
+        return {
+            "topic": self.topic,
+            "concurrency": len(self.queues),
+            "capacity": self.capacity,
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "busy": self.busy,
+            "published": self.published,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "lag_ms": round(self.lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+        }
+
+
+class EventBus:
+    """
+    ゲートウェイのイベントを購読者（コグ）ごとの上限付きキューに配るバス。
+    リスナーは publish() で積むだけで戻り、各購読者は自分のワーカーで処理する。
+    キューもワーカーも購読者ごとに別なので、1つの購読者が詰まっても他は遅れない
+    （詰まった購読者のキューが溢れた分は捨てて dropped に数える）。
+    """
+
+    def __init__(self):
+        self._consumers: Dict[str, _Consumer] = {}
+        self._by_topic: Dict[str, List[_Consumer]] = {}
+
+    def subscribe(
+        self,
+        topic: str,
+        name: str,
+        handler: Handler,
+        concurrency: int = 1,
+        capacity: Optional[int] = None,
+        key: Optional[Callable[[Any], Hashable]] = None
+    ):
+        """
+        購読者を登録してワーカーを起動する（コグの __init__ から呼ぶ）。
+        concurrency が2以上のときは key の値でワーカーを振り分ける（同じキーは順番どおり）。
+        capacity を省略すると EVENT_BUS_QUEUE_SIZE（既定 DEFAULT_CAPACITY）
+        """
+        if capacity is None:
+            capacity = queue_capacity()
+        self.unsubscribe_nowait(name)
+        consumer = _Consumer(name, topic, handler, max(concurrency, 1), capacity, key)
+        consumer.start()
+        self._consumers[name] = consumer
+        self._by_topic.setdefault(topic, []).append(consumer)
+
+    def _detach(self, name: str) -> Optional[_Consumer]:
+        consumer = self._consumers.pop(name, None)
+        if consumer is not None:
+            self._by_topic[consumer.topic].remove(consumer)
+        return consumer
+
+    def unsubscribe_nowait(self, name: str):
+        """購読を外す（cog_unload から呼ぶ。残っているイベントは捨てる）"""
+        consumer = self._detach(name)
+        if consumer is not None:
+            for task in consumer.tasks:
+                task.cancel()
+
+    def publish(self, topic: str, event: Any) -> int:
+        """購読者のキューに積む（待たない）。積めた購読者の数を返す"""
+        return sum(consumer.offer(event) for consumer in self._by_topic.get(topic, ()))
+
+    async def stop(self):
+        """全購読者のワーカーを止める"""
+        for name in list(self._consumers):
+            consumer = self._detach(name)
+            await consumer.stop()
+
+    def get_metrics(self) -> Dict[str, dict]:
+        return {name: consumer.get_metrics() for name, consumer in self._consumers.items()}
+
+
+event_bus = EventBus()
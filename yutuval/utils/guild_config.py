@@ -0,0 +1,95 @@
+import json
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from utils.db_manager import db
+
+# タイムゾーンを設定していないサーバーの統計は日本時間で表示する
+DEFAULT_TIMEZONE = "Asia/Tokyo"
+
+
+def load_timezone(name: Optional[str]) -> Optional[ZoneInfo]:
+    """タイムゾーン名を読み込む（不正な名前は None）"""
+    try:
+        return ZoneInfo(name) if name else None
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+class GuildConfig:
+    """サーバーごとの設定（server_config の1行分）"""
+
+    __slots__ = ("guild_id", "rank_emojis", "recruit_channel_id", "last_recruit_msg_id", "timezone")
+
+    def __init__(
+        self,
+        guild_id: int,
+        rank_emojis: Optional[Dict[str, str]] = None,
+        recruit_channel_id: Optional[int] = None,
+        last_recruit_msg_id: Optional[int] = None,
+        timezone: Optional[str] = None
+    ):
+        self.guild_id = guild_id
+        self.rank_emojis: Dict[str, str] = rank_emojis or {}
+        self.recruit_channel_id = recruit_channel_id
+        self.last_recruit_msg_id = last_recruit_msg_id
+        self.timezone = timezone
+
+    @classmethod
+    def from_row(cls, row) -> "GuildConfig":
+        guild_id, rank_emojis_json, recruit_channel_id, last_recruit_msg_id, timezone = row
+        try:
+            rank_emojis = json.loads(rank_emojis_json) if rank_emojis_json else {}
+        except (TypeError, ValueError):
+            rank_emojis = {}
+        return cls(guild_id, rank_emojis, recruit_channel_id, last_recruit_msg_id, timezone)
+
+    @property
+    def tzinfo(self) -> ZoneInfo:
+        """統計の表示に使うタイムゾーン（未設定・不正なら DEFAULT_TIMEZONE）"""
+        return load_timezone(self.timezone) or ZoneInfo(DEFAULT_TIMEZONE)
+
+
+class GuildConfigCache:
+    """
+    サーバー設定のメモリキャッシュ。
+    起動時に全件読み込み、読み取りはメモリから返す。書き込みはDBとキャッシュを同時に更新する。
+    """
+
+    def __init__(self):
+        self._configs: Dict[int, GuildConfig] = {}
+
+    async def load_all(self):
+        """server_config を一括読み込み"""
+        rows = await db.fetchall(
+            "SELECT guild_id, rank_emojis, recruit_channel_id, last_recruit_msg_id, timezone FROM server_config"
+        )
+        self._configs = {row[0]: GuildConfig.from_row(row) for row in rows}
+        print(f"⚙️ サーバー設定を読み込みました: {len(self._configs)}件")
+
+    def get(self, guild_id: int) -> GuildConfig:
+        """設定を取得（未設定のサーバーはデフォルト値）"""
+        config = self._configs.get(guild_id)
+        if config is None:
+            config = GuildConfig(guild_id)
+            self._configs[guild_id] = config
+        return config
+
+    async def set_rank_emoji(self, guild_id: int, rank_name: str, emoji_str: str):
+        await db.update_rank_emoji(guild_id, rank_name, emoji_str)
+        self.get(guild_id).rank_emojis[rank_name] = emoji_str
+
+    async def set_recruit_channel(self, guild_id: int, channel_id: int):
+        await db.set_recruit_channel(guild_id, channel_id)
+        self.get(guild_id).recruit_channel_id = channel_id
+
+    async def set_last_recruit_msg(self, guild_id: int, message_id: int):
+        await db.set_last_recruit_msg(guild_id, message_id)
+        self.get(guild_id).last_recruit_msg_id = message_id
+
+    async def set_timezone(self, guild_id: int, timezone_name: Optional[str]):
+        await db.set_timezone(guild_id, timezone_name)
+        self.get(guild_id).timezone = timezone_name
+
+
+guild_configs = GuildConfigCache()
@@ -0,0 +1,369 @@
+import asyncio
+import time
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.db_manager import db
+from utils.rollups import build_windowed_query
+from utils.stats_buffer import stats_buffer
+
+# ランキングを常に持っておく期間（日数。/stats ranking の days と同じく、N日前から今日まで）
+# 短い期間は日別の明細で1日ずつずらし、長い期間は日付が変わるたびに週次・月次ロールアップから作り直す
+SLIDING_WINDOWS = (1, 7)
+ROLLUP_WINDOWS = (30, 90)
+WINDOWS = SLIDING_WINDOWS + ROLLUP_WINDOWS
+
+# ランキング対象のイベント
+RANKED_EVENTS = ("message_sent", "vc_join", "vc_minutes", "recruit_joined", "recruit_created")
+
+# 順位付きリストの1バケットの目安の件数（2倍を超えたら分割する）
+BUCKET_LOAD = 256
+
+BoardKey = Tuple[int, str]      # (guild_id, event_type)
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _day_key(day: date) -> str:
+    return day.strftime("%Y-%m-%d")
+
+
+class _RankedKeys:
+    """
+    昇順に並べたキーの集合。BUCKET_LOAD 件前後のソート済みバケットに分け、
+    各バケットの件数をフェニック木で持つので、挿入・削除・順位はいずれも O(log n)
+    （バケット内の詰め直しは最大 2 * BUCKET_LOAD 件）
+    """
+
+    __slots__ = ("buckets", "maxes", "tree")
+
+    def __init__(self, keys: Iterable[tuple] = ()):
+        keys = list(keys)
+        self.buckets: List[List[tuple]] = [keys[i:i + BUCKET_LOAD] for i in range(0, len(keys), BUCKET_LOAD)]
+        self._reindex()
+
+    def _reindex(self):
+        """バケットの分割・削除のあとに、各バケットの最大値とフェニック木を作り直す"""
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        tree = [0] * (len(self.buckets) + 1)
+        for i, bucket in enumerate(self.buckets, 1):
+            tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _bump(self, index: int, delta: int):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def _count_before(self, index: int) -> int:
+        """buckets[:index] に入っているキーの数"""
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def __len__(self) -> int:
+        return self._count_before(len(self.buckets))
+
+    def insert(self, key: tuple):
+        if not self.buckets:
+            self.buckets = [[key]]
+            self._reindex()
+            return
+        index = min(bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[index]
+        insort(bucket, key)
+        self.maxes[index] = bucket[-1]
+        if len(bucket) > 2 * BUCKET_LOAD:
+            self.buckets[index:index + 1] = [bucket[:BUCKET_LOAD], bucket[BUCKET_LOAD:]]
+            self._reindex()
+        else:
+            self._bump(index, 1)
+
+    def remove(self, key: tuple):
+        """key を取り除く（入っていること）"""
+        index = bisect_left(self.maxes, key)
+        bucket = self.buckets[index]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self.maxes[index] = bucket[-1]
+            self._bump(index, -1)
+        else:
+            del self.buckets[index]
+            self._reindex()
+
+    def index(self, key: tuple) -> int:
+        """key より前にあるキーの数（key は入っていること）"""
+        bucket_index = bisect_left(self.maxes, key)
+        return self._count_before(bucket_index) + bisect_left(self.buckets[bucket_index], key)
+
+    def head(self, limit: int) -> List[tuple]:
+        keys: List[tuple] = []
+        for bucket in self.buckets:
+            if len(keys) >= limit:
+                break
+            keys.extend(bucket[:limit - len(keys)])
+        return keys
+
+
+class _Board:
+    """1つの期間のランキング。合計の降順（同点はユーザーID順）に並べ、更新・順位・上位N件を O(log n) で扱う"""
+
+    __slots__ = ("totals", "order")
+
+    def __init__(self):
+        self.totals: Dict[int, int] = {}
+        # (-合計, user_id) の昇順 = 合計の降順
+        self.order = _RankedKeys()
+
+    def add(self, user_id: int, delta: int):
+        old = self.totals.get(user_id, 0)
+        new = old + delta
+        if old:
+            self.order.remove((-old, user_id))
+        if new > 0:
+            self.totals[user_id] = new
+            self.order.insert((-new, user_id))
+        else:
+            self.totals.pop(user_id, None)
+
+    def load(self, totals: Dict[int, int]):
+        """合計から一度に作り直す（1件ずつ add するより速い）"""
+        self.totals = {user_id: total for user_id, total in totals.items() if total > 0}
+        self.order = _RankedKeys(sorted((-total, user_id) for user_id, total in self.totals.items()))
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        return [(user_id, -negative) for negative, user_id in self.order.head(limit)]
+
+    def rank(self, user_id: int) -> Optional[Tuple[int, int]]:
+        """(順位, 合計)。記録が無ければ None"""
+        total = self.totals.get(user_id)
+        if not total:
+            return None
+        return self.order.index((-total, user_id)) + 1, total
+
+
+class _EventBoards:
+    """1サーバー・1イベント分の期間ごとのランキングと、短い期間をずらすための日別の明細"""
+
+    __slots__ = ("days", "boards")
+
+    def __init__(self):
+        # 日付 -> user_id -> 件数（SLIDING_WINDOWS の最も長い期間の分だけ持つ）
+        self.days: Dict[str, Dict[int, int]] = {}
+        self.boards: Dict[int, _Board] = {window: _Board() for window in WINDOWS}
+
+    def add(self, day: str, user_id: int, count: int, today: date, windows: Iterable[int] = WINDOWS):
+        if day >= _day_key(today - timedelta(days=max(SLIDING_WINDOWS))):
+            users = self.days.setdefault(day, {})
+            users[user_id] = users.get(user_id, 0) + count
+        for window in windows:
+            if day >= _day_key(today - timedelta(days=window)):
+                self.boards[window].add(user_id, count)
+
+    def rebuild_sliding(self, today: date):
+        """日別の明細から短い期間のランキングを作り直す"""
+        for window in SLIDING_WINDOWS:
+            start = _day_key(today - timedelta(days=window))
+            totals: Dict[int, int] = {}
+            for day, users in self.days.items():
+                if day >= start:
+                    for user_id, count in users.items():
+                        totals[user_id] = totals.get(user_id, 0) + count
+            self.boards[window].load(totals)
+
+    def slide(self, old_today: date, new_today: date):
+        """日付が変わった分、短い期間から外れた日の件数を引き、どの期間にも入らない日を捨てる"""
+        for window in SLIDING_WINDOWS:
+            board = self.boards[window]
+            old_start = _day_key(old_today - timedelta(days=window))
+            new_start = _day_key(new_today - timedelta(days=window))
+            for day, users in self.days.items():
+                if old_start <= day < new_start:
+                    for user_id, count in users.items():
+                        board.add(user_id, -count)
+
+        oldest = _day_key(new_today - timedelta(days=max(SLIDING_WINDOWS)))
+        for day in [day for day in self.days if day < oldest]:
+            del self.days[day]
+
+
+class LeaderboardIndex:
+    """
+    サーバー・イベント・期間 (1/7/30/90日) ごとのユーザーランキングをメモリに持つ。
+    起動時に 1/7日は user_statistics の日次から、30/90日は週次・月次ロールアップ + 端の日次から作り、
+    以後は stats_buffer のフラッシュ通知で加算する
+    （DBに書き込まれた分だけを数えるので、SQLで集計した結果と一致する）。
+    日付が変わると、1/7日は期間から外れた日の分を引いてずらし、30/90日はロールアップから作り直す
+    （作り直しが終わるまで supports() は False を返し、呼び出し側はSQLで集計する）。
+    """
+
+    def __init__(self):
+        self._boards: Dict[BoardKey, _EventBoards] = {}
+        self._today: Optional[date] = None
+        # 30/90日のランキングをどの日付で作ったか（_today と違えば作り直し待ち）
+        self._rollup_day: Optional[date] = None
+        self._rollup_task: Optional[asyncio.Task] = None
+        self.loaded = False
+
+        # メトリクス
+        self.rebuild_ms = 0.0
+        self.rollup_rebuilds = 0
+        self.updates = 0
+        self.lookups = 0
+
+    async def _fetch_daily(self, today: date) -> list:
+        """短い期間をずらすための日別の明細"""
+        return await db.fetchall(
+            f"""
+            SELECT guild_id, event_type, user_id, date, count FROM user_statistics
+            WHERE date >= ? AND date <= ? AND event_type IN ({', '.join('?' for _ in RANKED_EVENTS)})
+            """,
+            (_day_key(today - timedelta(days=max(SLIDING_WINDOWS))), _day_key(today), *RANKED_EVENTS),
+            read_only=True
+        )
+
+    async def _fetch_rollups(self, today: date) -> Dict[BoardKey, List[Dict[int, int]]]:
+        """30/90日の合計を1回の走査で読む。(guild_id, event_type) -> ROLLUP_WINDOWS 順の {user_id: 合計}"""
+        windows = [(today - timedelta(days=window), today) for window in ROLLUP_WINDOWS]
+        query, params = build_windowed_query(
+            windows, "user_statistics", "guild_id, event_type, user_id",
+            f"event_type IN ({', '.join('?' for _ in RANKED_EVENTS)})", RANKED_EVENTS
+        )
+        totals: Dict[BoardKey, List[Dict[int, int]]] = {}
+        for guild_id, event_type, user_id, *counts in await db.fetchall(query, tuple(params), read_only=True):
+            per_window = totals.setdefault((guild_id, event_type), [{} for _ in ROLLUP_WINDOWS])
+            for users, count in zip(per_window, counts):
+                if count:
+                    users[user_id] = count
+        return totals
+
+    def _load_rollups(self, totals: Dict[BoardKey, List[Dict[int, int]]], today: date):
+        for key in totals:
+            self._event_boards(*key)
+        for key, boards in self._boards.items():
+            per_window = totals.get(key)
+            for i, window in enumerate(ROLLUP_WINDOWS):
+                boards.boards[window].load(per_window[i] if per_window else {})
+        self._rollup_day = today
+
+    async def load_all(self):
+        """直近の日次明細とロールアップから作り直す（stats_buffer のフラッシュ開始前に呼ぶ）"""
+        started = time.perf_counter()
+        # 読んでいる間のフラッシュを待たせる（読んだ分と通知で二重に数えないように）
+        async with stats_buffer.hold_flushes():
+            today = _today()
+            rows = await self._fetch_daily(today)
+            rollups = await self._fetch_rollups(today)
+
+            self._boards = {}
+            self._today = today
+            for guild_id, event_type, user_id, day, count in rows:
+                if count:
+                    users = self._event_boards(guild_id, event_type).days.setdefault(day, {})
+                    users[user_id] = users.get(user_id, 0) + count
+            for boards in self._boards.values():
+                boards.rebuild_sliding(today)
+            self._load_rollups(rollups, today)
+
+        if not self.loaded:
+            stats_buffer.add_flush_listener(self.on_flush)
+        self.loaded = True
+        self.rebuild_ms = (time.perf_counter() - started) * 1000
+        print(f"🏆 ランキングを構築しました: {len(self._boards)}件 ({len(rows):,}行, {self.rebuild_ms:.0f}ms)")
+
+    async def _rebuild_rollups(self):
+        """日付が変わった後、30/90日のランキングをロールアップから作り直す"""
+        started = time.perf_counter()
+        try:
+            async with stats_buffer.hold_flushes():
+                today = self._today
+                self._load_rollups(await self._fetch_rollups(today), today)
+        except Exception as e:
+            # 作り直せるまではSQLで集計する（次の参照・フラッシュで再試行）
+            print(f"ランキングの作り直しエラー: {e}")
+            return
+        self.rollup_rebuilds += 1
+        self.rebuild_ms = (time.perf_counter() - started) * 1000
+
+    def _event_boards(self, guild_id: int, event_type: str) -> _EventBoards:
+        boards = self._boards.get((guild_id, event_type))
+        if boards is None:
+            boards = _EventBoards()
+            self._boards[(guild_id, event_type)] = boards
+        return boards
+
+    def _rollups_current(self) -> bool:
+        return self._rollup_day is not None and self._rollup_day == self._today
+
+    def _advance(self):
+        """日付が変わっていれば短い期間をずらし、長い期間の作り直しを始める"""
+        today = _today()
+        if self._today is not None and today > self._today:
+            for boards in self._boards.values():
+                boards.slide(self._today, today)
+        self._today = today
+        if self.loaded and not self._rollups_current() and (self._rollup_task is None or self._rollup_task.done()):
+            self._rollup_task = asyncio.get_running_loop().create_task(self._rebuild_rollups())
+
+    # ==================== 更新 ====================
+
+    def on_flush(self, server: dict, user: dict):
+        """stats_buffer のフラッシュ通知（書き込まれたユーザー別の件数を加算）"""
+        self._advance()
+        # 作り直し待ちの長い期間には足さない（作り直しでDBから読む）
+        windows = WINDOWS if self._rollups_current() else SLIDING_WINDOWS
+        oldest = _day_key(self._today - timedelta(days=max(WINDOWS)))
+        today = _day_key(self._today)
+        for (guild_id, user_id, event_type, day), count in user.items():
+            if event_type in RANKED_EVENTS and oldest <= day <= today:
+                self._event_boards(guild_id, event_type).add(day, user_id, count, self._today, windows)
+                self.updates += 1
+
+    # ==================== 参照 ====================
+
+    def _board(self, guild_id: int, event_type: str, days: int) -> Optional[_Board]:
+        self._advance()
+        self.lookups += 1
+        boards = self._boards.get((guild_id, event_type))
+        return boards.boards[days] if boards else None
+
+    def supports(self, event_type: str, days: int) -> bool:
+        if not (self.loaded and event_type in RANKED_EVENTS and days in WINDOWS):
+            return False
+        if days in ROLLUP_WINDOWS:
+            self._advance()
+            return self._rollups_current()
+        return True
+
+    def top(self, guild_id: int, event_type: str, days: int, limit: int = 10) -> List[Tuple[int, int]]:
+        """上位 limit 件の (user_id, 合計)"""
+        board = self._board(guild_id, event_type, days)
+        return board.top(limit) if board else []
+
+    def rank(self, guild_id: int, event_type: str, days: int, user_id: int) -> Optional[Tuple[int, int]]:
+        """ユーザーの (順位, 合計)。記録が無ければ None"""
+        board = self._board(guild_id, event_type, days)
+        return board.rank(user_id) if board else None
+
+    def get_metrics(self) -> dict:
+        return {
+            "boards": len(self._boards),
+            "entries": sum(len(b.boards[max(WINDOWS)].totals) for b in self._boards.values()),
+            "rebuild_ms": round(self.rebuild_ms, 2),
+            "rollup_rebuilds": self.rollup_rebuilds,
+            "rollups_current": self._rollups_current(),
+            "updates": self.updates,
+            "lookups": self.lookups,
+        }
+
+
+leaderboards = LeaderboardIndex()
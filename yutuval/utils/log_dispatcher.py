@@ -0,0 +1,301 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import aiohttp
+import discord
+
+from utils.log_outbox import LogOutbox
+from utils.webhook_sink import WebhookSink
+
+# 1メッセージに載せられる Embed の上限（Discordの制限）
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+# 最初のログが来てから送信するまで待つ時間（秒）。10件溜まればすぐ送る
+FLUSH_WINDOW = 1.0
+
+# チャンネルごとにメモリに持つ送信待ちの上限。超えた分はアウトボックスにだけ残し、追いついたら読み戻す
+MAX_QUEUED_PER_CHANNEL = 500
+
+# 一時的な送信失敗の再試行間隔（秒）。失敗が続くたびに倍にする
+RETRY_BASE = 1.0
+RETRY_MAX = 300.0
+
+# 時間を置けば通る見込みのあるエラー（ネットワーク断など）
+_RETRYABLE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, discord.HTTPException):
+        # 429 と 5xx は再試行、それ以外の 4xx（権限・内容の問題）は送り直しても通らない
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, _RETRYABLE_ERRORS)
+
+
+class _ChannelQueue:
+    """ログチャンネル1つ分の送信待ち行列"""
+
+    __slots__ = ("channel", "items", "wakeup", "task", "failures", "last_seq", "shed")
+
+    def __init__(self, channel: discord.abc.Messageable):
+        self.channel = channel
+        # (seq, embed, 受付時刻)
+        self.items: Deque[Tuple[int, discord.Embed, float]] = deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.failures = 0
+        # items に積んだ最後の seq と、それより後をアウトボックスにだけ残しているか
+        self.last_seq = 0
+        self.shed = False
+
+
+class LogDispatcher:
+    """
+    ログ用 Embed をチャンネルごとにまとめて送る。
+    リスナーは enqueue() で積むだけで待たず、チャンネルごとのワーカーが
+    FLUSH_WINDOW 秒（または10件）ごとに最大10件を1メッセージに詰めて順番どおり送信する。
+    受け付けたログはアウトボックスにも書き、送れた所まで ack する。
+    送信が追いつかずチャンネルの待ち行列が MAX_QUEUED_PER_CHANNEL 件を超えた分は
+    アウトボックスにだけ残し、手前を送り終えてから seq 順に読み戻す。
+    一時的な失敗はバックオフして再試行し、再起動後は start() で未送信分から送り直す。
+    """
+
+    def __init__(self, flush_window: float = FLUSH_WINDOW):
+        self.flush_window = flush_window
+        self._queues: Dict[int, _ChannelQueue] = {}
+        self._started = False
+        # 実際の送信先（Webhook が有効ならそちら、無効なら Bot の channel.send）
+        self.sink = WebhookSink()
+        self.outbox = LogOutbox()
+
+        # メトリクス
+        self.messages_sent = 0
+        self.embeds_sent = 0
+        self.send_errors = 0
+        self.retries = 0
+        self.dropped = 0
+        self.replayed = 0
+        self.shed = 0
+        self.total_send_ms = 0.0
+        self.max_send_ms = 0.0
+        self.last_send_ms = 0.0
+        self.max_delay_ms = 0.0
+
+    # ==================== 受付 ====================
+
+    def _queue_for(self, channel: discord.abc.Messageable) -> _ChannelQueue:
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = _ChannelQueue(channel)
+            self._queues[channel.id] = queue
+        queue.channel = channel
+        return queue
+
+    def enqueue(self, channel: discord.abc.Messageable, embed: discord.Embed):
+        """送信待ちに追加する（待たない）"""
+        seq = self.outbox.next_seq()
+        self.outbox.append(seq, channel.id, embed)
+
+        queue = self._queue_for(channel)
+        if queue.shed or len(queue.items) >= MAX_QUEUED_PER_CHANNEL:
+            # 一度溢れたら、読み戻しが追いつくまで後続もアウトボックス経由にする（順番が前後しないように）
+            queue.shed = True
+            self.shed += 1
+        else:
+            queue.items.append((seq, embed, time.perf_counter()))
+            queue.last_seq = seq
+        self._wake(queue)
+
+    def _wake(self, queue: _ChannelQueue):
+        queue.wakeup.set()
+        # start() で未送信分を読み込むまでは送らない（順番が前後しないように）
+        if self._started and (queue.task is None or queue.task.done()):
+            queue.task = asyncio.get_running_loop().create_task(self._run(queue))
+
+    def queue_depth(self) -> int:
+        return sum(len(q.items) for q in self._queues.values())
+
+    def _trim(self, queue: _ChannelQueue):
+        """上限を超えた分をメモリから外す（アウトボックスには残っている）"""
+        while len(queue.items) > MAX_QUEUED_PER_CHANNEL:
+            queue.items.pop()
+            queue.shed = True
+        if queue.items:
+            queue.last_seq = queue.items[-1][0]
+
+    # ==================== 送信 ====================
+
+    async def _run(self, queue: _ChannelQueue):
+        while True:
+            await queue.wakeup.wait()
+            await self._wait_window(queue)
+            while queue.items or queue.shed:
+                if not queue.items:
+                    if not await self._refill(queue):
+                        await asyncio.sleep(RETRY_BASE)
+                    continue
+                if not await self._send_batch(queue):
+                    await asyncio.sleep(min(RETRY_BASE * 2 ** (queue.failures - 1), RETRY_MAX))
+            queue.wakeup.clear()
+
+    async def _refill(self, queue: _ChannelQueue) -> bool:
+        """アウトボックスにだけ残した分を seq 順に読み戻す。まだDBに書けていなければ False"""
+        # stop() でワーカーが止められても、書き込み途中の分を失わないように最後まで書く
+        await asyncio.shield(self.outbox.flush())
+        events = await self.outbox.load_channel(queue.channel.id, queue.last_seq, MAX_QUEUED_PER_CHANNEL)
+        if events:
+            # 受付時刻はDBの created_at（UNIX秒）から換算する
+            now, wall = time.perf_counter(), time.time()
+            queue.items.extend((seq, embed, now - (wall - created_at)) for seq, embed, created_at in events)
+            queue.last_seq = events[-1][0]
+            return True
+        if self.outbox.has_pending(queue.channel.id):
+            return False
+        queue.shed = False
+        return True
+
+    async def _wait_window(self, queue: _ChannelQueue):
+        """窓が閉じるか、1メッセージ分が溜まるまで待つ"""
+        deadline = time.perf_counter() + self.flush_window
+        while len(queue.items) < MAX_EMBEDS_PER_MESSAGE:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            queue.wakeup.clear()
+            try:
+                await asyncio.wait_for(queue.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    def _peek_batch(self, queue: _ChannelQueue) -> list:
+        """先頭から、件数と合計文字数の上限に収まる分を返す（取り出すのは送信後）"""
+        batch = []
+        chars = 0
+        for item in queue.items:
+            if len(batch) >= MAX_EMBEDS_PER_MESSAGE:
+                break
+            size = len(item[1])
+            if batch and chars + size > MAX_EMBED_CHARS_PER_MESSAGE:
+                break
+            batch.append(item)
+            chars += size
+        return batch
+
+    def _complete(self, queue: _ChannelQueue, batch: list):
+        """キューから外し、アウトボックスに送信済みとして記録する"""
+        for _ in batch:
+            queue.items.popleft()
+        self.outbox.ack(queue.channel.id, batch[-1][0])
+
+    async def _send_batch(self, queue: _ChannelQueue) -> bool:
+        """1メッセージ分を送る。一時的な失敗でキューに残したときは False"""
+        batch = self._peek_batch(queue)
+        if not batch:
+            return True
+
+        started = time.perf_counter()
+        try:
+            await self.sink.send(queue.channel, [embed for _, embed, _ in batch])
+        except asyncio.CancelledError:
+            # 送信途中で止められた分はキューに残し、stop() か次回起動時に送り直す
+            raise
+        except Exception as e:
+            self.send_errors += 1
+            if _is_retryable(e):
+                queue.failures += 1
+                self.retries += 1
+                print(f"ログ送信エラー (channel={queue.channel.id}, {len(batch)}件, {queue.failures}回目・再試行します): {e}")
+                return False
+            # 送り直しても通らない分は捨てる（同じバッチで詰まり続けないように）
+            print(f"ログ送信エラー (channel={queue.channel.id}, {len(batch)}件を破棄): {e}")
+            self.dropped += len(batch)
+            self._complete(queue, batch)
+            return True
+
+        queue.failures = 0
+        self._complete(queue, batch)
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.messages_sent += 1
+        self.embeds_sent += len(batch)
+        self.total_send_ms += elapsed
+        self.last_send_ms = elapsed
+        self.max_send_ms = max(self.max_send_ms, elapsed)
+        self.max_delay_ms = max(self.max_delay_ms, (started - batch[0][2]) * 1000)
+        return True
+
+    # ==================== ライフサイクル ====================
+
+    async def start(self, bot: discord.Client):
+        """前回送れなかったログを読み込んでから送信を始める（DB接続後に呼ぶ）"""
+        if self._started:
+            return
+        self.sink.configure()
+
+        replay: Dict[int, list] = {}
+        for seq, channel_id, embed in await self.outbox.load_pending():
+            replay.setdefault(channel_id, []).append((seq, embed, time.perf_counter()))
+
+        for channel_id, items in replay.items():
+            channel = bot.get_channel(channel_id)
+            if channel is None:
+                # 送信先のチャンネルがもう無い
+                self.dropped += len(items)
+                self.outbox.ack(channel_id, items[-1][0])
+                continue
+            queue = self._queue_for(channel)
+            # 起動中に受け付けた分より前に並ぶ（seq 順）
+            queue.items = deque(sorted([*items, *queue.items], key=lambda item: item[0]))
+            self._trim(queue)
+            self.replayed += len(items)
+
+        if self.replayed:
+            print(f"📨 未送信のログを再送します: {self.replayed}件")
+
+        self.outbox.start()
+        self._started = True
+        for queue in self._queues.values():
+            if queue.items:
+                self._wake(queue)
+
+    async def stop(self):
+        """ワーカーを止めて、残っているログを送れるだけ送る（送れなかった分は次回起動時に再送）"""
+        for queue in self._queues.values():
+            if queue.task:
+                queue.task.cancel()
+                try:
+                    await queue.task
+                except asyncio.CancelledError:
+                    pass
+                queue.task = None
+            while queue.items:
+                if not await self._send_batch(queue):
+                    break
+        self._started = False
+        await self.outbox.stop()
+        await self.sink.close()
+
+    def get_metrics(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth(),
+            "channels": {channel_id: len(q.items) for channel_id, q in self._queues.items()},
+            "messages_sent": self.messages_sent,
+            "embeds_sent": self.embeds_sent,
+            "embeds_per_message": round(self.embeds_sent / self.messages_sent, 2) if self.messages_sent else 0,
+            "send_errors": self.send_errors,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "replayed": self.replayed,
+            "shed": self.shed,
+            "avg_send_ms": round(self.total_send_ms / self.messages_sent, 2) if self.messages_sent else 0,
+            "last_send_ms": round(self.last_send_ms, 2),
+            "max_send_ms": round(self.max_send_ms, 2),
+            "max_delay_ms": round(self.max_delay_ms, 2),
+            **self.sink.get_metrics(),
+            **self.outbox.get_metrics(),
+        }
+
+
+log_dispatcher = LogDispatcher()
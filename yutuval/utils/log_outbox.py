@@ -0,0 +1,166 @@
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+from utils.db_manager import db
+
+# 受け付けたログと送信済み位置をDBへ書き出す間隔（秒）
+FLUSH_INTERVAL = 0.5
+
+INSERT_EVENT = "INSERT OR IGNORE INTO log_outbox (seq, channel_id, payload, created_at) VALUES (?, ?, ?, ?)"
+DELETE_DELIVERED = "DELETE FROM log_outbox WHERE channel_id = ? AND seq <= ?"
+UPSERT_STATE = """
+    INSERT INTO log_outbox_state (channel_id, delivered_seq, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT(channel_id) DO UPDATE SET
+        delivered_seq = MAX(delivered_seq, excluded.delivered_seq),
+        updated_at = excluded.updated_at
+"""
+
+
+class LogOutbox:
+    """
+    ログイベントの追記専用アウトボックス (log_outbox テーブル)。
+    append()/ack() はメモリに積むだけで、定期フラッシュが1トランザクションで
+    「新しいイベントの INSERT」と「送信済み分の DELETE + 送信済み位置の記録」を行う。
+    再起動時は load_pending() で未送信分を seq 順に取り出して再送する。
+    リスナーを待たせないための意図的なトレードオフとして、落ちた場合に失われ得るのは
+    まだフラッシュしていない直近 FLUSH_INTERVAL 秒分だけ。
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._last_seq = 0
+        self._pending: List[Tuple[int, int, discord.Embed, int]] = []
+        self._acks: Dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # メトリクス
+        self.appended = 0
+        self.persisted = 0
+        self.acked = 0
+        self.flush_errors = 0
+
+    def next_seq(self) -> int:
+        """単調増加の連番（マイクロ秒のUNIX時刻ベースなので再起動をまたいでも前回より大きい）"""
+        self._last_seq = max(self._last_seq + 1, time.time_ns() // 1000)
+        return self._last_seq
+
+    def append(self, seq: int, channel_id: int, embed: discord.Embed):
+        """送信前のイベントを記録（DBへの書き込みは次のフラッシュ）"""
+        self._pending.append((seq, channel_id, embed, int(time.time())))
+        self.appended += 1
+
+    def ack(self, channel_id: int, seq: int):
+        """channel_id の seq までを送信済みにする"""
+        if seq > self._acks.get(channel_id, 0):
+            self._acks[channel_id] = seq
+
+    @property
+    def pending_rows(self) -> int:
+        return len(self._pending)
+
+    def has_pending(self, channel_id: int) -> bool:
+        """channel_id 宛てでまだDBに書いていないイベントがあるか"""
+        return any(event[1] == channel_id for event in self._pending)
+
+    # ==================== 書き込み ====================
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending and not self._acks:
+                return
+
+            pending, self._pending = self._pending, []
+            acks, self._acks = self._acks, {}
+            now = int(time.time())
+            try:
+                rows = [
+                    (seq, channel_id, json.dumps(embed.to_dict(), ensure_ascii=False), created_at)
+                    for seq, channel_id, embed, created_at in pending
+                ]
+                async with db.transaction() as tx:
+                    if rows:
+                        await tx.executemany(INSERT_EVENT, rows)
+                    for channel_id, seq in acks.items():
+                        await tx.execute(DELETE_DELIVERED, (channel_id, seq))
+                        await tx.execute(UPSERT_STATE, (channel_id, seq, now))
+            except Exception as e:
+                # 失敗した分は次回に持ち越す
+                self._pending[:0] = pending
+                for channel_id, seq in acks.items():
+                    self.ack(channel_id, seq)
+                self.flush_errors += 1
+                print(f"ログアウトボックス書き込みエラー: {e}")
+                return
+
+            self.persisted += len(rows)
+            self.acked += len(acks)
+
+    async def load_pending(self) -> List[Tuple[int, int, discord.Embed]]:
+        """前回までに送れなかったイベントを seq 順に読み込む"""
+        rows = await db.fetchall("SELECT seq, channel_id, payload FROM log_outbox ORDER BY seq")
+        events = []
+        broken = []
+        for seq, channel_id, payload in rows:
+            try:
+                events.append((seq, channel_id, discord.Embed.from_dict(json.loads(payload))))
+            except (TypeError, ValueError) as e:
+                print(f"⚠️ アウトボックスのイベントを読み込めません (seq={seq}): {e}")
+                broken.append((seq,))
+            self._last_seq = max(self._last_seq, seq)
+
+        if broken:
+            await db.executemany("DELETE FROM log_outbox WHERE seq = ?", broken)
+        return events
+
+    async def load_channel(self, channel_id: int, after_seq: int, limit: int) -> List[Tuple[int, discord.Embed, int]]:
+        """channel_id 宛てで after_seq より後のイベントを seq 順に最大 limit 件読む（送信キューから溢れた分の読み戻し用）"""
+        rows = await db.fetchall(
+            "SELECT seq, payload, created_at FROM log_outbox WHERE channel_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (channel_id, after_seq, limit)
+        )
+        events = []
+        broken = []
+        for seq, payload, created_at in rows:
+            try:
+                events.append((seq, discord.Embed.from_dict(json.loads(payload)), created_at))
+            except (TypeError, ValueError) as e:
+                print(f"⚠️ アウトボックスのイベントを読み込めません (seq={seq}): {e}")
+                broken.append((seq,))
+
+        if broken:
+            await db.executemany("DELETE FROM log_outbox WHERE seq = ?", broken)
+        return events
+
+    # ==================== ライフサイクル ====================
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_metrics(self) -> dict:
+        return {
+            "outbox_appended": self.appended,
+            "outbox_persisted": self.persisted,
+            "outbox_unpersisted": self.pending_rows,
+            "outbox_flush_errors": self.flush_errors,
+        }
@@ -0,0 +1,126 @@
+import os
+from typing import Dict, Optional, Set
+
+from utils.db_manager import db
+
+# カテゴリを個別に設定していないときの送信先を表すカテゴリ名
+DEFAULT_CATEGORY = "default"
+
+UPSERT_CHANNEL = """
+    INSERT INTO log_routes (guild_id, category, channel_id) VALUES (?, ?, ?)
+    ON CONFLICT(guild_id, category) DO UPDATE SET channel_id = excluded.channel_id
+"""
+UPSERT_ENABLED = """
+    INSERT INTO log_routes (guild_id, category, enabled) VALUES (?, ?, ?)
+    ON CONFLICT(guild_id, category) DO UPDATE SET enabled = excluded.enabled
+"""
+
+
+class GuildLogRoutes:
+    """1サーバー分のログ設定"""
+
+    __slots__ = ("channels", "disabled", "ignored")
+
+    def __init__(self):
+        # カテゴリ -> 送信先チャンネルID（DEFAULT_CATEGORY はカテゴリ未指定時の送信先）
+        self.channels: Dict[str, int] = {}
+        self.disabled: Set[str] = set()
+        self.ignored: Set[int] = set()
+
+
+class LogRouteTable:
+    """
+    サーバー・カテゴリごとのログ送信先のメモリキャッシュ（log_routes / log_ignored_channels）。
+    起動時に全件読み込み、リスナーからの参照は辞書と集合の O(1) 参照だけで返す。
+    サーバーに設定が無い場合は LOG_CHANNEL_ID（環境変数）に送る。
+    """
+
+    def __init__(self):
+        self.fallback_channel_id = 0
+        self._guilds: Dict[int, GuildLogRoutes] = {}
+
+    async def load_all(self):
+        """log_routes / log_ignored_channels を一括読み込み"""
+        self.fallback_channel_id = int(os.getenv("LOG_CHANNEL_ID", 0) or 0)
+        guilds: Dict[int, GuildLogRoutes] = {}
+        for guild_id, category, channel_id, enabled in await db.fetchall(
+            "SELECT guild_id, category, channel_id, enabled FROM log_routes"
+        ):
+            routes = guilds.setdefault(guild_id, GuildLogRoutes())
+            if channel_id:
+                routes.channels[category] = channel_id
+            if not enabled:
+                routes.disabled.add(category)
+        for guild_id, channel_id in await db.fetchall(
+            "SELECT guild_id, channel_id FROM log_ignored_channels"
+        ):
+            guilds.setdefault(guild_id, GuildLogRoutes()).ignored.add(channel_id)
+        self._guilds = guilds
+        print(f"⚙️ ログ送信先を読み込みました: {len(self._guilds)}サーバー")
+
+    # ==================== 参照（リスナーから呼ばれる） ====================
+
+    def resolve(self, guild_id: int, category: str) -> Optional[int]:
+        """カテゴリの送信先チャンネルID。無効化されている・送信先が無い場合は None"""
+        routes = self._guilds.get(guild_id)
+        if routes is None:
+            return self.fallback_channel_id or None
+        if category in routes.disabled:
+            return None
+        return (
+            routes.channels.get(category)
+            or routes.channels.get(DEFAULT_CATEGORY)
+            or self.fallback_channel_id
+            or None
+        )
+
+    def is_ignored(self, guild_id: int, channel_id: Optional[int]) -> bool:
+        routes = self._guilds.get(guild_id)
+        return routes is not None and channel_id in routes.ignored
+
+    def get(self, guild_id: int) -> GuildLogRoutes:
+        """設定の表示用（未設定のサーバーは空）"""
+        return self._guilds.get(guild_id) or GuildLogRoutes()
+
+    # ==================== 更新（DBとキャッシュを同時に更新） ====================
+
+    def _routes(self, guild_id: int) -> GuildLogRoutes:
+        routes = self._guilds.get(guild_id)
+        if routes is None:
+            routes = GuildLogRoutes()
+            self._guilds[guild_id] = routes
+        return routes
+
+    async def set_channel(self, guild_id: int, category: str, channel_id: Optional[int]):
+        """送信先を設定する（None で設定を外し、既定の送信先に戻す）"""
+        await db.execute(UPSERT_CHANNEL, (guild_id, category, channel_id))
+        routes = self._routes(guild_id)
+        if channel_id:
+            routes.channels[category] = channel_id
+        else:
+            routes.channels.pop(category, None)
+
+    async def set_enabled(self, guild_id: int, category: str, enabled: bool):
+        await db.execute(UPSERT_ENABLED, (guild_id, category, int(enabled)))
+        routes = self._routes(guild_id)
+        if enabled:
+            routes.disabled.discard(category)
+        else:
+            routes.disabled.add(category)
+
+    async def set_ignored(self, guild_id: int, channel_id: int, ignored: bool):
+        if ignored:
+            await db.execute(
+                "INSERT OR IGNORE INTO log_ignored_channels (guild_id, channel_id) VALUES (?, ?)",
+                (guild_id, channel_id)
+            )
+            self._routes(guild_id).ignored.add(channel_id)
+        else:
+            await db.execute(
+                "DELETE FROM log_ignored_channels WHERE guild_id = ? AND channel_id = ?",
+                (guild_id, channel_id)
+            )
+            self._routes(guild_id).ignored.discard(channel_id)
+
+
+log_routes = LogRouteTable()
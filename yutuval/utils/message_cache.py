@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import discord
+
+# メモリ予算（バイトの概算）。サーバーごとの上限と全体の上限
+MAX_GUILD_BYTES = 2 * 1024 * 1024
+MAX_TOTAL_BYTES = 8 * 1024 * 1024
+
+# 1件あたりの固定コスト（レコード本体・辞書エントリ分の概算）
+RECORD_OVERHEAD = 240
+
+
+class CachedMessage:
+    """ログ用に必要な情報だけを持つメッセージの控え（Member/Channel は持たない）"""
+
+    __slots__ = ("id", "guild_id", "channel_id", "author_id", "content", "created_at", "edited_at", "attachments", "size")
+
+    def __init__(
+        self,
+        id: int,
+        guild_id: int,
+        channel_id: int,
+        author_id: int,
+        content: str,
+        created_at: float,
+        attachments: Tuple[str, ...] = (),
+        edited_at: Optional[float] = None
+    ):
+        self.id = id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.content = content
+        self.created_at = created_at
+        self.edited_at = edited_at
+        self.attachments = attachments
+        self.size = RECORD_OVERHEAD + len(content) + sum(len(name) for name in attachments)
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "CachedMessage":
+        return cls(
+            message.id,
+            message.guild.id,
+            message.channel.id,
+            message.author.id,
+            message.content or "",
+            message.created_at.timestamp(),
+            tuple(a.filename for a in message.attachments),
+            message.edited_at.timestamp() if message.edited_at else None
+        )
+
+
+class MessageCache:
+    """
+    削除・編集ログ用のメッセージキャッシュ（LRU）。
+    全体の順序とサーバーごとの順序を OrderedDict で持つので、追加・参照・追い出しはすべて O(1)。
+    サーバーごとの予算を超えたらそのサーバーの最古、全体の予算を超えたら全体の最古から追い出す。
+    """
+
+    def __init__(self, max_guild_bytes: int = MAX_GUILD_BYTES, max_total_bytes: int = MAX_TOTAL_BYTES):
+        self.max_guild_bytes = max_guild_bytes
+        self.max_total_bytes = max_total_bytes
+
+        self._messages: "OrderedDict[int, CachedMessage]" = OrderedDict()
+        self._guilds: Dict[int, "OrderedDict[int, None]"] = {}
+        self._guild_bytes: Dict[int, int] = {}
+        self.total_bytes = 0
+
+        # メトリクス
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    # ==================== 追加・更新 ====================
+
+    def add(self, message: discord.Message):
+        self.put(CachedMessage.from_message(message))
+
+    def put(self, record: CachedMessage):
+        if record.id in self._messages:
+            self._remove(record.id)
+
+        guild_order = self._guilds.get(record.guild_id)
+        if guild_order is None:
+            guild_order = OrderedDict()
+            self._guilds[record.guild_id] = guild_order
+
+        self._messages[record.id] = record
+        guild_order[record.id] = None
+        self._guild_bytes[record.guild_id] = self._guild_bytes.get(record.guild_id, 0) + record.size
+        self.total_bytes += record.size
+
+        while self._guild_bytes[record.guild_id] > self.max_guild_bytes and len(guild_order) > 1:
+            oldest_id, _ = guild_order.popitem(last=False)
+            self._forget(self._messages.pop(oldest_id))
+        while self.total_bytes > self.max_total_bytes and len(self._messages) > 1:
+            _, oldest = self._messages.popitem(last=False)
+            del self._guilds[oldest.guild_id][oldest.id]
+            self._forget(oldest)
+
+    def update_content(self, message_id: int, content: str, edited_at: Optional[float] = None) -> Optional[CachedMessage]:
+        """編集後の内容に差し替え、直前の内容を持ったレコードを返す"""
+        previous = self._messages.get(message_id)
+        if previous is None:
+            return None
+        self.put(CachedMessage(
+            previous.id, previous.guild_id, previous.channel_id, previous.author_id,
+            content, previous.created_at, previous.attachments, edited_at
+        ))
+        return previous
+
+    # ==================== 参照・削除 ====================
+
+    def get(self, message_id: int) -> Optional[CachedMessage]:
+        record = self._messages.get(message_id)
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._messages.move_to_end(message_id)
+        self._guilds[record.guild_id].move_to_end(message_id)
+        return record
+
+    def pop(self, message_id: int) -> Optional[CachedMessage]:
+        """削除されたメッセージを取り出す（ヒット/ミスも数える）"""
+        record = self.get(message_id)
+        if record is not None:
+            self._remove(message_id)
+        return record
+
+    def _remove(self, message_id: int):
+        record = self._messages.pop(message_id)
+        del self._guilds[record.guild_id][message_id]
+        self._forget(record, evicted=False)
+
+    def _forget(self, record: CachedMessage, evicted: bool = True):
+        self._guild_bytes[record.guild_id] -= record.size
+        self.total_bytes -= record.size
+        if not self._guilds[record.guild_id]:
+            del self._guilds[record.guild_id]
+            del self._guild_bytes[record.guild_id]
+        if evicted:
+            self.evictions += 1
+
+    def get_metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._messages),
+            "guilds": len(self._guilds),
+            "total_bytes": self.total_bytes,
+            "max_total_bytes": self.max_total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,437 @@
+import asyncio
+import json
+import time
+from typing import Callable, List, Tuple
+
+# 1チャンクで処理する行数（重いマイグレーション用）
+CHUNK_SIZE = 5000
+
+# (version, description, func, chunked)
+MIGRATIONS: List[Tuple[int, str, Callable, bool]] = []
+
+
+def migration(version: int, description: str, chunked: bool = False):
+    """
+    マイグレーションを登録するデコレータ。
+    通常は Transaction を受け取り、user_version の更新と同じトランザクションで適用される。
+    chunked=True の場合は DBManager と同じ execute/fetch* を持つハンドルを受け取り、自前でチャンク毎にコミットする
+    （途中で落ちても最初からやり直せるよう冪等に書くこと）。
+    """
+    def decorator(func):
+        MIGRATIONS.append((version, description, func, chunked))
+        return func
+    return decorator
+
+
+async def run_migrations(db):
+    """PRAGMA user_version より新しいマイグレーションだけを順番に適用"""
+    row = await db.fetchrow("PRAGMA user_version")
+    current = row[0] if row else 0
+
+    for version, description, func, chunked in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version <= current:
+            continue
+
+        started = time.perf_counter()
+        if chunked:
+            await func(db)
+            await db.execute(f"PRAGMA user_version = {int(version)}")
+        else:
+            async with db.transaction() as tx:
+                await func(tx)
+                await tx.execute(f"PRAGMA user_version = {int(version)}")
+
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"🛠️ マイグレーション v{version} 適用: {description} ({elapsed:.0f}ms)")
+        current = version
+
+
+# ==================== ヘルパー ====================
+
+async def column_exists(tx, table: str, column: str) -> bool:
+    rows = await tx.fetchall(f"PRAGMA table_info({table})")
+    return any(r[1] == column for r in rows)
+
+
+async def add_column_if_missing(tx, table: str, column: str, definition: str):
+    if not await column_exists(tx, table, column):
+        await tx.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+async def run_by_rowid_range(db, table: str, query: str, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    `WHERE rowid >= ? AND rowid < ?` を含む文を rowid の範囲ごとに実行する。
+    チャンク毎にコミットしてイベントループへ制御を返すので、1トランザクション（WAL）が大きくなりすぎない。
+    """
+    row = await db.fetchrow(f"SELECT MIN(rowid), MAX(rowid) FROM {table}")
+    if not row or row[0] is None:
+        return 0
+
+    low, high = row
+    affected = 0
+    while low <= high:
+        affected += await db.execute(query, (low, low + chunk_size))
+        low += chunk_size
+        await asyncio.sleep(0)
+    return affected
+
+
+# ==================== マイグレーション定義 ====================
+
+@migration(1, "初期スキーマ")
+async def _initial_schema(tx):
+    # サーバー設定用テーブル
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS server_config (
+            guild_id INTEGER PRIMARY KEY,
+            rank_emojis TEXT,
+            recruit_channel_id INTEGER,
+            last_recruit_msg_id INTEGER
+        )
+    """)
+
+    # 募集管理用テーブル
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS recruitments (
+            message_id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            author_id INTEGER,
+            max_members INTEGER,
+            rank_range TEXT,
+            mode TEXT,
+            joined_members TEXT, -- JSON or comma separated IDs
+            is_closed INTEGER DEFAULT 0,
+            vc_id INTEGER
+        )
+    """)
+
+    # VC管理用テーブル
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS active_vcs (
+            vc_id INTEGER PRIMARY KEY,
+            text_channel_id INTEGER,
+            owner_id INTEGER,
+            party_code TEXT,
+            is_locked INTEGER DEFAULT 0,
+            panel_message_id INTEGER,
+            source_channel_id INTEGER
+        )
+    """)
+
+    # 統計データ用テーブル (サーバー全体)
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS statistics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            date TEXT NOT NULL,
+            count INTEGER DEFAULT 0,
+            UNIQUE(guild_id, event_type, date)
+        )
+    """)
+
+    # 統計データ用テーブル (ユーザー別・ランキング用)
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS user_statistics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            date TEXT NOT NULL,
+            count INTEGER DEFAULT 0,
+            UNIQUE(guild_id, user_id, event_type, date)
+        )
+    """)
+
+    # 統計テーブルのインデックス作成
+    await tx.execute("""
+        CREATE INDEX IF NOT EXISTS idx_statistics_guild_date
+        ON statistics(guild_id, date)
+    """)
+
+    await tx.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_statistics_ranking
+        ON user_statistics(guild_id, event_type, date)
+    """)
+
+    await tx.execute("""
+        CREATE INDEX IF NOT EXISTS idx_statistics_guild_event
+        ON statistics(guild_id, event_type)
+    """)
+
+    # 旧バージョンで作られたDB向けのカラム追加
+    await add_column_if_missing(tx, "active_vcs", "panel_message_id", "INTEGER")
+    await add_column_if_missing(tx, "active_vcs", "source_channel_id", "INTEGER")
+    await add_column_if_missing(tx, "recruitments", "vc_id", "INTEGER")
+    await add_column_if_missing(tx, "server_config", "recruit_channel_id", "INTEGER")
+    await add_column_if_missing(tx, "server_config", "last_recruit_msg_id", "INTEGER")
+
+
+@migration(2, "募集参加者テーブルと募集インデックス")
+async def _recruitment_members(tx):
+    # 参加者は1行1人（rowid順 = 参加順）
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS recruitment_members (
+            message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            joined_at INTEGER, -- UNIX秒 (JSONから移行した行はNULL)
+            PRIMARY KEY (message_id, user_id)
+        )
+    """)
+
+    await tx.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recruitment_members_user
+        ON recruitment_members(user_id)
+    """)
+
+    await tx.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recruitments_is_closed
+        ON recruitments(is_closed)
+    """)
+
+    await tx.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recruitments_vc_id
+        ON recruitments(vc_id)
+    """)
+
+
+@migration(3, "joined_members (JSON) を recruitment_members へ移行", chunked=True)
+async def _backfill_recruitment_members(db):
+    last_id = 0
+    while True:
+        rows = await db.fetchall(
+            """
+            SELECT message_id, joined_members FROM recruitments
+            WHERE message_id > ? AND joined_members IS NOT NULL
+            ORDER BY message_id
+            LIMIT ?
+            """,
+            (last_id, CHUNK_SIZE)
+        )
+        if not rows:
+            break
+
+        members = []
+        for message_id, joined_json in rows:
+            try:
+                joined = json.loads(joined_json) if joined_json else []
+                members.extend([(message_id, int(user_id)) for user_id in joined])
+            except (TypeError, ValueError):
+                print(f"⚠️ joined_members を解析できません (message_id={message_id})")
+
+        if members:
+            await db.executemany(
+                "INSERT OR IGNORE INTO recruitment_members (message_id, user_id) VALUES (?, ?)",
+                members
+            )
+
+        last_id = rows[-1][0]
+        await asyncio.sleep(0)
+
+
+@migration(4, "週次・月次ロールアップテーブル")
+async def _rollup_tables(tx):
+    # サーバー全体の週次/月次合計
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS statistics_weekly (
+            guild_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            week_start TEXT NOT NULL, -- 月曜日 (YYYY-MM-DD)
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, event_type, week_start)
+        ) WITHOUT ROWID
+    """)
+
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS statistics_monthly (
+            guild_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            month TEXT NOT NULL, -- YYYY-MM
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, event_type, month)
+        ) WITHOUT ROWID
+    """)
+
+    # ユーザー別の週次/月次合計（ランキング用に期間の後ろへ user_id を置く）
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS user_statistics_weekly (
+            guild_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            week_start TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, event_type, week_start, user_id)
+        ) WITHOUT ROWID
+    """)
+
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS user_statistics_monthly (
+            guild_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            month TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, event_type, month, user_id)
+        ) WITHOUT ROWID
+    """)
+
+
+@migration(5, "既存の日次データからロールアップを構築", chunked=True)
+async def _backfill_rollups(db):
+    # 途中で落ちても作り直せるよう、最初に空にしてから積み上げる
+    for table in ("statistics_weekly", "statistics_monthly", "user_statistics_weekly", "user_statistics_monthly"):
+        await db.execute(f"DELETE FROM {table}")
+
+    await run_by_rowid_range(db, "statistics", """
+        INSERT INTO statistics_weekly (guild_id, event_type, week_start, count)
+        SELECT guild_id, event_type, date(date, 'weekday 0', '-6 days'), SUM(count)
+        FROM statistics WHERE rowid >= ? AND rowid < ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT(guild_id, event_type, week_start) DO UPDATE SET count = count + excluded.count
+    """)
+
+    await run_by_rowid_range(db, "statistics", """
+        INSERT INTO statistics_monthly (guild_id, event_type, month, count)
+        SELECT guild_id, event_type, substr(date, 1, 7), SUM(count)
+        FROM statistics WHERE rowid >= ? AND rowid < ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT(guild_id, event_type, month) DO UPDATE SET count = count + excluded.count
+    """)
+
+    await run_by_rowid_range(db, "user_statistics", """
+        INSERT INTO user_statistics_weekly (guild_id, event_type, week_start, user_id, count)
+        SELECT guild_id, event_type, date(date, 'weekday 0', '-6 days'), user_id, SUM(count)
+        FROM user_statistics WHERE rowid >= ? AND rowid < ?
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT(guild_id, event_type, week_start, user_id) DO UPDATE SET count = count + excluded.count
+    """)
+
+    await run_by_rowid_range(db, "user_statistics", """
+        INSERT INTO user_statistics_monthly (guild_id, event_type, month, user_id, count)
+        SELECT guild_id, event_type, substr(date, 1, 7), user_id, SUM(count)
+        FROM user_statistics WHERE rowid >= ? AND rowid < ?
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT(guild_id, event_type, month, user_id) DO UPDATE SET count = count + excluded.count
+    """)
+
+
+@migration(6, "ログ送信用アウトボックス")
+async def _log_outbox(tx):
+    # 送信待ちのログイベント（seq はアプリ側で採番する単調増加の連番）
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS log_outbox (
+            seq INTEGER PRIMARY KEY,
+            channel_id INTEGER NOT NULL,
+            payload TEXT NOT NULL, -- Embed の JSON
+            created_at INTEGER NOT NULL
+        )
+    """)
+
+    await tx.execute("""
+        CREATE INDEX IF NOT EXISTS idx_log_outbox_channel
+        ON log_outbox(channel_id, seq)
+    """)
+
+    # チャンネルごとの送信済み位置
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS log_outbox_state (
+            channel_id INTEGER PRIMARY KEY,
+            delivered_seq INTEGER NOT NULL,
+            updated_at INTEGER
+        )
+    """)
+
+
+@migration(7, "監査ログと全文検索インデックス")
+async def _audit_log(tx):
+    # Logger の全イベント（id は記録順なので、キーセットページングにそのまま使う）
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            user_id INTEGER,
+            channel_id INTEGER,
+            content TEXT NOT NULL DEFAULT ''
+        )
+    """)
+
+    # 各インデックスの末尾には暗黙に id が付くので、絞り込み + id 降順がインデックスだけで済む
+    await tx.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_guild ON audit_log(guild_id)")
+    await tx.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_user ON audit_log(guild_id, user_id)")
+    await tx.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_channel ON audit_log(guild_id, channel_id)")
+    await tx.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_category ON audit_log(guild_id, category)")
+    await tx.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_time ON audit_log(created_at)")
+
+    # 本文の全文検索（外部コンテンツ方式なので本文は audit_log にだけ持つ）。
+    # 日本語は単語に区切れないので trigram（部分一致）を使い、無ければ unicode61、
+    # FTS5 自体が無い SQLite ではインデックスを作らず LIKE 検索にする
+    for tokenizer in ("trigram", "unicode61"):
+        try:
+            await tx.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS audit_log_fts USING fts5(
+                    content, content='audit_log', content_rowid='id', tokenize='{tokenizer}'
+                )
+            """)
+            break
+        except Exception as e:
+            print(f"⚠️ 全文検索インデックス ({tokenizer}) を作成できません: {e}")
+    else:
+        return
+
+    await tx.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_log_ai AFTER INSERT ON audit_log BEGIN
+            INSERT INTO audit_log_fts (rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    await tx.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_log_ad AFTER DELETE ON audit_log BEGIN
+            INSERT INTO audit_log_fts (audit_log_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """)
+    await tx.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_log_au AFTER UPDATE OF content ON audit_log BEGIN
+            INSERT INTO audit_log_fts (audit_log_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO audit_log_fts (rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+
+
+@migration(8, "ログの送信先テーブル")
+async def _log_routes(tx):
+    # サーバー・カテゴリごとの送信先（category = 'default' はカテゴリ未指定時の送信先）
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS log_routes (
+            guild_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            channel_id INTEGER,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (guild_id, category)
+        ) WITHOUT ROWID
+    """)
+
+    # ログを取らないチャンネル
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS log_ignored_channels (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, channel_id)
+        ) WITHOUT ROWID
+    """)
+
+
+@migration(9, "時間別の統計とサーバーのタイムゾーン")
+async def _hourly_statistics(tx):
+    # hour は UNIX 時間を3600で割った整数（UTCの1時間ごと）。表示時にサーバーのタイムゾーンで曜日・時刻に振り分ける
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS statistics_hourly (
+            guild_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, event_type, hour)
+        ) WITHOUT ROWID
+    """)
+    await add_column_if_missing(tx, "server_config", "timezone", "TEXT")
@@ -0,0 +1,192 @@
+import math
+import os
+import re
+import sys
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# これより遅いクエリをスロークエリログに残す（ミリ秒）
+DEFAULT_SLOW_QUERY_MS = 100.0
+SLOW_LOG_SIZE = 50
+
+# ヒストグラムは 2 の累乗を 8 分割した対数バケット（誤差 約9%）
+BUCKETS_PER_OCTAVE = 8
+
+# 呼び出し元を探すときに飛ばすモジュール
+_INTERNAL_MODULES = {"utils.db_manager", "utils.query_stats", "contextlib", "asyncio"}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize(query: str) -> str:
+    """リテラルと IN (?, ?, ...) の長さを潰して、同じ形の文を1つにまとめる"""
+    text = _STRING_LITERAL.sub("?", query)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _IN_LIST.sub("(...)", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def caller_tag(depth: int = 2, limit: int = 12) -> str:
+    """
+    DB呼び出し元のタグ。cogs.* があればそのコグ名、なければ最初の外部モジュール名。
+    コルーチンは最初の await より前ならフレームがつながっているので、メソッドの先頭で呼ぶこと。
+    """
+    frame = sys._getframe(depth)
+    fallback = None
+    for _ in range(limit):
+        if frame is None:
+            break
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("cogs."):
+            return module[len("cogs."):]
+        if fallback is None and module not in _INTERNAL_MODULES:
+            fallback = module
+        frame = frame.f_back
+
+    if fallback == "__main__":
+        return "main"
+    if fallback and fallback.startswith("utils."):
+        return fallback[len("utils."):]
+    return fallback or "unknown"
+
+
+def _bucket(ms: float) -> int:
+    us = ms * 1000
+    if us <= 1:
+        return 0
+    return int(math.log2(us) * BUCKETS_PER_OCTAVE)
+
+
+def _bucket_upper_ms(index: int) -> float:
+    return 2 ** ((index + 1) / BUCKETS_PER_OCTAVE) / 1000
+
+
+class StatementStats:
+    """1つの (タグ, 正規化済み文) の集計"""
+
+    __slots__ = ("tag", "kind", "statement", "count", "total_ms", "max_ms", "wait_ms", "histogram")
+
+    def __init__(self, tag: str, kind: str, statement: str):
+        self.tag = tag
+        self.kind = kind
+        self.statement = statement
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.wait_ms = 0.0
+        self.histogram: Dict[int, int] = {}
+
+    def add(self, ms: float, wait_ms: float):
+        self.count += 1
+        self.total_ms += ms
+        self.wait_ms += wait_ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        index = _bucket(ms)
+        self.histogram[index] = self.histogram.get(index, 0) + 1
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        target = math.ceil(self.count * p / 100)
+        seen = 0
+        for index in sorted(self.histogram):
+            seen += self.histogram[index]
+            if seen >= target:
+                return min(_bucket_upper_ms(index), self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        return {
+            "tag": self.tag,
+            "kind": self.kind,
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "max_ms": round(self.max_ms, 2),
+            "wait_ms": round(self.wait_ms, 2),
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+        }
+
+
+class QueryStats:
+    """DBManager の全クエリの実行時間を呼び出し元・文ごとに集計する"""
+
+    def __init__(self):
+        self.slow_query_ms = DEFAULT_SLOW_QUERY_MS
+        self._statements: Dict[Tuple[str, str], StatementStats] = {}
+        self.slow_log: deque = deque(maxlen=SLOW_LOG_SIZE)
+        # 正規化済み文 -> EXPLAIN QUERY PLAN（同じ文は1回だけ取る）
+        self.plans: Dict[str, str] = {}
+        self.started_at = time.time()
+
+    def configure(self):
+        """環境変数から設定を読む（DBManager.connect() から呼ぶ）"""
+        try:
+            self.slow_query_ms = float(os.getenv("DB_SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS))
+        except ValueError:
+            self.slow_query_ms = DEFAULT_SLOW_QUERY_MS
+
+    def record(self, tag: str, kind: str, query: str, ms: float, wait_ms: float = 0.0) -> Optional[dict]:
+        """1回分を記録し、スロークエリならログに追加したエントリを返す（実行計画は呼び出し側で埋める）"""
+        statement = normalize(query)
+        key = (tag, statement)
+        stats = self._statements.get(key)
+        if stats is None:
+            stats = StatementStats(tag, kind, statement)
+            self._statements[key] = stats
+        stats.add(ms, wait_ms)
+
+        if ms < self.slow_query_ms:
+            return None
+
+        entry = {
+            "at": time.time(),
+            "tag": tag,
+            "kind": kind,
+            "statement": statement,
+            "ms": round(ms, 2),
+            "plan": None,
+        }
+        self.slow_log.append(entry)
+        print(f"🐢 スロークエリ ({ms:.0f}ms, {tag}): {statement[:120]}")
+        return entry
+
+    def top(self, limit: int = 10, order: str = "total") -> List[dict]:
+        keys = {
+            "total": lambda s: s.total_ms,
+            "count": lambda s: s.count,
+            "p99": lambda s: s.percentile(99),
+            "max": lambda s: s.max_ms,
+            "wait": lambda s: s.wait_ms,
+        }
+        key = keys.get(order, keys["total"])
+        ranked = sorted(self._statements.values(), key=key, reverse=True)
+        return [s.to_dict() for s in ranked[:limit]]
+
+    def by_tag(self) -> Dict[str, dict]:
+        """コグ（呼び出し元）ごとの合計"""
+        tags: Dict[str, dict] = {}
+        for stats in self._statements.values():
+            summary = tags.setdefault(stats.tag, {"count": 0, "total_ms": 0.0, "wait_ms": 0.0})
+            summary["count"] += stats.count
+            summary["total_ms"] += stats.total_ms
+            summary["wait_ms"] += stats.wait_ms
+        return tags
+
+    def reset(self):
+        self._statements.clear()
+        self.slow_log.clear()
+        self.plans.clear()
+        self.started_at = time.time()
+
+
+query_stats = QueryStats()
@@ -0,0 +1,179 @@
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# 判定に使う時間窓（秒）と、窓内の件数がこれ以上でまとめ表示に切り替える閾値
+RAID_WINDOW = 60.0
+DEFAULT_RAID_THRESHOLD = 10
+
+# まとめ表示中の要約を出す間隔（秒）
+SUMMARY_INTERVAL = 30.0
+
+# 1回の要約に名前を載せる人数の上限（残りは人数だけ数える）
+MAX_ENTRIES_PER_SUMMARY = 500
+
+# これより新しいアカウントに新規アカウントの印を付ける（日）
+NEW_ACCOUNT_DAYS = 7
+
+
+class RaidEntry:
+    """まとめ表示中に参加・退出したメンバー1人分"""
+
+    __slots__ = ("user_id", "name", "account_age")
+
+    def __init__(self, user_id: int, name: str, account_age: int):
+        self.user_id = user_id
+        self.name = name
+        self.account_age = account_age
+
+    @property
+    def is_new_account(self) -> bool:
+        return self.account_age < NEW_ACCOUNT_DAYS
+
+
+class RaidSummary:
+    """1回分の要約（Logger がEmbedにする）"""
+
+    __slots__ = ("guild_id", "kind", "entries", "omitted", "new_accounts", "rate", "total", "started_at", "first", "ended")
+
+    def __init__(self, guild_id: int, kind: str):
+        self.guild_id = guild_id
+        self.kind = kind
+        self.entries: List[RaidEntry] = []
+        self.omitted = 0
+        self.new_accounts = 0
+        self.rate = 0
+        self.total = 0
+        self.started_at = 0.0
+        self.first = False
+        self.ended = False
+
+
+class _Window:
+    """サーバー・種類（参加/退出）ごとの時間窓とまとめ表示の状態"""
+
+    __slots__ = ("events", "active", "started_at", "total", "announced", "last_summary", "pending")
+
+    def __init__(self):
+        self.events: Deque[float] = deque()
+        self.active = False
+        self.started_at = 0.0
+        self.total = 0
+        self.announced = False
+        self.last_summary = 0.0
+        self.pending: Optional[RaidSummary] = None
+
+
+class RaidDetector:
+    """
+    メンバーの参加・退出の急増を検知する。
+    直近 RAID_WINDOW 秒の件数が閾値以上になったら「まとめ表示」に切り替え、
+    以後の1件ごとのログは出さずに drain() で定期的に要約を返す。
+    件数が閾値の半分を下回ったら元に戻す（閾値付近で切り替わり続けないように）。
+    """
+
+    def __init__(self, threshold: Optional[int] = None, window: float = RAID_WINDOW, summary_interval: float = SUMMARY_INTERVAL):
+        if threshold is None:
+            try:
+                threshold = int(os.getenv("RAID_THRESHOLD", DEFAULT_RAID_THRESHOLD))
+            except ValueError:
+                threshold = DEFAULT_RAID_THRESHOLD
+        self.threshold = max(threshold, 2)
+        self.release_threshold = self.threshold // 2
+        self.window = window
+        self.summary_interval = summary_interval
+        self._windows: Dict[Tuple[int, str], _Window] = {}
+
+        # メトリクス
+        self.raids = 0
+        self.aggregated = 0
+
+    def _prune(self, state: _Window, now: float):
+        cutoff = now - self.window
+        while state.events and state.events[0] <= cutoff:
+            state.events.popleft()
+
+    def is_active(self, guild_id: int, kind: str) -> bool:
+        state = self._windows.get((guild_id, kind))
+        return state is not None and state.active
+
+    def observe(self, guild_id: int, kind: str, user_id: int, name: str, account_age: int, now: Optional[float] = None) -> bool:
+        """
+        参加・退出を1件記録する。
+        まとめ表示中なら要約に積んで True を返す（呼び出し側は個別のログを出さない）。
+        """
+        now = time.monotonic() if now is None else now
+        key = (guild_id, kind)
+        state = self._windows.get(key)
+        if state is None:
+            state = _Window()
+            self._windows[key] = state
+
+        self._prune(state, now)
+        state.events.append(now)
+
+        if not state.active:
+            if len(state.events) < self.threshold:
+                return False
+            state.active = True
+            state.started_at = time.time()
+            state.total = 0
+            state.announced = False
+            state.last_summary = now
+            self.raids += 1
+            print(f"🚨 メンバーの急増を検知 (guild={guild_id}, {kind}, {len(state.events)}件/{self.window:.0f}秒)")
+
+        summary = state.pending
+        if summary is None:
+            summary = RaidSummary(guild_id, kind)
+            state.pending = summary
+        if len(summary.entries) < MAX_ENTRIES_PER_SUMMARY:
+            summary.entries.append(RaidEntry(user_id, name, account_age))
+        else:
+            summary.omitted += 1
+        if account_age < NEW_ACCOUNT_DAYS:
+            summary.new_accounts += 1
+        state.total += 1
+        self.aggregated += 1
+        return True
+
+    def drain(self, now: Optional[float] = None) -> List[RaidSummary]:
+        """出すべき要約を返す（開始直後、SUMMARY_INTERVAL ごと、終了時）"""
+        now = time.monotonic() if now is None else now
+        summaries = []
+        for key, state in list(self._windows.items()):
+            self._prune(state, now)
+            if not state.active:
+                if not state.events:
+                    del self._windows[key]
+                continue
+
+            ended = len(state.events) < self.release_threshold
+            due = not state.announced or ended or now - state.last_summary >= self.summary_interval
+            if not due:
+                continue
+
+            summary = state.pending or RaidSummary(*key)
+            state.pending = None
+            summary.rate = len(state.events)
+            summary.total = state.total
+            summary.started_at = state.started_at
+            summary.first = not state.announced
+            summary.ended = ended
+            if summary.entries or summary.omitted or summary.first or summary.ended:
+                summaries.append(summary)
+
+            state.announced = True
+            state.last_summary = now
+            if ended:
+                state.active = False
+                print(f"✅ メンバーの急増が収まりました (guild={key[0]}, {key[1]}, 合計{state.total}件)")
+        return summaries
+
+    def get_metrics(self) -> dict:
+        return {
+            "raids": self.raids,
+            "raid_active": sum(1 for state in self._windows.values() if state.active),
+            "raid_aggregated": self.aggregated,
+        }
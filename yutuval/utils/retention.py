@@ -0,0 +1,199 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from utils.db_manager import db
+
+# 日次のユーザー別統計を保持する日数（これより古い分は月次集計だけ残す）
+# /stats ranking の最大90日を日次で正確に出せるよう、91日未満にはしない
+DEFAULT_RETENTION_DAYS = 180
+MIN_RETENTION_DAYS = 91
+
+# 時間別の統計 (statistics_hourly) を保持する日数（/stats heatmap の最大12週より長く）
+HOURLY_RETENTION_DAYS = 90
+
+# 1バッチで退避・削除する行数と、バッチ間で書き込みロックを手放す時間
+BATCH_SIZE = 2000
+BATCH_PAUSE = 0.2
+MAX_BATCHES_PER_RUN = 200
+
+ARCHIVE_DIR = Path("database") / "archive"
+ARCHIVE_PREFIX = "user_statistics-"
+
+_compaction_lock = asyncio.Lock()
+
+
+def retention_days() -> int:
+    try:
+        days = int(os.getenv("STATS_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+    except ValueError:
+        days = DEFAULT_RETENTION_DAYS
+    return max(days, MIN_RETENTION_DAYS)
+
+
+def daily_floor(today: Optional[date] = None) -> date:
+    """
+    日次の明細が残っている最初の日。
+    月の途中で切ると月次集計と食い違うので、保持期間を含む月の1日に揃える。
+    """
+    today = today or datetime.now(timezone.utc).date()
+    return (today - timedelta(days=retention_days())).replace(day=1)
+
+
+# ==================== アーカイブ ====================
+
+def _segment_path() -> Path:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return ARCHIVE_DIR / f"{ARCHIVE_PREFIX}{stamp}.jsonl.gz"
+
+
+def _append_segment(path: Path, rows: list):
+    """
+    1バッチ分を gzip メンバーとして追記し、fsync してから戻る。
+    (削除はこの後なので、途中で落ちても行は失われない。同じ行が二度書かれた場合は id で判別できる)
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for row_id, guild_id, user_id, event_type, day, count in rows:
+                line = json.dumps({
+                    "id": row_id,
+                    "guild_id": guild_id,
+                    "user_id": user_id,
+                    "event_type": event_type,
+                    "date": day,
+                    "count": count,
+                }, ensure_ascii=False)
+                gz.write(line.encode("utf-8") + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def list_segments() -> List[Path]:
+    if not ARCHIVE_DIR.exists():
+        return []
+    return sorted(ARCHIVE_DIR.glob(f"{ARCHIVE_PREFIX}*.jsonl.gz"))
+
+
+def iter_archive(
+    guild_id: Optional[int] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+) -> Iterator[dict]:
+    """アーカイブを古いセグメントから1行ずつ読む（全体をメモリに載せない）"""
+    for path in list_segments():
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if guild_id is not None and record["guild_id"] != guild_id:
+                    continue
+                if since and record["date"] < since:
+                    continue
+                if until and record["date"] > until:
+                    continue
+                yield record
+
+
+def export_archive(
+    destination: Path,
+    guild_id: Optional[int] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+) -> int:
+    """条件に合うアーカイブ行を gzip の JSONL に書き出し、行数を返す（スレッドで呼ぶ）"""
+    written = 0
+    with gzip.open(destination, "wt", encoding="utf-8") as out:
+        for record in iter_archive(guild_id, since, until):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
+
+# ==================== コンパクション ====================
+
+async def compact(max_batches: int = MAX_BATCHES_PER_RUN, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    保持期間を過ぎた user_statistics の日次行をアーカイブへ移して削除する。
+    月次集計 (user_statistics_monthly) はフラッシュ時に更新済みなので、ここでは触らない。
+    1バッチごとにコミットして休むので、書き込みロックを長く握らない。
+    """
+    async with _compaction_lock:
+        floor = daily_floor().strftime("%Y-%m-%d")
+        started = time.perf_counter()
+        segment: Optional[Path] = None
+        archived = 0
+        batches = 0
+        last_id = 0
+
+        while batches < max_batches:
+            rows = await db.fetchall(
+                """
+                SELECT id, guild_id, user_id, event_type, date, count
+                FROM user_statistics
+                WHERE id > ? AND date < ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (last_id, floor, batch_size)
+            )
+            # 最後のバッチが空か LIMIT に満たなければ、期限切れの行は残っていない
+            if not rows:
+                finished = True
+                break
+
+            segment = segment or _segment_path()
+            await asyncio.to_thread(_append_segment, segment, rows)
+
+            first_id, last_id = rows[0][0], rows[-1][0]
+            # [first_id, last_id] 内で期限切れの行は、今読んだ行だけ
+            await db.execute(
+                "DELETE FROM user_statistics WHERE id >= ? AND id <= ? AND date < ?",
+                (first_id, last_id, floor)
+            )
+            archived += len(rows)
+            batches += 1
+            if len(rows) < batch_size:
+                finished = True
+                break
+            await asyncio.sleep(BATCH_PAUSE)
+        else:
+            # 上限ちょうどで読み切った場合もあるので、残りがあるかだけ確かめる
+            finished = await db.fetchrow(
+                "SELECT 1 FROM user_statistics WHERE id > ? AND date < ? LIMIT 1",
+                (last_id, floor)
+            ) is None
+
+        # 週次ロールアップも保持期間より前は不要（プランナーは月次を使う）
+        weeks = await db.fetchall(
+            "SELECT DISTINCT week_start FROM user_statistics_weekly WHERE week_start < ? ORDER BY week_start",
+            (floor,)
+        )
+        for (week_start,) in weeks:
+            await db.execute("DELETE FROM user_statistics_weekly WHERE week_start = ?", (week_start,))
+            await asyncio.sleep(0)
+
+        # 時間別の統計は heatmap で使う期間より前は不要（毎日実行するので1回に消えるのは1日分程度）
+        pruned_hours = await db.execute(
+            "DELETE FROM statistics_hourly WHERE hour < ?",
+            (int(time.time()) // 3600 - HOURLY_RETENTION_DAYS * 24,)
+        )
+
+        elapsed = time.perf_counter() - started
+        result = {
+            "floor": floor,
+            "archived_rows": archived,
+            "batches": batches,
+            "pruned_weeks": len(weeks),
+            "pruned_hourly_rows": pruned_hours,
+            "segment": segment.name if segment else None,
+            "finished": finished,
+            "elapsed_s": round(elapsed, 2),
+        }
+        if archived or weeks:
+            print(f"🗄️ 統計コンパクション: {archived}行をアーカイブ ({batches}バッチ, {elapsed:.1f}秒)")
+        return result
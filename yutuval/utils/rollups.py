@@ -0,0 +1,213 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+# 集計レベルごとの (日次, 週次, 月次) テーブル
+ROLLUP_TABLES = {
+    "statistics": ("statistics", "statistics_weekly", "statistics_monthly"),
+    "user_statistics": ("user_statistics", "user_statistics_weekly", "user_statistics_monthly"),
+}
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def week_key(day: date) -> str:
+    """週の開始日（月曜）"""
+    return (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+
+
+def month_key(day: date) -> str:
+    return day.strftime("%Y-%m")
+
+
+class RangePlan:
+    """期間を「月次 + 週次 + 日次」の組み合わせに分解した結果"""
+
+    __slots__ = ("months", "weeks", "day_ranges")
+
+    def __init__(self):
+        self.months: List[str] = []
+        self.weeks: List[str] = []
+        self.day_ranges: List[Tuple[str, str]] = []
+
+    def __repr__(self):
+        return f"RangePlan(months={self.months}, weeks={self.weeks}, days={self.day_ranges})"
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _add_days(plan: RangePlan, start: date, end: date):
+    if start <= end:
+        plan.day_ranges.append((start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")))
+
+
+def _add_weeks_and_days(plan: RangePlan, start: date, end: date):
+    """月に満たない区間を、完全に含まれる週 + 端の日に分解"""
+    if start > end:
+        return
+    first_monday = start + timedelta(days=(7 - start.weekday()) % 7)
+    after_end = end + timedelta(days=1)
+    last_monday = after_end - timedelta(days=after_end.weekday())  # 週の終わり(排他)
+
+    if first_monday >= last_monday:
+        _add_days(plan, start, end)
+        return
+
+    _add_days(plan, start, first_monday - timedelta(days=1))
+    week = first_monday
+    while week < last_monday:
+        plan.weeks.append(week.strftime("%Y-%m-%d"))
+        week += timedelta(days=7)
+    _add_days(plan, last_monday, end)
+
+
+def plan_range(start: date, end: date, daily_floor: Optional[date] = None) -> RangePlan:
+    """
+    [start, end] を最も粗いロールアップで覆う。
+    完全に含まれる月は月次、残りの端で完全に含まれる週は週次、それ以外だけ日次を読む。
+    どれだけ期間が長くても読む行数は (月数 + 最大8週 + 最大24日) 程度に収まる
+    （月に満たない前後の端それぞれで、週の前後に最大6日ずつ）。
+    daily_floor（月初）より前は日次・週次が削除済みなので、その部分は月単位に丸めて月次だけを読む。
+    """
+    plan = RangePlan()
+    if start > end:
+        return plan
+
+    if daily_floor and start < daily_floor:
+        month = start.replace(day=1)
+        last = min(end, daily_floor - timedelta(days=1))
+        while month <= last:
+            plan.months.append(month_key(month))
+            month = _next_month(month)
+        if end < daily_floor:
+            return plan
+        start = daily_floor
+
+    month_start = start if start.day == 1 else _next_month(start)
+    after_end = end + timedelta(days=1)
+    month_end = after_end.replace(day=1)  # 完全な月の終わり(排他)
+
+    if month_start >= month_end:
+        _add_weeks_and_days(plan, start, end)
+        return plan
+
+    _add_weeks_and_days(plan, start, month_start - timedelta(days=1))
+    month = month_start
+    while month < month_end:
+        plan.months.append(month_key(month))
+        month = _next_month(month)
+    _add_weeks_and_days(plan, month_end, end)
+    return plan
+
+
+def _range_parts(
+    plan: RangePlan,
+    level: str,
+    group_by: str,
+    where: str,
+    parameters: Sequence,
+    tag: str = "",
+) -> Tuple[List[str], list]:
+    """RangePlan の各ロールアップを読む SELECT 文のリスト（tag は各行に付ける追加の列）"""
+    daily, weekly, monthly = ROLLUP_TABLES[level]
+    columns = f"{group_by}, count{tag}"
+    parts = []
+    params: list = []
+
+    if plan.months:
+        placeholders = ", ".join("?" for _ in plan.months)
+        parts.append(f"SELECT {columns} FROM {monthly} WHERE {where} AND month IN ({placeholders})")
+        params += [*parameters, *plan.months]
+
+    if plan.weeks:
+        placeholders = ", ".join("?" for _ in plan.weeks)
+        parts.append(f"SELECT {columns} FROM {weekly} WHERE {where} AND week_start IN ({placeholders})")
+        params += [*parameters, *plan.weeks]
+
+    for day_start, day_end in plan.day_ranges:
+        parts.append(f"SELECT {columns} FROM {daily} WHERE {where} AND date >= ? AND date <= ?")
+        params += [*parameters, day_start, day_end]
+
+    return parts, params
+
+
+def build_range_query(
+    plan: RangePlan,
+    level: str,
+    group_by: str,
+    where: str,
+    parameters: Sequence,
+) -> Tuple[str, list]:
+    """
+    RangePlan に従って各ロールアップを UNION ALL で読み、group_by ごとの合計を返すSQLを組み立てる。
+    結果の列は (group_by..., total)。ORDER BY / LIMIT は呼び出し側で付け足す。
+    """
+    parts, params = _range_parts(plan, level, group_by, where, parameters)
+    if not parts:
+        # 空の期間でも列の形を揃える
+        daily = ROLLUP_TABLES[level][0]
+        parts.append(f"SELECT {group_by}, count FROM {daily} WHERE 0")
+
+    union = " UNION ALL ".join(parts)
+    sql = f"SELECT {group_by}, SUM(count) AS total FROM ({union}) GROUP BY {group_by}"
+    return sql, params
+
+
+# ==================== 複数期間の同時集計 ====================
+
+def split_windows(windows: Sequence[Tuple[date, date]]) -> List[Tuple[date, date]]:
+    """
+    複数の期間を、どの期間の境界もまたがない重なりの無い区間に分ける（いずれかの期間に含まれる区間だけ）。
+    各期間はこの区間のいくつかをちょうど覆う
+    """
+    bounds = sorted({start for start, _ in windows} | {end + timedelta(days=1) for _, end in windows})
+    pieces = []
+    for low, high in zip(bounds, bounds[1:]):
+        piece = (low, high - timedelta(days=1))
+        if any(start <= piece[0] and piece[1] <= end for start, end in windows):
+            pieces.append(piece)
+    return pieces
+
+
+def build_windowed_query(
+    windows: Sequence[Tuple[date, date]],
+    level: str,
+    group_by: str,
+    where: str,
+    parameters: Sequence,
+) -> Tuple[str, list]:
+    """
+    複数の期間の合計を1回の走査で求めるSQLを組み立てる。
+    期間を重ならない区間に分け、区間ごとに最も粗いロールアップを読んで区間番号を付け、
+    期間ごとに「その期間に含まれる区間」だけを条件付きで合計する。
+    結果の列は (group_by, 期間0の合計, 期間1の合計, ...)。
+    日次が残っている範囲用（daily_floor による月単位の丸めは区間同士が重なるので使わない）
+    """
+    pieces = split_windows(windows)
+    parts: List[str] = []
+    params: list = []
+    for index, (start, end) in enumerate(pieces):
+        piece_parts, piece_params = _range_parts(
+            plan_range(start, end), level, group_by, where, parameters, tag=f", {index} AS piece"
+        )
+        parts += piece_parts
+        params += piece_params
+
+    if not parts:
+        daily = ROLLUP_TABLES[level][0]
+        parts.append(f"SELECT {group_by}, count, 0 AS piece FROM {daily} WHERE 0")
+
+    sums = []
+    for start, end in windows:
+        covered = [str(i) for i, (low, high) in enumerate(pieces) if start <= low and high <= end]
+        if covered:
+            sums.append(f"SUM(CASE WHEN piece IN ({', '.join(covered)}) THEN count ELSE 0 END)")
+        else:
+            sums.append("0")
+
+    union = " UNION ALL ".join(parts)
+    sql = f"SELECT {group_by}, {', '.join(sums)} FROM ({union}) GROUP BY {group_by}"
+    return sql, params
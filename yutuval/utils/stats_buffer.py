@@ -0,0 +1,240 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.db_manager import db
+from utils.rollups import month_key, parse_date, week_key
+
+# フラッシュ間隔（秒）と、溜まったキー数がこれを超えたら即フラッシュする閾値
+FLUSH_INTERVAL = 10.0
+MAX_PENDING_KEYS = 500
+
+ServerKey = Tuple[int, str, str]            # (guild_id, event_type, date)
+UserKey = Tuple[int, int, str, str]         # (guild_id, user_id, event_type, date)
+HourKey = Tuple[int, str, int]              # (guild_id, event_type, UNIX時間 // 3600)
+
+# フラッシュで書き込んだ分を受け取るコールバック (server, user)
+FlushListener = Callable[[Dict[ServerKey, int], Dict[UserKey, int]], None]
+
+UPSERT_DAILY = """
+    INSERT INTO statistics (guild_id, event_type, date, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT(guild_id, event_type, date) DO UPDATE SET count = count + excluded.count
+"""
+UPSERT_USER_DAILY = """
+    INSERT INTO user_statistics (guild_id, user_id, event_type, date, count) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id, user_id, event_type, date) DO UPDATE SET count = count + excluded.count
+"""
+UPSERT_HOURLY = """
+    INSERT INTO statistics_hourly (guild_id, event_type, hour, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT(guild_id, event_type, hour) DO UPDATE SET count = count + excluded.count
+"""
+UPSERT_WEEKLY = """
+    INSERT INTO statistics_weekly (guild_id, event_type, week_start, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT(guild_id, event_type, week_start) DO UPDATE SET count = count + excluded.count
+"""
+UPSERT_MONTHLY = """
+    INSERT INTO statistics_monthly (guild_id, event_type, month, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT(guild_id, event_type, month) DO UPDATE SET count = count + excluded.count
+"""
+UPSERT_USER_WEEKLY = """
+    INSERT INTO user_statistics_weekly (guild_id, event_type, week_start, user_id, count) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id, event_type, week_start, user_id) DO UPDATE SET count = count + excluded.count
+"""
+UPSERT_USER_MONTHLY = """
+    INSERT INTO user_statistics_monthly (guild_id, event_type, month, user_id, count) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id, event_type, month, user_id) DO UPDATE SET count = count + excluded.count
+"""
+
+
+def _bump(counter: dict, key: tuple, count: int):
+    counter[key] = counter.get(key, 0) + count
+
+
+class StatsBuffer:
+    """統計カウンタをメモリ上で集約し、まとめてDBに書き込む (write-behind)"""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING_KEYS):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._server: Dict[ServerKey, int] = {}
+        self._user: Dict[UserKey, int] = {}
+        self._hourly: Dict[HourKey, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._pending_flush: Optional[asyncio.Task] = None
+        self._listeners: List[FlushListener] = []
+
+        # メトリクス
+        self.flush_count = 0
+        self.rows_written = 0
+        self.events_buffered = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+
+    # ==================== 記録 ====================
+
+    def add(self, guild_id: int, event_type: str, count: int = 1, user_id: Optional[int] = None, day: Optional[str] = None):
+        """
+        カウンタを加算する（DBアクセスなし）。day を省略すると今日 (UTC) の分で、
+        時間別（曜日・時間帯の集計用）にも今の1時間の分として数える
+        """
+        today = day or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+        if day is None:
+            _bump(self._hourly, (guild_id, event_type, int(time.time()) // 3600), count)
+
+        _bump(self._server, (guild_id, event_type, today), count)
+
+        if user_id:
+            _bump(self._user, (guild_id, user_id, event_type, today), count)
+
+        self.events_buffered += 1
+
+        # サイズ閾値を超えたらバックグラウンドでフラッシュ
+        if self.pending_keys >= self.max_pending and not self._flush_in_progress():
+            self._pending_flush = asyncio.get_running_loop().create_task(self.flush())
+
+    @property
+    def pending_keys(self) -> int:
+        return len(self._server) + len(self._user) + len(self._hourly)
+
+    def _flush_in_progress(self) -> bool:
+        return self._pending_flush is not None and not self._pending_flush.done()
+
+    # ==================== 書き込み ====================
+
+    async def flush(self):
+        """溜まったカウンタを1トランザクションで書き込む"""
+        async with self._flush_lock:
+            if not self._server and not self._user and not self._hourly:
+                return
+
+            # 書き込み中に届いた加算は新しい辞書に入るように差し替える
+            server, self._server = self._server, {}
+            user, self._user = self._user, {}
+            hourly, self._hourly = self._hourly, {}
+
+            started = time.perf_counter()
+            try:
+                rows = await self._write(server, user, hourly)
+            except Exception as e:
+                # 失敗した分は次回に持ち越す
+                for key, count in server.items():
+                    _bump(self._server, key, count)
+                for key, count in user.items():
+                    _bump(self._user, key, count)
+                for key, count in hourly.items():
+                    _bump(self._hourly, key, count)
+                self.flush_errors += 1
+                print(f"統計フラッシュエラー: {e}")
+                return
+
+            self.flush_count += 1
+            self.rows_written += rows
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            self._notify(server, user)
+
+    @asynccontextmanager
+    async def hold_flushes(self):
+        """ブロック内の間、フラッシュを待たせる（DBから読み直す間に届く通知と二重に数えないように）"""
+        async with self._flush_lock:
+            yield
+
+    # ==================== フラッシュ通知 ====================
+
+    def add_flush_listener(self, listener: FlushListener):
+        """書き込みが確定した分を受け取るコールバックを登録（キャッシュの無効化など）"""
+        self._listeners.append(listener)
+
+    def remove_flush_listener(self, listener: FlushListener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, server: Dict[ServerKey, int], user: Dict[UserKey, int]):
+        for listener in list(self._listeners):
+            try:
+                listener(server, user)
+            except Exception as e:
+                print(f"統計フラッシュ通知エラー: {e}")
+
+    async def _write(
+        self,
+        server: Dict[ServerKey, int],
+        user: Dict[UserKey, int],
+        hourly: Optional[Dict[HourKey, int]] = None
+    ) -> int:
+        """日次・時間別テーブルと週次・月次ロールアップを同じトランザクションで更新し、書き込んだ行数を返す"""
+        server_rows = [(g, e, d, c) for (g, e, d), c in server.items()]
+        user_rows = [(g, u, e, d, c) for (g, u, e, d), c in user.items()]
+
+        # ロールアップ用にまとめ直す
+        server_weekly: Dict[tuple, int] = {}
+        server_monthly: Dict[tuple, int] = {}
+        for (guild_id, event_type, day), count in server.items():
+            parsed = parse_date(day)
+            _bump(server_weekly, (guild_id, event_type, week_key(parsed)), count)
+            _bump(server_monthly, (guild_id, event_type, month_key(parsed)), count)
+
+        user_weekly: Dict[tuple, int] = {}
+        user_monthly: Dict[tuple, int] = {}
+        for (guild_id, user_id, event_type, day), count in user.items():
+            parsed = parse_date(day)
+            _bump(user_weekly, (guild_id, event_type, week_key(parsed), user_id), count)
+            _bump(user_monthly, (guild_id, event_type, month_key(parsed), user_id), count)
+
+        writes = [
+            (UPSERT_DAILY, server_rows),
+            (UPSERT_USER_DAILY, user_rows),
+            (UPSERT_WEEKLY, [(*k, c) for k, c in server_weekly.items()]),
+            (UPSERT_MONTHLY, [(*k, c) for k, c in server_monthly.items()]),
+            (UPSERT_USER_WEEKLY, [(*k, c) for k, c in user_weekly.items()]),
+            (UPSERT_USER_MONTHLY, [(*k, c) for k, c in user_monthly.items()]),
+            (UPSERT_HOURLY, [(*k, c) for k, c in (hourly or {}).items()]),
+        ]
+
+        rows = 0
+        async with db.transaction() as tx:
+            for query, parameters in writes:
+                if parameters:
+                    await tx.executemany(query, parameters)
+                    rows += len(parameters)
+        return rows
+
+    # ==================== ライフサイクル ====================
+
+    def start(self):
+        """定期フラッシュを開始"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self):
+        """定期フラッシュを止めて、残りを書き込む"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_metrics(self) -> dict:
+        return {
+            "flush_count": self.flush_count,
+            "rows_written": self.rows_written,
+            "events_buffered": self.events_buffered,
+            "flush_errors": self.flush_errors,
+            "pending_keys": self.pending_keys,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+
+stats_buffer = StatsBuffer()
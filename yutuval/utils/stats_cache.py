@@ -0,0 +1,105 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+# 結果を使い回す時間（秒）。統計はフラッシュで無効化されるので、長めでも古い値は出ない
+DEFAULT_TTL = 30.0
+
+# サーバーごとに保持する件数の上限（超えたら古いものから捨てる）
+MAX_ENTRIES_PER_GUILD = 200
+
+# (guild_id, 種類, 期間, カテゴリ)
+CacheKey = Tuple[int, str, Hashable, Hashable]
+
+
+class StatsCache:
+    """
+    統計クエリの結果キャッシュ。キーは (サーバー, 種類, 期間, カテゴリ)。
+    - TTL 以内の同じ問い合わせはDBを読まずに返す
+    - 実行中の同じ問い合わせがあれば、その結果を待って共有する（同時に開いても1回しか実行しない）
+    - stats_buffer がそのサーバーの分を書き込んだら、そのサーバーの結果を捨てる
+      （書き込み前に始まった実行にも、書き込み後の呼び出しは相乗りしない）
+    例外は保存しない（次の呼び出しで再実行する）
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries_per_guild: int = MAX_ENTRIES_PER_GUILD):
+        self.ttl = ttl
+        self.max_entries_per_guild = max_entries_per_guild
+        # guild_id -> {key: (期限, 結果)}
+        self._entries: Dict[int, Dict[CacheKey, Tuple[float, Any]]] = {}
+        # (キー, 世代) -> 実行中のタスク。無効化の前に始まった実行は別の世代になる
+        self._inflight: Dict[Tuple[CacheKey, int], asyncio.Task] = {}
+        # 無効化のたびに進める。実行中に無効化された結果は保存しない
+        self._generations: Dict[int, int] = {}
+
+        # メトリクス
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.invalidations = 0
+
+    async def get(self, key: CacheKey, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """キャッシュから返すか、compute() を実行して保存する"""
+        guild_id = key[0]
+        entries = self._entries.get(guild_id)
+        entry = entries.get(key) if entries else None
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            # 期限切れはその場で捨てる
+            del entries[key]
+
+        inflight_key = (key, self._generations.get(guild_id, 0))
+        task = self._inflight.get(inflight_key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.misses += 1
+            task = asyncio.get_running_loop().create_task(self._compute(inflight_key, compute))
+            self._inflight[inflight_key] = task
+        # 待っている側がキャンセルされても、同じ結果を待つ他の呼び出しは続ける
+        return await asyncio.shield(task)
+
+    async def _compute(self, inflight_key: Tuple[CacheKey, int], compute: Callable[[], Awaitable[Any]]) -> Any:
+        key, generation = inflight_key
+        guild_id = key[0]
+        try:
+            result = await compute()
+        finally:
+            self._inflight.pop(inflight_key, None)
+
+        if self._generations.get(guild_id, 0) == generation:
+            entries = self._entries.setdefault(guild_id, {})
+            entries.pop(key, None)
+            entries[key] = (time.monotonic() + self.ttl, result)
+            while len(entries) > self.max_entries_per_guild:
+                del entries[next(iter(entries))]
+        return result
+
+    def invalidate(self, guild_id: int):
+        """サーバーの結果をすべて捨てる"""
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+        if self._entries.pop(guild_id, None):
+            self.invalidations += 1
+
+    def on_flush(self, server: dict, user: dict):
+        """stats_buffer のフラッシュ通知（書き込まれたサーバーの結果を捨てる）"""
+        for guild_id in {key[0] for key in server} | {key[0] for key in user}:
+            self.invalidate(guild_id)
+
+    def clear(self):
+        for guild_id in list(self._entries):
+            self.invalidate(guild_id)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.shared
+        return {
+            "entries": sum(len(entries) for entries in self._entries.values()),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.shared) / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,77 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional, Sequence, Tuple
+
+from utils.db_manager import db
+from utils.rollups import build_windowed_query
+
+DateRange = Tuple[date, date]
+
+
+def today_utc() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def period(days: int, today: Optional[date] = None) -> DateRange:
+    """過去 days 日間（/stats の days 引数と同じく、days 日前から今日まで）"""
+    today = today or today_utc()
+    return today - timedelta(days=days), today
+
+
+def previous_period(days: int, today: Optional[date] = None) -> DateRange:
+    """period(days) の直前の同じ長さの期間（前週比などの比較用）"""
+    start, _ = period(days, today)
+    return start - timedelta(days=days + 1), start - timedelta(days=1)
+
+
+class WindowedStats:
+    """
+    1回の集計で求めた、期間ごと・イベント種別ごとの合計。
+    /stats の各サブコマンドとダッシュボードはこれを受け取って表示する
+    """
+
+    __slots__ = ("ranges", "_totals")
+
+    def __init__(self, ranges: Dict[str, DateRange], totals: Dict[str, Dict[str, int]]):
+        self.ranges = ranges
+        self._totals = totals
+
+    def totals(self, window: str) -> Dict[str, int]:
+        """期間のイベント種別ごとの合計（記録の無い種別は含まない）"""
+        return self._totals.get(window, {})
+
+    def get(self, window: str, event_type: str) -> int:
+        return self._totals.get(window, {}).get(event_type, 0)
+
+    def delta(self, event_type: str, current: str, previous: str) -> Tuple[int, Optional[float]]:
+        """前の期間からの増減数と増減率（%）。前の期間が0なら増減率は None"""
+        now, before = self.get(current, event_type), self.get(previous, event_type)
+        return now - before, ((now - before) / before * 100 if before else None)
+
+
+async def fetch_windows(
+    guild_id: int,
+    ranges: Dict[str, DateRange],
+    event_types: Optional[Sequence[str]] = None
+) -> WindowedStats:
+    """
+    複数の期間の合計を statistics（と週次・月次ロールアップ）の1回の走査で求める。
+    event_types を渡すとその種別だけを読む
+    """
+    names = list(ranges)
+    where, parameters = "guild_id = ?", [guild_id]
+    if event_types:
+        where += f" AND event_type IN ({', '.join('?' for _ in event_types)})"
+        parameters += list(event_types)
+
+    query, params = build_windowed_query(
+        [ranges[name] for name in names], "statistics", "event_type", where, parameters
+    )
+    rows = await db.fetchall(query, tuple(params), read_only=True)
+
+    totals: Dict[str, Dict[str, int]] = {name: {} for name in names}
+    for event_type, *sums in rows:
+        for name, total in zip(names, sums):
+            if total:
+                totals[name][event_type] = total
+    return WindowedStats(ranges, totals)
+
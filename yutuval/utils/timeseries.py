@@ -0,0 +1,166 @@
+from array import array
+from datetime import date, datetime, timedelta, tzinfo
+from itertools import accumulate
+from operator import mul
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.db_manager import db
+
+# 集計単位
+DAY = "day"
+WEEK = "week"
+MONTH = "month"
+
+# この日数を超える期間は週単位、さらに長い期間は月単位にまとめて表示する
+DAILY_MAX_DAYS = 15
+WEEKLY_MAX_DAYS = 180
+
+
+def _bucket_start(day: date, bucket: str) -> date:
+    if bucket == WEEK:
+        # 週は月曜始まり（週次ロールアップと同じ）
+        return day - timedelta(days=day.weekday())
+    if bucket == MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def bucket_for(days: int) -> str:
+    """期間の長さに合った集計単位"""
+    if days <= DAILY_MAX_DAYS:
+        return DAY
+    if days <= WEEKLY_MAX_DAYS:
+        return WEEK
+    return MONTH
+
+
+class TimeSeries:
+    """
+    区間ごとの値を隙間なく並べた時系列（記録の無い日は0）。
+    値は array('q') に持ち、合計・移動平均・傾きは組み込みの集約関数でまとめて計算する
+    """
+
+    __slots__ = ("bucket", "starts", "values")
+
+    def __init__(self, bucket: str, starts: List[date], values: array):
+        self.bucket = bucket
+        # 各区間の開始日（週・月の区間は期間の端で切れていることがある）
+        self.starts = starts
+        self.values = values
+
+    @classmethod
+    def daily(cls, start: date, end: date, rows: Iterable[Tuple[str, int]]) -> "TimeSeries":
+        """(日付, 件数) の行から [start, end] の日別の時系列を作る（無い日は0）"""
+        length = max((end - start).days + 1, 0)
+        values = array("q", bytes(8 * length))
+        for day, count in rows:
+            index = (date.fromisoformat(day) - start).days
+            if 0 <= index < length:
+                values[index] += count
+        return cls(DAY, [start + timedelta(days=i) for i in range(length)], values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def total(self) -> int:
+        return sum(self.values)
+
+    def points(self) -> List[Tuple[date, int]]:
+        return list(zip(self.starts, self.values))
+
+    # ==================== 変換 ====================
+
+    def downsample(self, bucket: str) -> "TimeSeries":
+        """日別の時系列を週・月単位の合計にまとめる"""
+        if bucket == self.bucket or not self.starts:
+            return self
+        starts: List[date] = []
+        values = array("q")
+        for day, value in zip(self.starts, self.values):
+            key = _bucket_start(day, bucket)
+            if not starts or _bucket_start(starts[-1], bucket) != key:
+                # 最初の区間は期間の開始日から数える
+                starts.append(max(key, self.starts[0]))
+                values.append(0)
+            values[-1] += value
+        return TimeSeries(bucket, starts, values)
+
+    def moving_average(self, window: int) -> array:
+        """直近 window 区間の移動平均（先頭の区間はあるだけで平均する）"""
+        prefix = array("q", accumulate(self.values, initial=0))
+        return array("d", (
+            (prefix[i + 1] - prefix[max(i + 1 - window, 0)]) / min(window, i + 1)
+            for i in range(len(self.values))
+        ))
+
+    def slope(self) -> float:
+        """最小二乗法による1区間あたりの増減（傾向）"""
+        n = len(self.values)
+        if n < 2:
+            return 0.0
+        sum_x = n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        sum_y = sum(self.values)
+        sum_xy = sum(map(mul, range(n), self.values))
+        return (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x * sum_x)
+
+
+async def fetch_series(
+    guild_id: int,
+    start: date,
+    end: date,
+    event_types: Sequence[str],
+    bucket: Optional[str] = None
+) -> Dict[str, TimeSeries]:
+    """
+    複数のイベント種別の [start, end] の時系列を1回の問い合わせで取得する。
+    bucket を省略すると期間の長さに合わせて日・週・月単位にまとめる
+    """
+    rows = await db.fetchall(
+        f"""
+        SELECT event_type, date, count
+        FROM statistics
+        WHERE guild_id = ? AND event_type IN ({', '.join('?' for _ in event_types)})
+          AND date >= ? AND date <= ?
+        """,
+        (guild_id, *event_types, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")),
+        read_only=True
+    )
+    by_type: Dict[str, List[Tuple[str, int]]] = {event_type: [] for event_type in event_types}
+    for event_type, day, count in rows:
+        by_type[event_type].append((day, count))
+
+    bucket = bucket or bucket_for((end - start).days + 1)
+    return {
+        event_type: TimeSeries.daily(start, end, daily).downsample(bucket)
+        for event_type, daily in by_type.items()
+    }
+
+
+# ==================== 曜日×時間帯 ====================
+
+async def fetch_heatmap(
+    guild_id: int,
+    event_type: str,
+    start_hour: int,
+    end_hour: int,
+    tz: tzinfo
+) -> List[array]:
+    """
+    時間別の統計 (statistics_hourly) の [start_hour, end_hour) を、サーバーのタイムゾーンで
+    曜日 (月=0) × 時刻 (0-23) の 7×24 に振り分ける。hour は UNIX 時間を3600で割った整数。
+    1時間ごとに変換するので、夏時間の切り替えがあっても正しい時刻に入る
+    """
+    rows = await db.fetchall(
+        """
+        SELECT hour, count FROM statistics_hourly
+        WHERE guild_id = ? AND event_type = ? AND hour >= ? AND hour < ?
+        """,
+        (guild_id, event_type, start_hour, end_hour),
+        read_only=True
+    )
+    grid = [array("q", bytes(8 * 24)) for _ in range(7)]
+    for hour, count in rows:
+        local = datetime.fromtimestamp(hour * 3600, tz)
+        grid[local.weekday()][local.hour] += count
+    return grid
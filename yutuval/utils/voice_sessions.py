@@ -0,0 +1,180 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+
+from utils.stats_buffer import stats_buffer
+
+# 開いているセッションの経過分を統計に書き出す間隔（秒）。落ちても失うのはこの間隔分まで
+CHECKPOINT_INTERVAL = 60.0
+
+# 日別のVC滞在時間（分）を記録するイベント名
+EVENT_TYPE = "vc_minutes"
+
+SessionKey = Tuple[int, int]    # (guild_id, user_id)
+
+
+class _Session:
+    """VCにいる1人分のセッション"""
+
+    __slots__ = ("channel_id", "started_at", "credited_at")
+
+    def __init__(self, channel_id: int, started_at: float):
+        self.channel_id = channel_id
+        self.started_at = started_at
+        # ここまでの時間は統計に記録済み
+        self.credited_at = started_at
+
+
+def _day_of(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _next_midnight(timestamp: float) -> float:
+    return (int(timestamp) // 86400 + 1) * 86400
+
+
+class VoiceSessionTracker:
+    """
+    VCの滞在時間を数える。(サーバー, ユーザー) ごとに開いているセッションをメモリに持ち、
+    退出・移動・切断で閉じる。開いているセッションも CHECKPOINT_INTERVAL ごとに
+    経過した分だけ stats_buffer に vc_minutes として書き出す（日をまたぐ分は日ごとに分ける）。
+    起動時・再接続時は現在のVCの状態から作り直す。AFKチャンネルとBotは数えない。
+    """
+
+    def __init__(self, checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        self.checkpoint_interval = checkpoint_interval
+        self._open: Dict[SessionKey, _Session] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        # メトリクス
+        self.sessions_opened = 0
+        self.sessions_closed = 0
+        self.minutes_credited = 0
+
+    @staticmethod
+    def _counts(guild: discord.Guild, channel: Optional[discord.abc.GuildChannel]) -> bool:
+        """滞在時間を数えるチャンネルか（AFKチャンネルは除く）"""
+        if channel is None:
+            return False
+        afk = guild.afk_channel
+        return afk is None or channel.id != afk.id
+
+    # ==================== セッション ====================
+
+    def _open_session(self, key: SessionKey, channel_id: int, now: float):
+        self._open[key] = _Session(channel_id, now)
+        self.sessions_opened += 1
+
+    def _close_session(self, key: SessionKey, now: float):
+        session = self._open.pop(key, None)
+        if session is not None:
+            self._credit(key, session, now, final=True)
+            self.sessions_closed += 1
+
+    def _credit(self, key: SessionKey, session: _Session, now: float, final: bool = False):
+        """
+        前回記録した時点から now までを分単位で記録する。
+        途中は端数を次回に持ち越し、閉じるときだけ端数を四捨五入する
+        """
+        elapsed = now - session.credited_at
+        # round() は偶数丸めなので、四捨五入は 0.5 を足して切り捨てる
+        minutes = int(elapsed / 60 + 0.5) if final else int(elapsed // 60)
+        if minutes <= 0:
+            return
+
+        guild_id, user_id = key
+        cursor = session.credited_at
+        remaining = minutes
+        # 各1分はその分が始まった日に数える
+        while remaining > 0:
+            in_day = min(remaining, -(-(_next_midnight(cursor) - cursor) // 60))
+            stats_buffer.add(guild_id, EVENT_TYPE, int(in_day), user_id=user_id, day=_day_of(cursor))
+            cursor += in_day * 60
+            remaining -= in_day
+
+        session.credited_at = now if final else session.credited_at + minutes * 60
+        self.minutes_credited += minutes
+
+    def update(
+        self,
+        member: discord.Member,
+        before: Optional[discord.abc.GuildChannel],
+        after: Optional[discord.abc.GuildChannel],
+        now: Optional[float] = None
+    ):
+        """VCの出入り・移動のたびに呼ぶ（before / after は前後のチャンネル）"""
+        if member.bot or before == after:
+            return
+        now = time.time() if now is None else now
+        key = (member.guild.id, member.id)
+
+        # 退出・移動は今のセッションを閉じ、数えるチャンネルに入ったら新しく開く
+        self._close_session(key, now)
+        if self._counts(member.guild, after):
+            self._open_session(key, after.id, now)
+
+    def rebuild(self, guilds: Iterable[discord.Guild], now: Optional[float] = None):
+        """現在のVCの状態に合わせる（見逃した出入りを補正する）"""
+        now = time.time() if now is None else now
+        present: Dict[SessionKey, int] = {}
+        for guild in guilds:
+            for channel in [*guild.voice_channels, *guild.stage_channels]:
+                if not self._counts(guild, channel):
+                    continue
+                for member in channel.members:
+                    if not member.bot:
+                        present[(guild.id, member.id)] = channel.id
+
+        for key in [key for key, session in self._open.items() if present.get(key) != session.channel_id]:
+            self._close_session(key, now)
+        for key, channel_id in present.items():
+            if key not in self._open:
+                self._open_session(key, channel_id, now)
+
+    def checkpoint(self, now: Optional[float] = None):
+        """開いているセッションの経過分を記録する"""
+        now = time.time() if now is None else now
+        for key, session in self._open.items():
+            self._credit(key, session, now)
+
+    def open_sessions(self, guild_id: int) -> int:
+        return sum(1 for g, _ in self._open if g == guild_id)
+
+    # ==================== ライフサイクル ====================
+
+    def start(self, guilds: Iterable[discord.Guild]):
+        """現在のVCの状態から作り直し、定期チェックポイントを開始"""
+        self.rebuild(guilds)
+        print(f"🔊 VCセッションを復元しました: {len(self._open)}件")
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            self.checkpoint()
+
+    async def stop(self):
+        """定期チェックポイントを止めて、開いているセッションの経過分を記録する"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.checkpoint()
+
+    def get_metrics(self) -> dict:
+        return {
+            "open_sessions": len(self._open),
+            "sessions_opened": self.sessions_opened,
+            "sessions_closed": self.sessions_closed,
+            "minutes_credited": self.minutes_credited,
+        }
+
+
+voice_sessions = VoiceSessionTracker()
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import aiohttp
+import discord
+
+WEBHOOK_NAME = "Bot Log"
+
+# Webhook 1つあたりの送信上限（Discord の既定: 2秒に5回）
+BUCKET_LIMIT = 5
+BUCKET_PERIOD = 2.0
+
+# 429 を受けたときに送り直す回数
+MAX_RETRIES = 3
+
+
+class _RateBucket:
+    """Webhook ごとの送信枠。上限に達したら空くまで待ち、429 を受けたら retry-after まで止める"""
+
+    __slots__ = ("limit", "period", "sent", "blocked_until")
+
+    def __init__(self, limit: int = BUCKET_LIMIT, period: float = BUCKET_PERIOD):
+        self.limit = limit
+        self.period = period
+        self.sent: Deque[float] = deque()
+        self.blocked_until = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if self.blocked_until > now:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            while self.sent and now - self.sent[0] >= self.period:
+                self.sent.popleft()
+            if len(self.sent) < self.limit:
+                self.sent.append(now)
+                return
+            await asyncio.sleep(self.period - (now - self.sent[0]))
+
+    def block(self, retry_after: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+def _retry_after(error: discord.HTTPException) -> float:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 1.0))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class WebhookSink:
+    """
+    ログをチャンネルごとの Webhook で送る（LOG_USE_WEBHOOK=true のときだけ有効）。
+    Webhook は専用の HTTP セッションで送るので、Bot 本体のレート制限を消費せず、
+    ログが詰まってもコマンドやパネルの応答は遅れない。作れないチャンネルは Bot の送信に戻す。
+    """
+
+    def __init__(self, enabled: Optional[bool] = None):
+        # None なら configure() で LOG_USE_WEBHOOK に従う
+        self._enabled_override = enabled
+        self.enabled = bool(enabled)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._webhooks: Dict[int, discord.Webhook] = {}
+        self._buckets: Dict[int, _RateBucket] = {}
+        # Webhook を作れなかったチャンネル（権限不足など）は Bot で送る
+        self._unavailable: set = set()
+
+        # メトリクス
+        self.webhook_sends = 0
+        self.bot_sends = 0
+        self.rate_limited = 0
+        self.webhook_errors = 0
+
+    def configure(self):
+        """環境変数から設定を読む（LogDispatcher.start() から呼ぶ）"""
+        if self._enabled_override is None:
+            self.enabled = os.getenv("LOG_USE_WEBHOOK", "false").lower() in ("1", "true", "yes")
+        else:
+            self.enabled = self._enabled_override
+
+    async def _get_webhook(self, channel: discord.TextChannel) -> Optional[discord.Webhook]:
+        webhook = self._webhooks.get(channel.id)
+        if webhook is not None or channel.id in self._unavailable:
+            return webhook
+
+        try:
+            existing = await channel.webhooks()
+            found = next(
+                (w for w in existing if w.name == WEBHOOK_NAME and w.token and w.user and w.user.id == channel.guild.me.id),
+                None
+            )
+            if found is None:
+                found = await channel.create_webhook(name=WEBHOOK_NAME, reason="ログ送信用")
+        except (discord.Forbidden, discord.HTTPException) as e:
+            print(f"⚠️ ログ用Webhookを作成できません (channel={channel.id}): {e}。Botで送信します")
+            self._unavailable.add(channel.id)
+            return None
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        webhook = discord.Webhook.from_url(found.url, session=self._session)
+        self._webhooks[channel.id] = webhook
+        self._buckets[channel.id] = _RateBucket()
+        return webhook
+
+    async def send(self, channel: discord.TextChannel, embeds: List[discord.Embed]):
+        """Webhook（使えなければ Bot）で送信する"""
+        webhook = await self._get_webhook(channel) if self.enabled else None
+        if webhook is None:
+            await channel.send(embeds=embeds)
+            self.bot_sends += 1
+            return
+
+        bucket = self._buckets[channel.id]
+        me = channel.guild.me
+        for attempt in range(MAX_RETRIES + 1):
+            await bucket.acquire()
+            try:
+                await webhook.send(
+                    embeds=embeds,
+                    username=me.display_name,
+                    avatar_url=me.display_avatar.url
+                )
+                self.webhook_sends += 1
+                return
+            except discord.NotFound:
+                # Webhook が消された: 次回作り直し、今回は Bot で送る
+                self._webhooks.pop(channel.id, None)
+                break
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == MAX_RETRIES:
+                    self.webhook_errors += 1
+                    raise
+                self.rate_limited += 1
+                bucket.block(_retry_after(e))
+
+        await channel.send(embeds=embeds)
+        self.bot_sends += 1
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def get_metrics(self) -> dict:
+        return {
+            "webhook_enabled": self.enabled,
+            "webhooks": len(self._webhooks),
+            "webhook_sends": self.webhook_sends,
+            "bot_sends": self.bot_sends,
+            "rate_limited": self.rate_limited,
+            "webhook_errors": self.webhook_errors,
+        }